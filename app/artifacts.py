@@ -0,0 +1,178 @@
+import os, shutil, stat, sys, tempfile, threading
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from state import content_hash
+from utils import ensure_dir, ARTIFACTS_DIR
+
+ARTIFACT_STORE_DIR = Path(os.getenv("ARTIFACT_STORE_DIR", str(ARTIFACTS_DIR / "store"))).resolve()
+
+
+class ArtifactStore:
+    """
+    Extracted markdown and summaries, each written once under
+    `blobs/<sha[:2]>/<sha>.md`, where sha is the state index's content_hash
+    of the text. A run's own sources/ folder under ARTIFACTS_DIR hardlinks
+    to the blobs (link()); files in the working tree (sources/<date>/,
+    docs/summaries/) are independent copies, reflinked where the filesystem
+    can (export()), so editing one never reaches the store.
+
+    Blobs are read-only, and put() checks a blob's bytes before reusing it,
+    so a blob changed through a hardlink anyway is rewritten, not served
+    under its old hash.
+    """
+
+    def __init__(self, root: Path = ARTIFACT_STORE_DIR):
+        self.root = Path(root)
+        ensure_dir(self.root / "blobs")
+        ensure_dir(self.root / "tmp")
+        self._lock = threading.Lock()
+        self._stats = {"blobs_written": 0, "blobs_reused": 0, "blobs_repaired": 0, "bytes_written": 0,
+                       "links": 0, "copies": 0, "reflinks": 0, "exports_unchanged": 0}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, **deltas: int):
+        with self._lock:
+            for k, v in deltas.items():
+                self._stats[k] += v
+
+    def path(self, sha: str) -> Path:
+        return self.root / "blobs" / sha[:2] / f"{sha}.md"
+
+    def put(self, text: str) -> str:
+        """Store `text` unless it is already there; returns its hash."""
+        sha = content_hash(text)
+        dest = self.path(sha)
+        data = text.encode("utf-8")
+        if _same_bytes(dest, data):
+            self._count(blobs_reused=1)
+            return sha
+        if dest.exists():
+            # edited through a link; the blob must hold what its hash says
+            self._count(blobs_repaired=1)
+        fd, tmp = tempfile.mkstemp(dir=self.root / "tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            ensure_dir(dest.parent)
+            os.replace(tmp, dest)
+        finally:
+            Path(tmp).unlink(missing_ok=True)
+        self._count(blobs_written=1, bytes_written=len(data))
+        return sha
+
+    def read(self, sha: str) -> str:
+        return self.path(sha).read_text(encoding="utf-8")
+
+    def link(self, sha: str, dest: Path) -> Path:
+        """Make `dest` show blob `sha`, replacing whatever file was there."""
+        src = self.path(sha)
+        dest = Path(dest)
+        try:
+            if os.path.samefile(src, dest):
+                return dest
+        except OSError:
+            pass
+        ensure_dir(dest.parent)
+        tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            os.link(src, tmp)
+            self._count(links=1)
+        except OSError:
+            # another filesystem, or one without hardlinks
+            shutil.copyfile(src, tmp)
+            self._count(copies=1)
+        os.replace(tmp, dest)
+        return dest
+
+
+    def export(self, sha: str, dest: Path) -> Path:
+        """
+        Write blob `sha` to `dest` as a file of its own (writable, not linked
+        to the store); left alone when it already holds that content.
+        """
+        src = self.path(sha)
+        dest = Path(dest)
+        if _same_bytes(dest, src.read_bytes()):
+            self._count(exports_unchanged=1)
+            return dest
+        ensure_dir(dest.parent)
+        tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            if _reflink(src, tmp):
+                self._count(reflinks=1)
+            else:
+                shutil.copyfile(src, tmp)
+                self._count(copies=1)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, dest)
+        finally:
+            tmp.unlink(missing_ok=True)
+        return dest
+
+
+# ioctl that makes a file share another's extents (copy-on-write), on btrfs, XFS and the like
+_FICLONE = 0x40049409
+
+
+def _reflink(src: Path, dest: Path) -> bool:
+    """Create `dest` as a copy-on-write clone of `src`; False where the OS or filesystem cannot."""
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+    with open(src, "rb") as s, open(dest, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+        except OSError:
+            return False
+    return True
+
+
+def _same_bytes(path: Path, data: bytes) -> bool:
+    try:
+        if path.stat().st_size != len(data):
+            return False
+        return path.read_bytes() == data
+    except OSError:
+        return False
+
+
+class FileManifest(Mapping):
+    """path -> text for a set of stored blobs, read from the store only when a file is accessed."""
+
+    def __init__(self, store: ArtifactStore, entries: Optional[Dict[str, str]] = None):
+        self._store = store
+        self.entries: Dict[str, str] = dict(entries or {})  # path -> sha
+
+    def __getitem__(self, path: str) -> str:
+        return self._store.read(self.entries[path])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+_store: Optional[ArtifactStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ArtifactStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArtifactStore()
+        return _store
+
+
+def item_text(item: Dict) -> str:
+    """An extracted item's markdown: loaded from the store (checkpoints written before the store carry it inline)."""
+    if "markdown" in item:
+        return item["markdown"]
+    return get_store().read(item["content_hash"])
@@ -0,0 +1,63 @@
+import os, re, json, gzip, time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from utils import ensure_dir, ARTIFACTS_DIR
+
+_RUN_ID_RE = re.compile(r"^[a-z0-9]+$")
+
+
+class RunCheckpoints:
+    """
+    Stage outputs of one run, written to `<run_dir>/stages/<stage>.json.gz`
+    as soon as the stage finishes, plus the run's own parameters in
+    `<run_dir>/run.json`. A resumed run loads every stage that has a
+    checkpoint and starts at the first one that does not.
+    """
+
+    def __init__(self, run_dir: Path):
+        self.run_dir = Path(run_dir)
+        self.dir = self.run_dir / "stages"
+
+    def _path(self, stage: str) -> Path:
+        return self.dir / f"{stage}.json.gz"
+
+    def has(self, stage: str) -> bool:
+        return self._path(stage).exists()
+
+    def load(self, stage: str) -> Optional[Any]:
+        try:
+            with gzip.open(self._path(stage), "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, EOFError, ValueError):
+            # missing or torn checkpoint (a truncated gzip stream raises EOFError): redo the stage
+            return None
+
+    def save(self, stage: str, data: Any):
+        ensure_dir(self.dir)
+        tmp = self._path(stage).with_suffix(f".tmp{os.getpid()}")
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"), default=str)
+        os.replace(tmp, self._path(stage))
+
+    def completed(self) -> List[str]:
+        return sorted(p.name[:-len(".json.gz")] for p in self.dir.glob("*.json.gz")) if self.dir.is_dir() else []
+
+    # ---------- run parameters ----------
+
+    def save_params(self, params: Dict[str, Any]):
+        ensure_dir(self.run_dir)
+        (self.run_dir / "run.json").write_text(
+            json.dumps({**params, "created_at": time.time()}, indent=2), encoding="utf-8"
+        )
+
+    def load_params(self) -> Dict[str, Any]:
+        return json.loads((self.run_dir / "run.json").read_text(encoding="utf-8"))
+
+
+def find_run(run_id: str) -> Optional[RunCheckpoints]:
+    """Checkpoints of an earlier run, or None if there is no such run."""
+    if not _RUN_ID_RE.match(run_id or ""):
+        return None
+    ckpt = RunCheckpoints(ARTIFACTS_DIR / run_id)
+    return ckpt if (ckpt.run_dir / "run.json").exists() else None
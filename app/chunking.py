@@ -0,0 +1,114 @@
+import re
+from typing import Dict, List, Sequence
+
+from matcher import section_bounds
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), matching the scheduler's estimate."""
+    return len(text) // 4 + 1
+
+
+def split_sections(md: str) -> List[Dict]:
+    """Split markdown on headings and `## [Page N]` markers into {title, text} sections."""
+    bounds = section_bounds(md)
+    out = []
+    for i, (start, title) in enumerate(bounds):
+        end = bounds[i + 1][0] if i + 1 < len(bounds) else len(md)
+        text = md[start:end].strip()
+        if text:
+            out.append({"title": title, "text": text})
+    return out
+
+
+def split_text(text: str, max_tokens: int) -> List[str]:
+    """Split on paragraph breaks (then hard character cuts) into pieces of at most `max_tokens`."""
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    max_chars = max(1, max_tokens * 4)
+    pieces, buf = [], ""
+    for para in _PARAGRAPH_BREAK.split(text):
+        while len(para) > max_chars:
+            if buf:
+                pieces.append(buf)
+                buf = ""
+            pieces.append(para[:max_chars])
+            para = para[max_chars:]
+        if buf and len(buf) + 2 + len(para) > max_chars:
+            pieces.append(buf)
+            buf = ""
+        buf = f"{buf}\n\n{para}" if buf else para
+    if buf:
+        pieces.append(buf)
+    return [p for p in pieces if p.strip()]
+
+
+def chunk_markdown(md: str, max_tokens: int) -> List[Dict]:
+    """
+    Token-sized chunks that follow the document's own structure: adjacent
+    small sections are merged, oversized ones are split on paragraphs.
+    Each chunk is {title, text, tokens}; the title is the first section's.
+    """
+    chunks: List[Dict] = []
+    cur_title, cur_parts, cur_tokens = "", [], 0
+
+    def flush():
+        nonlocal cur_title, cur_parts, cur_tokens
+        if cur_parts:
+            text = "\n\n".join(cur_parts)
+            chunks.append({"title": cur_title, "text": text, "tokens": count_tokens(text)})
+        cur_title, cur_parts, cur_tokens = "", [], 0
+
+    for sec in split_sections(md):
+        for piece in split_text(sec["text"], max_tokens):
+            t = count_tokens(piece)
+            if cur_parts and cur_tokens + t > max_tokens:
+                flush()
+            if not cur_parts:
+                cur_title = sec["title"]
+            cur_parts.append(piece)
+            cur_tokens += t
+    flush()
+    return chunks
+
+
+def pack(sizes: Sequence[int], max_tokens: int, max_items: int) -> List[List[int]]:
+    """
+    Group item indices, in order, into batches whose sizes sum to at most
+    `max_tokens` (an oversized item gets a batch of its own).
+    """
+    batches: List[List[int]] = []
+    cur, cur_tokens = [], 0
+    for i, size in enumerate(sizes):
+        if cur and (cur_tokens + size > max_tokens or len(cur) >= max_items):
+            batches.append(cur)
+            cur, cur_tokens = [], 0
+        cur.append(i)
+        cur_tokens += size
+    if cur:
+        batches.append(cur)
+    return batches
+
+
+def fair_share(lengths: Sequence[int], budget: int) -> List[int]:
+    """
+    Per-item caps that fit `budget` in total: items below the fair share keep
+    their full length and the remainder is split evenly among the rest.
+    """
+    caps = list(lengths)
+    if sum(caps) <= budget:
+        return caps
+    remaining, open_items = budget, sorted(range(len(caps)), key=lambda i: caps[i])
+    while open_items:
+        share = remaining // len(open_items)
+        i = open_items[0]
+        if caps[i] > share:
+            break
+        remaining -= caps[i]
+        open_items.pop(0)
+    share = remaining // len(open_items) if open_items else 0
+    for i in open_items:
+        caps[i] = share
+    return caps
@@ -0,0 +1,70 @@
+import re, yaml
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+CONFIG_DIR = Path(__file__).parent / "config"
+
+_SPACES = re.compile(r"\s+")
+# Distinct framework spellings whose alias search is remembered
+_FRAMEWORK_CACHE = 1024
+
+
+class ControlCatalog:
+    """
+    config/controls.yaml as hash maps: framework aliases -> canonical name
+    and (framework, base control id) -> title, so validating a mapping is a
+    couple of dict lookups. Enhancements and tasks ("SA-11(1)", "PW.4.1")
+    validate against their base control and keep their own id.
+    """
+
+    def __init__(self, data: Dict):
+        self.titles: Dict[Tuple[str, str], str] = {}
+        self._aliases: Dict[str, str] = {}
+        self._patterns: List[Tuple[str, "re.Pattern"]] = []
+        for fw, spec in (data.get("frameworks") or {}).items():
+            for alias in [fw, *(spec.get("aliases") or [])]:
+                self._aliases[alias.lower()] = fw
+            self._patterns.append((fw, re.compile(spec["id_pattern"])))
+            for ctl, title in {**(spec.get("withdrawn") or {}), **(spec.get("controls") or {})}.items():
+                self.titles[(fw, str(ctl))] = title
+        # bounded: framework names come from LLM output, so the spellings seen are unbounded
+        self._search = lru_cache(maxsize=_FRAMEWORK_CACHE)(self._search_aliases)
+
+    def framework(self, name: str) -> Optional[str]:
+        """Canonical framework for names like "NIST SP 800-53 Rev. 5" or "SSDF"."""
+        key = _SPACES.sub(" ", str(name or "")).strip().lower()
+        if key in self._aliases:
+            return self._aliases[key]
+        return self._search(key)
+
+    def _search_aliases(self, key: str) -> Optional[str]:
+        for alias, fw in self._aliases.items():
+            if alias in key:
+                return fw
+        return None
+
+    def _match(self, framework: str, control: str) -> Optional[Tuple[str, str, str]]:
+        ctl = _SPACES.sub("", str(control or "")).upper()
+        fw = self.framework(framework)
+        # a wrong or missing framework name is common; the id's own shape then decides
+        for name, pattern in sorted(self._patterns, key=lambda p: p[0] != fw):
+            m = pattern.match(ctl)
+            if m and (name, m.group("base")) in self.titles:
+                return name, ctl, m.group("base")
+        return None
+
+    def resolve(self, framework: str, control: str) -> Optional[Tuple[str, str]]:
+        """(canonical framework, normalized control id) if the control exists, else None."""
+        m = self._match(framework, control)
+        return m[:2] if m else None
+
+    def title(self, framework: str, control: str) -> Optional[str]:
+        m = self._match(framework, control)
+        return self.titles[(m[0], m[2])] if m else None
+
+
+@lru_cache(maxsize=1)
+def get_catalog() -> ControlCatalog:
+    with open(CONFIG_DIR / "controls.yaml", "r", encoding="utf-8") as f:
+        return ControlCatalog(yaml.safe_load(f) or {})
@@ -1,12 +1,106 @@
-import os, re, time, requests
-from urllib.parse import urlencode
-from typing import List, Dict
+import os, re, json, math, time, hashlib, threading, requests
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from typing import List, Dict, Optional, Tuple
 from dotenv import load_dotenv
+
+import replay
+from telemetry import span
+from utils import ordered_map, ARTIFACTS_DIR
 load_dotenv()
 
 NIST_NEWS_FEED = "https://csrc.nist.gov/News"
 
-def _serpapi_search(query: str, num: int = 10) -> List[Dict]:
+# SerpAPI responses are reused from disk for this long (0 disables the cache)
+DISCOVERY_CACHE_DIR = Path(os.getenv("DISCOVERY_CACHE_DIR", str(ARTIFACTS_DIR / "cache" / "serpapi"))).resolve()
+DISCOVERY_CACHE_TTL = int(os.getenv("DISCOVERY_CACHE_TTL", "21600"))
+# Search requests in flight at once
+DISCOVERY_CONCURRENCY = int(os.getenv("DISCOVERY_CONCURRENCY", "4"))
+# Results per SerpAPI page; larger limits page through the topic query
+SERP_PAGE_SIZE = 10
+# SP numbers searched when the topic names none
+DEFAULT_SP_NUMBERS = ("800-53", "800-171", "800-218")
+
+_TRACKING_PARAMS = re.compile(r"^(utm_\w+|gclid|fbclid|msclkid|mc_cid|mc_eid|_ga|_gl)$", re.IGNORECASE)
+_SP_NUMBER = re.compile(r"\b800-\d+[A-Za-z]?\b")
+# NIST.SP.800-53r5.pdf, NIST.SP.800-218.ipd.pdf
+_SP_PDF = re.compile(r"/NIST\.SP\.800-(\d+[A-Z]?)(?:r(\d+))?(?:\.(ipd|fpd|\dpd))?\.pdf$", re.IGNORECASE)
+# csrc.nist.gov/pubs/sp/800/53/r5/upd1/final, .../800/53/a/r5/final, .../800/218/ipd
+_SP_LANDING = re.compile(r"^/pubs/sp/800/(\d+(?:/[a-z])?)/(?:r(\d+)/)?(?:upd\d+/)?(final|ipd|fpd|\dpd)/?$",
+                         re.IGNORECASE)
+
+_http = requests.Session()
+replay.install(_http)
+
+def clean_url(url: str) -> str:
+    """The URL as fetched: tracking parameters and #fragment removed."""
+    parts = urlsplit(url.strip())
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _TRACKING_PARAMS.match(k)]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def publication_key(url: str) -> Optional[str]:
+    """Same key for an SP's PDF and its csrc landing page ("sp800-53r5-final"), None for other URLs."""
+    path = urlsplit(url).path
+    m = _SP_PDF.search(path) or (_SP_LANDING.match(path) if "csrc.nist.gov" in url.lower() else None)
+    if not m:
+        return None
+    number, rev, stage = m.groups()
+    return f"sp800-{number.replace('/', '').lower()}r{rev or 0}-{(stage or 'final').lower()}"
+
+
+def dedupe_key(url: str) -> str:
+    """
+    What two search results must share to count as one source: the
+    publication key when there is one, else the URL with scheme, www.,
+    default port, trailing slash, query order and tracking parameters
+    normalized away.
+    """
+    pub = publication_key(url)
+    if pub:
+        return pub
+    parts = urlsplit(clean_url(url))
+    host = (parts.hostname or "").lower()
+    host = host[4:] if host.startswith("www.") else host
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("", host, path, urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True))), ""))
+
+
+# ---------- SerpAPI with an on-disk cache ----------
+
+def _cache_path(params: Dict) -> Path:
+    key = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+    return DISCOVERY_CACHE_DIR / key[:2] / f"{key}.json"
+
+
+def _cache_get(params: Dict) -> Optional[List[Dict]]:
+    if DISCOVERY_CACHE_TTL <= 0:
+        return None
+    path = _cache_path(params)
+    try:
+        doc = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if time.time() - doc.get("fetched_at", 0) > DISCOVERY_CACHE_TTL:
+        return None
+    return doc["results"]
+
+
+def _cache_put(params: Dict, results: List[Dict]):
+    if DISCOVERY_CACHE_TTL <= 0:
+        return
+    path = _cache_path(params)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps({"fetched_at": time.time(), "params": params, "results": results},
+                              ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _serpapi_search(query: str, num: int = SERP_PAGE_SIZE, start: int = 0,
+                    stats: Optional[Dict] = None) -> List[Dict]:
     key = os.getenv("SERPAPI_KEY")
     if not key:
         return []
@@ -16,10 +110,19 @@ def _serpapi_search(query: str, num: int = 10) -> List[Dict]:
         "engine": "google",
         "q": query,
         "num": num,
-        "api_key": key,
     }
-    r = requests.get(url, params=params, timeout=30)
-    r.raise_for_status()
+    if start:
+        params["start"] = start
+    cached = _cache_get(params)
+    if cached is not None:
+        if stats is not None:
+            stats["cache_hits"] = stats.get("cache_hits", 0) + 1
+        return cached
+
+    with span("discovery", "serpapi") as sp:
+        r = _http.get(url, params={**params, "api_key": key}, timeout=30)
+        sp.add(bytes=len(r.content))
+        r.raise_for_status()
     data = r.json()
     results = []
     for item in (data.get("organic_results") or []):
@@ -33,32 +136,93 @@ def _serpapi_search(query: str, num: int = 10) -> List[Dict]:
             "source": "google-serpapi",
             "published": item.get("date") or item.get("snippet") or "",
         })
+    _cache_put(params, results)
+    if stats is not None:
+        stats["api_calls"] = stats.get("api_calls", 0) + 1
     return results
 
-def _nist_csrc_fallback(num: int = 10) -> List[Dict]:
-    # very simple fallback using site: filter
-    q = "site:csrc.nist.gov \"SP 800\" update OR revision OR draft"
-    return _serpapi_search(q, num)
 
-def _rank_and_dedupe(items: List[Dict]) -> List[Dict]:
-    seen = set()
-    ranked = []
+def _queries(topic: str, limit: int) -> List[Tuple[str, int]]:
+    """(query, start offset) for every search, in ranking order."""
+    primary = f"{topic} site:nist.gov OR site:csrc.nist.gov"
+    pages = max(1, math.ceil(limit / SERP_PAGE_SIZE))
+    out = [(primary, p * SERP_PAGE_SIZE) for p in range(pages)]
+    out.append(("site:csrc.nist.gov \"SP 800\" update OR revision OR draft", 0))
+    numbers = list(dict.fromkeys(_SP_NUMBER.findall(topic))) or list(DEFAULT_SP_NUMBERS)
+    out.append(("site:csrc.nist.gov " + " OR ".join(f"\"SP {n}\"" for n in numbers), 0))
+    return out
+
+
+def _rank_and_dedupe(items: List[Dict], limit: int) -> List[Dict]:
+    """
+    First occurrence wins, except that a PDF replaces its landing page (the
+    PDF carries the full text); the URL that was dropped is kept as
+    `alternate_url`.
+    """
+    by_key: Dict[str, Dict] = {}
     for x in items:
-        u = x["url"].split("#")[0]
-        if u in seen:
-            continue
-        seen.add(u)
-        ranked.append(x)
-    return ranked[:10]
-
-def discover_sources(topic: str, limit: int = 10) -> List[Dict]:
-    query = f"{topic} site:nist.gov OR site:csrc.nist.gov"
-    primary = _serpapi_search(query, num=limit)
-    fallback = []
-    if not primary:
-        fallback = _nist_csrc_fallback(limit)
-    merged = _rank_and_dedupe(primary + fallback)
+        _add(by_key, {**x, "url": clean_url(x["url"])})
+    return list(by_key.values())[:limit]
+
+
+def _add(by_key: Dict[str, Dict], x: Dict) -> str:
+    k = dedupe_key(x["url"])
+    prev = by_key.get(k)
+    if prev is None:
+        by_key[k] = x
+    elif x["url"].lower().endswith(".pdf") and not prev["url"].lower().endswith(".pdf"):
+        by_key[k] = {**prev, "url": x["url"], "alternate_url": prev["url"]}
+    return k
+
+
+def merge_sources(per_topic: List[List[Dict]]) -> Tuple[List[Dict], List[List[str]]]:
+    """
+    The discoveries of several topics as one list of unique sources with
+    fresh IDs, plus each topic's source IDs in that topic's own ranking
+    order. Sources are matched on `dedupe_key`, as within one discovery.
+    """
+    by_key: Dict[str, Dict] = {}
+    topic_keys: List[List[str]] = []
+    for found in per_topic:
+        keys = [_add(by_key, {k: v for k, v in x.items() if k != "id"}) for x in found]
+        topic_keys.append(list(dict.fromkeys(keys)))
+    ids = {k: f"src{i+1:02d}" for i, k in enumerate(by_key)}
+    merged = [{**x, "id": ids[k]} for k, x in by_key.items()]
+    return merged, [[ids[k] for k in keys] for keys in topic_keys]
+
+
+def discover_sources(topic: str, limit: int = 10, stats: Optional[Dict] = None) -> List[Dict]:
+    """
+    Run the topic query (paged up to `limit`), a csrc update query and an SP
+    number query in parallel, then merge, dedupe and cap at `limit`. A
+    failing query is skipped unless every query fails.
+    """
+    queries = _queries(topic, limit)
+
+    def search(q: Tuple[str, int]):
+        counts: Dict = {}
+        try:
+            return _serpapi_search(q[0], SERP_PAGE_SIZE, q[1], counts), None, counts
+        except (requests.RequestException, ValueError) as e:
+            return [], e, counts
+
+    answers = ordered_map(search, queries, DISCOVERY_CONCURRENCY)
+    errors = [e for _, e, _ in answers if e is not None]
+    if errors and len(errors) == len(answers):
+        raise errors[0]
+
+    found = [x for results, _, _ in answers for x in results]
+    merged = _rank_and_dedupe(found, limit)
     # Assign IDs
     for i, m in enumerate(merged):
         m["id"] = f"src{i+1:02d}"
+    if stats is not None:
+        stats.update({
+            "queries": len(queries),
+            "failed_queries": len(errors),
+            "api_calls": sum(c.get("api_calls", 0) for _, _, c in answers),
+            "cache_hits": sum(c.get("cache_hits", 0) for _, _, c in answers),
+            "results": len(found),
+            "duplicates": len(found) - len(_rank_and_dedupe(found, len(found))),
+        })
     return merged
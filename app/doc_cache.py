@@ -0,0 +1,335 @@
+import os, hashlib, tempfile, threading, time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+import requests
+
+from fetching import FetchEngine
+from utils import ensure_dir, canonical_url, open_sqlite, ARTIFACTS_DIR
+
+DOC_CACHE_DIR = Path(os.getenv("DOC_CACHE_DIR", str(ARTIFACTS_DIR / "cache" / "docs"))).resolve()
+DOC_CACHE_MAX_BYTES = int(os.getenv("DOC_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# Within this window a cached URL is served without touching the network at all
+DOC_CACHE_FRESH_SECONDS = int(os.getenv("DOC_CACHE_FRESH_SECONDS", "3600"))
+DOC_CACHE_ENABLED = os.getenv("DOC_CACHE", "1").lower() not in ("0", "false", "no", "off")
+
+_CHUNK = 1 << 16
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS markdown (
+    sha256 TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (sha256, kind)
+);
+"""
+
+
+@dataclass
+class CachedDoc:
+    url: str
+    sha256: str
+    path: Path
+    size: int
+    status: str  # "fresh" | "revalidated" | "miss"
+
+    def read_bytes(self) -> bytes:
+        return self.path.read_bytes()
+
+
+class DocumentCache:
+    """
+    On-disk HTTP cache for source documents.
+
+    Layout under `root`:
+      index.sqlite3          url -> (sha256, ETag, Last-Modified), blob sizes, LRU clock
+      blobs/<aa>/<sha256>    response bodies, content-addressed
+      md/<aa>/<sha256>.<kind>.md   extracted markdown per body and extractor kind
+
+    Bodies are streamed straight to disk while being hashed, so a large PDF
+    never has to be held in memory. Total size is capped at `max_bytes`;
+    the least recently used bodies (and their markdown) are evicted first,
+    except bodies a caller is still reading (see open()).
+    """
+
+    def __init__(self, root: Path = DOC_CACHE_DIR, max_bytes: int = DOC_CACHE_MAX_BYTES,
+                 fresh_seconds: int = DOC_CACHE_FRESH_SECONDS):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        ensure_dir(self.root / "blobs")
+        ensure_dir(self.root / "md")
+        ensure_dir(self.root / "tmp")
+
+        self._lock = threading.Lock()
+        # sha -> callers holding the body; eviction skips these
+        self._pins: Dict[str, int] = {}
+        self._db = open_sqlite(self.root / "index.sqlite3")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+        self._stats = {
+            "hits": 0,            # served from cache (fresh or 304)
+            "misses": 0,          # full download
+            "revalidated": 0,     # 304 Not Modified
+            "bytes_saved": 0,     # body bytes not downloaded thanks to the cache
+            "bytes_downloaded": 0,
+            "markdown_hits": 0,
+            "markdown_misses": 0,
+            "evicted": 0,
+        }
+
+    # ---------- paths ----------
+
+    def _blob_path(self, sha: str) -> Path:
+        return self.root / "blobs" / sha[:2] / sha
+
+    def _md_path(self, sha: str, kind: str) -> Path:
+        return self.root / "md" / sha[:2] / f"{sha}.{kind}.md"
+
+    # ---------- stats ----------
+
+    def _bump(self, key: str, n: int = 1):
+        with self._lock:
+            self._stats[key] += n
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    # ---------- bodies ----------
+
+    def _pin(self, sha: str):
+        # caller holds self._lock
+        self._pins[sha] = self._pins.get(sha, 0) + 1
+
+    def _unpin(self, sha: str):
+        with self._lock:
+            n = self._pins.get(sha, 0) - 1
+            if n > 0:
+                self._pins[sha] = n
+            else:
+                self._pins.pop(sha, None)
+
+    def release(self, doc: Optional[CachedDoc]):
+        """Let a body returned by fetch() be evicted again."""
+        if doc is not None:
+            self._unpin(doc.sha256)
+
+    def _lookup(self, url: str) -> Optional[tuple]:
+        """The entry for `url`, its body pinned; the caller unpins it."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT e.sha256, e.etag, e.last_modified, e.fetched_at, b.size "
+                "FROM entries e JOIN blobs b ON b.sha256 = e.sha256 WHERE e.url = ?",
+                (url,),
+            ).fetchone()
+            if row:
+                self._pin(row[0])
+        if row and not self._blob_path(row[0]).exists():
+            self._unpin(row[0])
+            return None
+        return row
+
+    def _touch(self, sha: str, fetched_url: Optional[str] = None):
+        now = time.time()
+        with self._lock:
+            self._db.execute("UPDATE blobs SET last_access = ? WHERE sha256 = ?", (now, sha))
+            if fetched_url:
+                self._db.execute("UPDATE entries SET fetched_at = ? WHERE url = ?", (now, fetched_url))
+            self._db.commit()
+
+    def _store_body(self, r: requests.Response) -> tuple:
+        h = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self.root / "tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in r.iter_content(_CHUNK):
+                    if not chunk:
+                        continue
+                    h.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            sha = h.hexdigest()
+            dest = self._blob_path(sha)
+            ensure_dir(dest.parent)
+            os.replace(tmp, dest)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        return sha, size
+
+    @contextmanager
+    def open(self, url: str, engine: FetchEngine, **kwargs) -> Iterator[Optional[CachedDoc]]:
+        """fetch(), with the body safe from eviction until the block ends."""
+        doc = self.fetch(url, engine, **kwargs)
+        try:
+            yield doc
+        finally:
+            self.release(doc)
+
+    def fetch(self, url: str, engine: FetchEngine, **kwargs) -> Optional[CachedDoc]:
+        """
+        Return the body for `url`, downloading only when needed.
+
+        Fresh entries are served without a request; stale ones are revalidated
+        with If-None-Match / If-Modified-Since. Raises for HTTP errors like
+        requests would; returns None for an empty body. The body is pinned
+        against eviction until release() (open() does both).
+        """
+        key = canonical_url(url)
+        cached = self._lookup(key)
+        try:
+            doc = self._fetch(url, key, cached, engine, **kwargs)
+        except BaseException:
+            if cached:
+                self._unpin(cached[0])
+            raise
+        if cached and (doc is None or doc.status == "miss"):
+            self._unpin(cached[0])  # a new body replaced it; that one is pinned
+        return doc
+
+    def _fetch(self, url: str, key: str, cached: Optional[tuple], engine: FetchEngine,
+               **kwargs) -> Optional[CachedDoc]:
+        if cached and time.time() - cached[3] < self.fresh_seconds:
+            self._touch(cached[0])
+            self._bump("hits")
+            self._bump("bytes_saved", cached[4])
+            return CachedDoc(url, cached[0], self._blob_path(cached[0]), cached[4], "fresh")
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if cached:
+            if cached[1]:
+                headers["If-None-Match"] = cached[1]
+            if cached[2]:
+                headers["If-Modified-Since"] = cached[2]
+
+        with engine.stream(url, headers=headers, **kwargs) as r:
+            if cached and r.status_code == 304:
+                self._touch(cached[0], key)
+                self._bump("hits")
+                self._bump("revalidated")
+                self._bump("bytes_saved", cached[4])
+                return CachedDoc(url, cached[0], self._blob_path(cached[0]), cached[4], "revalidated")
+
+            r.raise_for_status()
+            sha, size = self._store_body(r)
+            etag = r.headers.get("ETag")
+            last_modified = r.headers.get("Last-Modified")
+
+        self._bump("misses")
+        self._bump("bytes_downloaded", size)
+        if not size:
+            return None
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO blobs (sha256, size, last_access) VALUES (?, ?, ?) "
+                "ON CONFLICT(sha256) DO UPDATE SET last_access = excluded.last_access",
+                (sha, size, now),
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (url, sha256, etag, last_modified, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, sha, etag, last_modified, now),
+            )
+            self._db.commit()
+            self._pin(sha)
+        self._evict()
+        return CachedDoc(url, sha, self._blob_path(sha), size, "miss")
+
+    # ---------- extracted markdown ----------
+
+    def get_markdown(self, sha: str, kind: str) -> Optional[str]:
+        p = self._md_path(sha, kind)
+        try:
+            md = p.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            self._bump("markdown_misses")
+            return None
+        self._touch(sha)
+        self._bump("markdown_hits")
+        return md
+
+    def put_markdown(self, sha: str, kind: str, md: str):
+        p = self._md_path(sha, kind)
+        ensure_dir(p.parent)
+        data = md.encode("utf-8")
+        p.write_bytes(data)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO markdown (sha256, kind, size) VALUES (?, ?, ?)",
+                (sha, kind, len(data)),
+            )
+            self._db.commit()
+        self._evict(keep=sha)
+
+    # ---------- eviction ----------
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            b = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            m = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM markdown").fetchone()[0]
+        return b + m
+
+    def _evict(self, keep: Optional[str] = None):
+        """
+        Drop least recently used blobs until the cache fits max_bytes. Pinned
+        blobs and `keep` (whose markdown was just stored) are never dropped,
+        even when they alone are over the cap.
+        """
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT b.sha256, b.size + COALESCE(SUM(m.size), 0) FROM blobs b "
+                "LEFT JOIN markdown m ON m.sha256 = b.sha256 "
+                "GROUP BY b.sha256 ORDER BY b.last_access ASC"
+            ).fetchall()
+            for sha, size in rows:
+                if total <= self.max_bytes:
+                    break
+                if sha == keep or sha in self._pins:
+                    continue
+                kinds = [k for (k,) in self._db.execute("SELECT kind FROM markdown WHERE sha256 = ?", (sha,))]
+                for kind in kinds:
+                    self._md_path(sha, kind).unlink(missing_ok=True)
+                self._blob_path(sha).unlink(missing_ok=True)
+                self._db.execute("DELETE FROM markdown WHERE sha256 = ?", (sha,))
+                self._db.execute("DELETE FROM entries WHERE sha256 = ?", (sha,))
+                self._db.execute("DELETE FROM blobs WHERE sha256 = ?", (sha,))
+                self._stats["evicted"] += 1
+                total -= size
+            self._db.commit()
+
+
+_cache: Optional[DocumentCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_doc_cache() -> Optional[DocumentCache]:
+    """Process-wide cache, or None when disabled with DOC_CACHE=0."""
+    global _cache
+    if not DOC_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = DocumentCache()
+        return _cache
@@ -1,18 +1,28 @@
-import os, requests, io
-from typing import List, Dict
+import os, requests, tempfile, contextvars
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Iterator, List, Dict, Optional, Tuple
 from pathlib import Path
-import trafilatura
-import pdfplumber
 
-from utils import safe_filename, ensure_dir, write_text
+from doc_cache import DocumentCache, get_doc_cache
+from fetching import FetchEngine, get_engine
+from pdfparse import PdfOptions, pdf_to_markdown
+from artifacts import get_store
+from utils import safe_filename, ensure_dir
 
-import trafilatura
-
-def _extract_html_markdown(url: str) -> str:
-    downloaded = trafilatura.fetch_url(url, no_ssl=True)
-    if not downloaded:
+def _fetch_html(url: str, engine: FetchEngine) -> str:
+    # Same contract as trafilatura.fetch_url(): "" on any failure
+    try:
+        r = engine.get(url)
+    except requests.RequestException:
         return ""
+    if r.status_code != 200 or not r.content:
+        return ""
+    # trafilatura is imported on first use; it is slow to load and only HTML sources need it
+    from trafilatura.utils import decode_file
+    return decode_file(r.content) or ""
 
+def _html_to_markdown(downloaded: str) -> str:
+    import trafilatura
     try:
         # Newer trafilatura
         return trafilatura.extract(
@@ -29,42 +39,154 @@ def _extract_html_markdown(url: str) -> str:
         except Exception:
             return text
 
+def _extract_html_markdown(url: str, engine: Optional[FetchEngine] = None,
+                           cache: Optional[DocumentCache] = None) -> str:
+    engine = engine or get_engine()
+    if cache is None:
+        downloaded = _fetch_html(url, engine)
+        return _html_to_markdown(downloaded) if downloaded else ""
+
+    try:
+        # pinned while in use, so a concurrent fetch cannot evict the body first
+        with cache.open(url, engine) as doc:
+            if doc is None:
+                return ""
+            md = cache.get_markdown(doc.sha256, "html")
+            if md is None:
+                from trafilatura.utils import decode_file
+                downloaded = decode_file(doc.read_bytes()) or ""
+                md = _html_to_markdown(downloaded) if downloaded else ""
+                cache.put_markdown(doc.sha256, "html", md)
+            return md
+    except requests.RequestException:
+        return ""
 
-def _extract_pdf_markdown(url: str) -> str:
-    # naive: download and parse text by page, mark headers
-    r = requests.get(url, timeout=60)
-    r.raise_for_status()
-    with pdfplumber.open(io.BytesIO(r.content)) as pdf:
-        parts = []
-        for i, page in enumerate(pdf.pages, start=1):
-            text = page.extract_text() or ""
-            parts.append(f"\n\n## [Page {i}]\n\n{text}\n")
-    return "\n".join(parts).strip()
+
+def _download_to_tempfile(url: str, engine: FetchEngine) -> str:
+    # Stream the body to disk in chunks instead of holding r.content in memory
+    fd, tmp = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f, engine.stream(url) as r:
+            r.raise_for_status()
+            for chunk in r.iter_content(1 << 16):
+                f.write(chunk)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return tmp
+
+def _extract_pdf_markdown(url: str, engine: Optional[FetchEngine] = None,
+                          cache: Optional[DocumentCache] = None,
+                          opts: Optional[PdfOptions] = None,
+                          stats: Optional[Dict] = None) -> str:
+    engine = engine or get_engine()
+    opts = opts or PdfOptions.from_env()
+    if cache is None:
+        tmp = _download_to_tempfile(url, engine)
+        try:
+            md, pdf_stats = pdf_to_markdown(tmp, opts)
+        finally:
+            os.unlink(tmp)
+    else:
+        with cache.open(url, engine) as doc:
+            if doc is None:
+                return ""
+
+            # An unchanged PDF skips the pdfplumber parse entirely
+            kind = opts.cache_kind()
+            md = cache.get_markdown(doc.sha256, kind)
+            if md is not None:
+                return md
+            md, pdf_stats = pdf_to_markdown(str(doc.path), opts)
+            if not pdf_stats["timed_out"]:
+                cache.put_markdown(doc.sha256, kind, md)
+
+    if stats is not None:
+        stats.update(pdf_stats)
+    return md
 
 def _looks_like_pdf(url: str) -> bool:
     return url.lower().endswith(".pdf")
 
-def extract_all(sources: List[Dict], out_dir: Path) -> List[Dict]:
+def _extract_one(s: Dict, engine: FetchEngine, cache: Optional[DocumentCache],
+                 pdf_opts: Optional[PdfOptions]) -> Tuple[str, Dict]:
+    doc_stats: Dict = {}
+    try:
+        if _looks_like_pdf(s["url"]):
+            return _extract_pdf_markdown(s["url"], engine, cache, pdf_opts, doc_stats), doc_stats
+        return _extract_html_markdown(s["url"], engine, cache), doc_stats
+    except Exception as e:
+        return f"_Extraction failed: {e}_", doc_stats
+
+def extract_all(sources: List[Dict], out_dir: Path, engine: Optional[FetchEngine] = None,
+                cache: Optional[DocumentCache] = None, pdf_opts: Optional[PdfOptions] = None,
+                stats: Optional[Dict] = None) -> List[Dict]:
+    """
+    Fetch and convert every source to markdown, in source order.
+
+    When `stats` is given, per-PDF parse stats (pages, pages/s, process peak RSS)
+    are collected under stats["pdf"].
+    """
     ensure_dir(out_dir)
+    engine = engine or get_engine()
+    cache = cache if cache is not None else get_doc_cache()
+    pdf_opts = pdf_opts or PdfOptions.from_env()
+
+    # Downloads run concurrently; results come back in source order
+    results = engine.map(lambda s: _extract_one(s, engine, cache, pdf_opts), sources)
+
     items = []
-    for s in sources:
-        try:
-            if _looks_like_pdf(s["url"]):
-                md = _extract_pdf_markdown(s["url"])
-            else:
-                md = _extract_html_markdown(s["url"])
-        except Exception as e:
-            md = f"_Extraction failed: {e}_"
-
-        if not md:
-            continue
-
-        # persist raw
-        fn = safe_filename(f"{s['id']}-{s['title'][:80]}.md")
-        write_text(out_dir / fn, md)
-
-        items.append({
-            **s,
-            "markdown": md,
-        })
+    for s, (md, doc_stats) in zip(sources, results):
+        if doc_stats and stats is not None:
+            stats.setdefault("pdf", []).append({"id": s["id"], **doc_stats})
+        item = _to_item(s, md, out_dir)
+        if item is not None:
+            items.append(item)
     return items
+
+def iter_extracted(sources: List[Dict], out_dir: Path, engine: Optional[FetchEngine] = None,
+                   cache: Optional[DocumentCache] = None,
+                   pdf_opts: Optional[PdfOptions] = None) -> Iterator[Tuple[int, Optional[Dict], Dict]]:
+    """
+    extract_all as a generator: yields (source index, item or None, doc stats)
+    as each source finishes, in completion order. At most
+    `engine.concurrency` sources are in flight, and the next one only starts
+    once the consumer has taken a result.
+    """
+    ensure_dir(out_dir)
+    engine = engine or get_engine()
+    cache = cache if cache is not None else get_doc_cache()
+    pdf_opts = pdf_opts or PdfOptions.from_env()
+
+    ctx = contextvars.copy_context()
+    todo = iter(enumerate(sources))
+    pending: Dict[Future, int] = {}
+    with ThreadPoolExecutor(max_workers=engine.concurrency) as ex:
+        def submit_next():
+            nxt = next(todo, None)
+            if nxt is not None:
+                pending[ex.submit(ctx.copy().run, _extract_one, nxt[1], engine, cache, pdf_opts)] = nxt[0]
+
+        for _ in range(engine.concurrency):
+            submit_next()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                i = pending.pop(fut)
+                md, doc_stats = fut.result()
+                yield i, _to_item(sources[i], md, out_dir), doc_stats
+                submit_next()
+
+def _to_item(s: Dict, md: str, out_dir: Path) -> Optional[Dict]:
+    if not md:
+        return None
+
+    # stored once; the run's copy is a hardlink and the item carries only the hash
+    store = get_store()
+    sha = store.put(md)
+    store.link(sha, out_dir / safe_filename(f"{s['id']}-{s['title'][:80]}.md"))
+
+    return {
+        **s,
+        "content_hash": sha,
+    }
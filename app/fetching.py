@@ -0,0 +1,104 @@
+import os, threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+import replay
+from telemetry import span
+from utils import ordered_map
+load_dotenv()
+
+# Total downloads in flight, and how many of those may target one host
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "8"))
+FETCH_PER_HOST = int(os.getenv("FETCH_PER_HOST", "2"))
+FETCH_TIMEOUT = int(os.getenv("FETCH_TIMEOUT", "60"))
+# Set to 0 only for sources with broken certificate chains; applies to this engine's session alone
+FETCH_VERIFY_TLS = os.getenv("FETCH_VERIFY_TLS", "1") != "0"
+
+USER_AGENT = "nist-agent-reports/1.0 (+https://github.com/babeingineer/nist-agent-reports)"
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class FetchEngine:
+    """
+    Runs downloads on a thread pool that shares one keep-alive connection pool.
+
+    Every request takes a slot from its host's semaphore first, so a large
+    batch pointed at csrc.nist.gov never opens more than `per_host`
+    connections to it at once regardless of the total concurrency.
+    """
+
+    def __init__(self, concurrency: Optional[int] = None, per_host: Optional[int] = None,
+                 verify_tls: bool = FETCH_VERIFY_TLS):
+        self.concurrency = max(1, concurrency or FETCH_CONCURRENCY)
+        self.per_host = max(1, per_host or FETCH_PER_HOST)
+
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        self.session.verify = verify_tls
+        adapter = HTTPAdapter(pool_connections=self.concurrency, pool_maxsize=self.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        replay.install(self.session, pool_connections=self.concurrency, pool_maxsize=self.concurrency)
+
+        self._hosts: Dict[str, threading.BoundedSemaphore] = {}
+        self._hosts_lock = threading.Lock()
+
+    def _host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc.lower()
+        with self._hosts_lock:
+            sem = self._hosts.get(host)
+            if sem is None:
+                sem = self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return sem
+
+    @contextmanager
+    def host_slot(self, url: str):
+        sem = self._host_semaphore(url)
+        with sem:
+            yield
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", FETCH_TIMEOUT)
+        with self.host_slot(url), span("fetch") as sp:
+            r = self.session.get(url, **kwargs)
+            sp.add(bytes=len(r.content))
+            return r
+
+    @contextmanager
+    def stream(self, url: str, **kwargs):
+        """Streaming GET; the host slot is held until the body has been read."""
+        kwargs.setdefault("timeout", FETCH_TIMEOUT)
+        with self.host_slot(url), span("fetch") as sp:
+            r = self.session.get(url, stream=True, **kwargs)
+            try:
+                yield r
+            finally:
+                sp.add(bytes=r.raw.tell() if hasattr(r.raw, "tell") else 0)
+                r.close()
+
+    def map(self, fn: Callable[[T], R], items: Iterable[T]) -> List[R]:
+        """Apply `fn` to every item concurrently; results keep input order and see the caller's contextvars."""
+        return ordered_map(fn, items, self.concurrency)
+
+    def close(self):
+        self.session.close()
+
+
+_engine: Optional[FetchEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> FetchEngine:
+    """Process-wide engine, so connection pools survive across runs."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = FetchEngine()
+        return _engine
@@ -0,0 +1,75 @@
+from typing import Dict, List, Optional
+
+import relevance
+import mapping
+from state import StateIndex, item_hash, section_hash
+
+
+def filter_relevant_incremental(extracted: List[Dict], state: StateIndex, reuse: bool = True,
+                                stats: Optional[Dict] = None) -> List[Dict]:
+    """
+    filter_relevant, but documents whose content was already judged by the
+    same stage version reuse the stored kept sections. Fresh results
+    (including "nothing kept") are written back.
+    """
+    version = relevance.stage_version()
+    stored: Dict[str, List[Dict]] = {}
+    todo = []
+    for it in extracted:
+        prev = state.get_relevance(item_hash(it), version) if reuse else None
+        if prev is None:
+            todo.append(it)
+        else:
+            stored[it["id"]] = prev
+
+    fresh = {it["id"]: it["kept_sections"] for it in relevance.filter_relevant(todo, stats=stats)}
+    for it in todo:
+        state.put_relevance(item_hash(it), version, fresh.get(it["id"], []))
+
+    if stats is not None:
+        stats["reused_documents"] = len(stored)
+
+    kept = []
+    for it in extracted:
+        sections = stored[it["id"]] if it["id"] in stored else fresh.get(it["id"], [])
+        if not sections:
+            continue
+        kept.append({**it, "kept_sections": sections})
+    return kept
+
+
+def map_controls_incremental(filtered: List[Dict], state: StateIndex, reuse: bool = True,
+                             stats: Optional[Dict] = None) -> List[Dict]:
+    """
+    map_controls, but only for sections without stored mappings from the
+    same stage version; everything else is filled in from the state index.
+    """
+    version = mapping.stage_version()
+    known: Dict[str, List[Dict]] = {}
+    pending = []
+    for it in filtered:
+        missing = []
+        for sec in it["kept_sections"]:
+            h = section_hash(sec)
+            prev = state.get_mappings(h, version) if reuse else None
+            if prev is None:
+                missing.append(sec)
+            else:
+                known[h] = prev
+        if missing:
+            pending.append({**it, "kept_sections": missing})
+
+    reused = len(known)
+    for it in mapping.map_controls(pending, stats=stats):
+        for sec in it["kept_sections"]:
+            h = section_hash(sec)
+            known[h] = sec["mappings"]
+            state.put_mappings(h, version, sec["mappings"])
+
+    if stats is not None:
+        stats["reused_sections"] = reused
+
+    return [
+        {**it, "kept_sections": [{**sec, "mappings": known[section_hash(sec)]} for sec in it["kept_sections"]]}
+        for it in filtered
+    ]
@@ -0,0 +1,156 @@
+import os, json, threading, time, uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Pipelines run at once; further jobs wait in the queue
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Finished jobs kept for GET /jobs/{id}
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "200"))
+# Seconds between SSE keep-alive comments while a job is quiet
+SSE_KEEPALIVE = float(os.getenv("SSE_KEEPALIVE", "15"))
+# Streamed summary events held for live subscribers; they are not part of the job's stored history
+JOB_TOKEN_BUFFER = int(os.getenv("JOB_TOKEN_BUFFER", "1024"))
+
+FINISHED = ("succeeded", "failed")
+
+
+def _is_token(ev: Dict[str, Any]) -> bool:
+    return ev.get("status", "").startswith("token")
+
+
+class Job:
+    def __init__(self, key: Tuple, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.params = params
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.events: List[Dict[str, Any]] = []
+        # token events, newest JOB_TOKEN_BUFFER only; a subscriber further behind skips the older ones
+        self._tokens: "deque[Dict[str, Any]]" = deque(maxlen=max(1, JOB_TOKEN_BUFFER))
+        self._seq = 0
+        self._cond = threading.Condition()
+
+    def emit(self, stage: str, event: Dict[str, Any]):
+        with self._cond:
+            ev = {"seq": self._seq, "ts": round(time.time(), 3), "stage": stage, **event}
+            self._seq += 1
+            if _is_token(ev):
+                self._tokens.append(ev)
+            else:
+                self.events.append(ev)
+            self._cond.notify_all()
+
+    def to_dict(self, with_result: bool = True) -> Dict[str, Any]:
+        with self._cond:
+            out = {
+                "job_id": self.id,
+                "status": self.status,
+                "params": self.params,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "progress": self.events[-1] if self.events else None,
+                "error": self.error,
+            }
+            if with_result:
+                out["result"] = self.result
+            return out
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self.status in FINISHED, timeout)
+
+    def stream(self, keepalive: float = SSE_KEEPALIVE) -> Iterator[str]:
+        """
+        Server-Sent Events: every progress event, then a final `end` event.
+        Streamed summary text is sent as `token` events instead of `progress`,
+        from the bounded buffer of recent ones.
+        """
+        last, stored = -1, 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._seq > last + 1 or self.status in FINISHED, keepalive)
+                pending = self.events[stored:]
+                stored = len(self.events)
+                pending += [ev for ev in self._tokens if ev["seq"] > last]
+                done = self.status in FINISHED
+                caught_up = self._seq
+            if not pending and not done:
+                yield ": keep-alive\n\n"
+                continue
+            for ev in sorted(pending, key=lambda ev: ev["seq"]):
+                kind = "token" if _is_token(ev) else "progress"
+                yield f"event: {kind}\nid: {ev['seq']}\ndata: {json.dumps(ev, default=str)}\n\n"
+            last = caught_up - 1
+            if done:
+                yield f"event: end\ndata: {json.dumps(self.to_dict(), default=str)}\n\n"
+                return
+
+
+class JobManager:
+    """
+    Runs pipeline jobs on a bounded worker pool.
+
+    Submitting the same parameters as a job that is still queued or running
+    returns that job instead of starting a second identical pipeline.
+    """
+
+    def __init__(self, runner: Callable[..., Any], workers: int = JOB_WORKERS, history: int = JOB_HISTORY):
+        self._runner = runner
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="job")
+        self._history = history
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._inflight: Dict[Tuple, Job] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(params: Dict[str, Any]) -> Tuple:
+        return tuple(sorted((k, json.dumps(v, sort_keys=True)) for k, v in params.items()))
+
+    def submit(self, params: Dict[str, Any]) -> Tuple[Job, bool]:
+        """Returns (job, deduplicated)."""
+        key = self._key(params)
+        with self._lock:
+            existing = self._inflight.get(key)
+            if existing is not None:
+                return existing, True
+            job = Job(key, params)
+            self._jobs[job.id] = job
+            self._inflight[key] = job
+            self._trim()
+        self._pool.submit(self._execute, job)
+        return job, False
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _trim(self):
+        finished = [jid for jid, j in self._jobs.items() if j.status in FINISHED]
+        for jid in finished[:max(0, len(self._jobs) - self._history)]:
+            del self._jobs[jid]
+
+    def _execute(self, job: Job):
+        with job._cond:
+            job.status = "running"
+            job.started_at = time.time()
+        job.emit("job", {"status": "running"})
+        try:
+            result = self._runner(**job.params, progress=job.emit)
+            status, error = "succeeded", None
+        except Exception as e:
+            result, status, error = None, "failed", f"{type(e).__name__}: {e}"
+        with self._lock:
+            self._inflight.pop(job.key, None)
+        with job._cond:
+            job.result = result
+            job.error = error
+            job.status = status
+            job.finished_at = time.time()
+            job._cond.notify_all()
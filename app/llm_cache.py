@@ -0,0 +1,141 @@
+import os, json, hashlib, threading, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Optional
+
+from utils import ensure_dir, open_sqlite, ARTIFACTS_DIR
+
+LLM_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", str(ARTIFACTS_DIR / "cache" / "llm.sqlite3"))).resolve()
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(14 * 24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 ** 2)))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1").lower() not in ("0", "false", "no", "off")
+
+# Set per run (see bypass()); a bypassed run still refreshes stored responses
+_bypass: ContextVar[bool] = ContextVar("llm_cache_bypass", default=False)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    content TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access);
+"""
+
+
+def cache_key(model: str, system: str, user: str, json_mode: bool) -> str:
+    raw = json.dumps([model, system, user, bool(json_mode)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def bypass(enabled: bool = True):
+    """Skip cache lookups for calls made inside this block (responses are still stored)."""
+    token = _bypass.set(enabled)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def bypassed() -> bool:
+    """Whether calls made here skip cache lookups (so work handed to another process can do the same)."""
+    return _bypass.get()
+
+
+class LLMCache:
+    """
+    SQLite-backed cache of chat completion contents.
+
+    Entries expire after `ttl` seconds; when the stored contents exceed
+    `max_bytes` the least recently read entries are dropped.
+    """
+
+    def __init__(self, path: Path = LLM_CACHE_PATH, ttl: int = LLM_CACHE_TTL,
+                 max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        ensure_dir(self.path.parent)
+
+        self._lock = threading.Lock()
+        self._db = open_sqlite(self.path)
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        self._stats = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "expired": 0, "evicted": 0}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def get(self, key: str) -> Optional[str]:
+        if _bypass.get():
+            with self._lock:
+                self._stats["bypassed"] += 1
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT content, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and self.ttl and now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                self._stats["expired"] += 1
+                row = None
+            if not row:
+                self._stats["misses"] += 1
+                return None
+            self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self._stats["hits"] += 1
+            return row[0]
+
+    def put(self, key: str, model: str, content: str):
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, content, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, content, size, now, now),
+            )
+            self._stats["stores"] += 1
+            self._evict_locked(now)
+            self._db.commit()
+
+    def _evict_locked(self, now: float):
+        if self.ttl:
+            cur = self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            self._stats["expired"] += cur.rowcount
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._stats["evicted"] += 1
+            total -= size
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """Process-wide cache, or None when disabled with LLM_CACHE=0."""
+    global _cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
+
+
+def hit_rate(stats: Dict[str, int]) -> Optional[float]:
+    lookups = stats.get("hits", 0) + stats.get("misses", 0)
+    return round(stats.get("hits", 0) / lookups, 3) if lookups else None
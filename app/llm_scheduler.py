@@ -0,0 +1,233 @@
+import os, sys, heapq, itertools, random, threading, time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# Account limits (per minute) and local concurrency ceiling
+LLM_RPM = int(os.getenv("LLM_RPM", "500"))
+LLM_TPM = int(os.getenv("LLM_TPM", "150000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "6"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+# Completion tokens reserved per request until the real usage is known
+LLM_COMPLETION_TOKENS = int(os.getenv("LLM_COMPLETION_TOKENS", "800"))
+
+# Lower runs first: the final summary should not queue behind bulk mapping
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+T = TypeVar("T")
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Cheap prompt size estimate (~4 characters per token plus message overhead)."""
+    return sum(len(t) for t in texts if t) // 4 + 8 * len(texts)
+
+
+class TokenBucket:
+    """Refills continuously at `per_minute / 60` per second up to `per_minute`."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(max(1, per_minute))
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (0 when available now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def give(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except Exception:
+            return None
+
+
+def _openai():
+    # Only an already-imported openai can have raised one of its errors, so
+    # checking sys.modules keeps the scheduler from importing it at startup
+    return sys.modules.get("openai")
+
+
+def _is_rate_limit(exc: Exception) -> bool:
+    openai = _openai()
+    return openai is not None and isinstance(exc, openai.RateLimitError)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    openai = _openai()
+    if openai is None:
+        return False
+    if isinstance(exc, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in (408, 409) or exc.status_code >= 500
+    return False
+
+
+class LLMScheduler:
+    """
+    Gate in front of every chat completion.
+
+    A request waits for (a) its turn by priority, (b) a free concurrency
+    slot, and (c) room in the requests/minute and tokens/minute buckets.
+    The concurrency limit follows AIMD: it halves on every 429 and grows by
+    one after a window of clean responses. A 429 also pauses the whole queue
+    for its `retry-after`. Failed requests are retried with jittered
+    exponential backoff.
+    """
+
+    def __init__(self, rpm: int = LLM_RPM, tpm: int = LLM_TPM,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, max_retries: int = LLM_MAX_RETRIES):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.limit = self.max_concurrency
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._in_flight = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._waiting: list = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stats = {"requests": 0, "retries": 0, "rate_limited": 0, "failed": 0,
+                       "tokens_reserved": 0, "wait_seconds": 0.0}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {**self._stats, "wait_seconds": round(self._stats["wait_seconds"], 3),
+                    "concurrency_limit": self.limit}
+
+    # ---------- admission ----------
+
+    def _acquire(self, priority: int, tokens: int):
+        t0 = time.monotonic()
+        with self._cond:
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    timeout = None
+                    if self._waiting[0] == entry and self._in_flight < self.limit:
+                        timeout = max(self._paused_until - time.monotonic(),
+                                      self._requests.delay(1), self._tokens.delay(tokens))
+                        if timeout <= 0:
+                            break
+                    self._cond.wait(timeout)
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            self._requests.take(1)
+            self._tokens.take(tokens)
+            self._in_flight += 1
+            self._stats["requests"] += 1
+            self._stats["tokens_reserved"] += tokens
+            self._stats["wait_seconds"] += time.monotonic() - t0
+            self._cond.notify_all()
+
+    def _release(self, reserved: int, used: Optional[int], rate_limited: bool, retry_after: Optional[float]):
+        with self._cond:
+            self._in_flight -= 1
+            if used is not None and used < reserved:
+                self._tokens.give(reserved - used)
+            elif used is not None and used > reserved:
+                self._tokens.take(used - reserved)
+            if rate_limited:
+                self._stats["rate_limited"] += 1
+                now = time.monotonic()
+                # one decrease per burst of 429s, not one per rejected request
+                if now - self._last_decrease > 1.0:
+                    self.limit = max(1, self.limit // 2)
+                    self._last_decrease = now
+                self._successes = 0
+                if retry_after:
+                    self._paused_until = max(self._paused_until, now + retry_after)
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+    # ---------- execution ----------
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        delay = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt))
+        delay *= random.uniform(0.5, 1.5)
+        return max(delay, retry_after or 0.0)
+
+    def run(self, fn: Callable[[], T], est_tokens: int, priority: int = PRIORITY_BULK) -> T:
+        """Call `fn` (one completion request) under the limits, retrying transient failures."""
+        attempt = 0
+        while True:
+            self._acquire(priority, est_tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                rate_limited = _is_rate_limit(e)
+                retry_after = _retry_after(e)
+                # a rejected request consumed no tokens
+                self._release(est_tokens, 0 if rate_limited else None, rate_limited, retry_after)
+                if not _is_retryable(e) or attempt >= self.max_retries:
+                    with self._cond:
+                        self._stats["failed"] += 1
+                    raise
+                with self._cond:
+                    self._stats["retries"] += 1
+                time.sleep(self._backoff(attempt, retry_after))
+                attempt += 1
+                continue
+            usage = getattr(result, "usage", None)
+            used = getattr(usage, "total_tokens", None)
+            self._release(est_tokens, used, False, None)
+            return result
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
@@ -1,40 +1,58 @@
 import os
+import sys
 import argparse
-from fastapi import FastAPI
-from pydantic import BaseModel
-import uvicorn
 
-from orchestrator import run_workflow
-
-class RunRequest(BaseModel):
-    topic: str = "NIST SP 800 updates"
-    limit: int = 10
-    dry_run: bool = False
-
-app = FastAPI(title="NIST SP 800 Agent")
-
-@app.get("/healthz")
-def health():
-    return {"status": "ok"}
-
-@app.post("/run")
-def run(req: RunRequest):
-    result = run_workflow(topic=req.topic, limit=req.limit, dry_run=req.dry_run)
-    return result
+def __getattr__(name):
+    # `uvicorn main:app` keeps working; the API now lives in server.py
+    if name == "app":
+        from server import app
+        return app
+    raise AttributeError(name)
 
 def cli():
     parser = argparse.ArgumentParser(description="NIST SP 800 Agentic Workflow")
     parser.add_argument("--topic", default="NIST SP 800 updates")
+    parser.add_argument("--topics", nargs="+", metavar="TOPIC",
+                        help="Batch run: one brief per topic, each shared document processed once")
     parser.add_argument("--limit", type=int, default=10)
     parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--no-llm-cache", action="store_true",
+                        help="Ignore cached LLM responses for this run (fresh responses are still stored)")
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="Re-run relevance and mapping for every document, ignoring the state index")
+    parser.add_argument("--resume", metavar="RUN_ID",
+                        help="Continue an earlier run from its first unfinished stage")
+    parser.add_argument("--worker", type=int, metavar="N",
+                        help="Extract, judge and map documents in N worker processes via the durable task queue")
     parser.add_argument("--serve", action="store_true", help="Run REST server instead of one-shot")
+    parser.add_argument("--search", metavar="QUERY",
+                        help="Search the sections of earlier runs' sources and summaries (up to --limit results)")
+    parser.add_argument("--backfill-index", action="store_true",
+                        help="Add every run under ARTIFACTS_DIR to the search index, then exit")
+    parser.add_argument("--import-profile", action="store_true",
+                        help="Report what importing the CLI pipeline and the server costs, then exit")
     args = parser.parse_args()
 
+    if args.import_profile:
+        from startup import print_import_profile
+        sys.exit(print_import_profile())
+    if args.search or args.backfill_index:
+        from search import SearchIndex, backfill, format_results
+        index = SearchIndex()
+        if args.backfill_index:
+            print(backfill(index))
+        if args.search:
+            print(format_results(index.search(args.search, limit=args.limit)))
+        return
     if args.serve:
+        import uvicorn
         port = int(os.getenv("PORT", "8000"))
-        uvicorn.run("main:app", host="0.0.0.0", port=port, reload=False)
+        uvicorn.run("server:app", host="0.0.0.0", port=port, reload=False)
     else:
-        res = run_workflow(topic=args.topic, limit=args.limit, dry_run=args.dry_run)
+        from orchestrator import run_workflow
+        res = run_workflow(topic=args.topic, limit=args.limit, dry_run=args.dry_run,
+                           bypass_llm_cache=args.no_llm_cache, full_refresh=args.full_refresh, resume=args.resume,
+                           topics=args.topics, workers=args.worker)
         print(res)
 
 if __name__ == "__main__":
@@ -1,13 +1,13 @@
-import yaml, re
-from typing import List, Dict, Any
+import os, yaml, re, json
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
-from utils import openai_chat
+from utils import openai_chat, llm_map, OPENAI_MODEL
+from chunking import count_tokens, split_text, pack
+from controls import get_catalog
 
 CONFIG_DIR = Path(__file__).parent / "config"
 
-with open(CONFIG_DIR / "mappings.yaml", "r", encoding="utf-8") as f:
-    RULES = yaml.safe_load(f)
-
 PROMPT = """You map text to control frameworks.
 Given a section, propose mappings with justification. Use only these frameworks:
 - NIST 800-53 (e.g., SA-12, SA-15, CM-2, RA-5, SI-10)
@@ -18,33 +18,154 @@ Return JSON: { mappings: [ {framework: "...", control: "...", reason: "..."} ] }
 Keep concise, ensure the control identifiers actually exist.
 """
 
-def _rule_matches(text: str) -> List[Dict[str, str]]:
-    hits = []
-    for rule in RULES.get("patterns", []):
-        if re.search(rule["regex"], text, flags=re.IGNORECASE):
-            for m in rule.get("maps_to", []):
-                hits.append(m)
-    return hits
+PACKED_PROMPT = PROMPT.replace(
+    "Given a section, propose mappings",
+    "You receive several numbered sections (=== SECTION n ===). For each one, propose mappings",
+).replace(
+    "Return JSON: { mappings: [ {framework: \"...\", control: \"...\", reason: \"...\"} ] }",
+    "Return JSON: { results: [ {section: n, mappings: [ {framework: \"...\", control: \"...\", reason: \"...\"} ]} ] }\n"
+    "Include every section number, with an empty list when nothing applies.",
+)
+
+# Small sections are packed into one request up to this size; larger ones are split
+MAPPING_BATCH_TOKENS = int(os.getenv("MAPPING_BATCH_TOKENS", "3000"))
+MAPPING_BATCH_MAX_SECTIONS = int(os.getenv("MAPPING_BATCH_MAX_SECTIONS", "8"))
+# Sections whose rule confidence reaches this are mapped by rules alone, without an LLM call (>1 disables)
+MAPPING_RULE_THRESHOLD = float(os.getenv("MAPPING_RULE_THRESHOLD", "0.8"))
+# Evidence per rule match when a mappings.yaml pattern sets no `confidence`
+DEFAULT_RULE_CONFIDENCE = 0.3
+# Repeats of one pattern beyond this add no confidence
+MAX_MATCHES_PER_RULE = 3
+
+@lru_cache(maxsize=1)
+def get_rules() -> Dict[str, Any]:
+    """mappings.yaml, read on first use rather than at import."""
+    with open(CONFIG_DIR / "mappings.yaml", "r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+@lru_cache(maxsize=1)
+def _compiled_rules() -> List[Tuple["re.Pattern", float, List[Dict]]]:
+    return [(re.compile(rule["regex"], re.IGNORECASE), float(rule.get("confidence", DEFAULT_RULE_CONFIDENCE)),
+             rule.get("maps_to", []))
+            for rule in get_rules().get("patterns", [])]
+
+def stage_version() -> str:
+    """Changes whenever something that shapes map_controls' output changes."""
+    from state import version_hash
+    return version_hash(OPENAI_MODEL, PROMPT, PACKED_PROMPT, json.dumps(get_rules(), sort_keys=True),
+                        str(MAPPING_BATCH_TOKENS), str(MAPPING_BATCH_MAX_SECTIONS), str(MAPPING_RULE_THRESHOLD),
+                        (CONFIG_DIR / "controls.yaml").read_text(encoding="utf-8"))
+
+def _rule_matches(text: str) -> Tuple[List[Dict[str, str]], float]:
+    """
+    Rule mappings for a section and how sure the rules are, in [0, 1]:
+    every match (up to MAX_MATCHES_PER_RULE per pattern) is independent
+    evidence with its pattern's confidence.
+    """
+    hits, doubt = [], 1.0
+    for regex, confidence, maps_to in _compiled_rules():
+        n = sum(1 for _ in zip(range(MAX_MATCHES_PER_RULE), regex.finditer(text)))
+        if n:
+            hits.extend(maps_to)
+            doubt *= (1 - confidence) ** n
+    return hits, 1 - doubt
+
+def _validate(mappings: List[Dict], counts: Dict[str, int]) -> List[Dict]:
+    """
+    Drop mappings to controls that are not in the catalog and repeats of the
+    same (framework, control); framework names and ids come out canonical.
+    """
+    catalog = get_catalog()
+    seen, out = set(), []
+    for m in mappings:
+        key = catalog.resolve(m.get("framework", ""), m.get("control", "")) if isinstance(m, dict) else None
+        if key is None:
+            counts["invalid"] += 1
+        elif key in seen:
+            counts["duplicates"] += 1
+        else:
+            seen.add(key)
+            out.append({**m, "framework": key[0], "control": key[1]})
+    return out
+
+def _ask_batch(texts: List[str]) -> List[List[Dict]]:
+    """Mappings for each text; one text uses the plain prompt, several the packed one."""
+    if len(texts) == 1:
+        llm = openai_chat(system=PROMPT, user=texts[0], json_mode=True)
+        return [llm.get("mappings", []) or []]
+
+    user = "\n\n".join(f"=== SECTION {n} ===\n{t}" for n, t in enumerate(texts, start=1))
+    llm = openai_chat(system=PACKED_PROMPT, user=user, json_mode=True)
+    out: List[List[Dict]] = [[] for _ in texts]
+    for r in llm.get("results", []) or []:
+        try:
+            n = int(r.get("section"))
+        except (TypeError, ValueError, AttributeError):
+            continue
+        if 1 <= n <= len(texts):
+            out[n - 1].extend(r.get("mappings", []) or [])
+    return out
+
+def map_controls(filtered: List[Dict], concurrency: Optional[int] = None,
+                 stats: Optional[Dict] = None) -> List[Dict]:
+    """
+    Attach rule and LLM mappings to every kept section.
+
+    Rules run first; a section whose rule confidence reaches
+    MAPPING_RULE_THRESHOLD keeps its rule mappings and skips the LLM. The
+    rest are cut into units of at most MAPPING_BATCH_TOKENS (large ones span
+    several units, so nothing is truncated); units are then packed into
+    multi-section requests, so many small sections share one LLM call.
+    Every mapping is checked against the control catalog and deduplicated.
+    """
+    # Flatten every kept section across documents so the LLM calls fan out together
+    sections = [sec for item in filtered for sec in item["kept_sections"]]
+    rules = [_rule_matches(sec.get("text", "")) for sec in sections]
+    rule_only = [bool(hits) and confidence >= MAPPING_RULE_THRESHOLD for hits, confidence in rules]
+
+    units: List[Tuple[int, str]] = []  # (section index, text part)
+    for si, sec in enumerate(sections):
+        if rule_only[si]:
+            continue
+        for part in split_text(sec.get("text", ""), MAPPING_BATCH_TOKENS):
+            units.append((si, part))
+    batches = pack([count_tokens(t) for _, t in units], MAPPING_BATCH_TOKENS, MAPPING_BATCH_MAX_SECTIONS)
+
+    answers = llm_map(lambda b: _ask_batch([units[u][1] for u in b]), batches, concurrency)
+    llm_by_section: List[List[Dict]] = [[] for _ in sections]
+    for batch, results in zip(batches, answers):
+        for u, mappings in zip(batch, results):
+            llm_by_section[units[u][0]].extend(mappings)
+
+    # rule hits first, so theirs is the reason kept for a control both found;
+    # parts of one split section may repeat a mapping; keep it once
+    counts = {"invalid": 0, "duplicates": 0}
+    combined = [_validate(hits + llm, counts) for (hits, _), llm in zip(rules, llm_by_section)]
+
+    if stats is not None:
+        parts_per_section = [0] * len(sections)
+        for si, _ in units:
+            parts_per_section[si] += 1
+        stats.update({
+            "sections": len(sections),
+            "rule_only_sections": sum(rule_only),
+            "llm_sections": len(sections) - sum(rule_only),
+            "llm_calls": len(batches),
+            "packed_calls": sum(len(b) > 1 for b in batches),
+            "split_sections": sum(n > 1 for n in parts_per_section),
+            "invalid_mappings": counts["invalid"],
+            "duplicate_mappings": counts["duplicates"],
+        })
+
+    combined = iter(combined)
 
-def map_controls(filtered: List[Dict]) -> List[Dict]:
     mapped_items = []
     for item in filtered:
         new_sections = []
         for sec in item["kept_sections"]:
-            text = sec.get("text", "")
-            rule_hits = _rule_matches(text)
-
-            llm = openai_chat(
-                system=PROMPT,
-                user=text[:6000],
-                json_mode=True
-            )
-            llm_mappings = llm.get("mappings", [])
-            combined = rule_hits + llm_mappings
-
             new_sections.append({
                 **sec,
-                "mappings": combined
+                "mappings": next(combined)
             })
 
         mapped_items.append({
@@ -0,0 +1,88 @@
+import re, bisect
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Tuple
+
+# Markdown headings, including the "## [Page N]" markers written by extraction
+HEADING_RE = re.compile(r"^#{1,6}[ \t]+(.+?)[ \t]*#*$", re.MULTILINE)
+
+_CAPTURING_GROUP = re.compile(r"(?<!\\)\((?!\?)")
+
+
+def _non_capturing(pattern: str) -> str:
+    # inner groups would shadow the per-term group reported by m.lastgroup
+    return _CAPTURING_GROUP.sub("(?:", pattern)
+
+
+def literal_pattern(term: str) -> str:
+    """Regex for a plain ontology term: whole words, flexible inner whitespace/hyphens."""
+    parts = [re.escape(p) for p in re.split(r"[\s-]+", term.strip()) if p]
+    body = r"[\s-]+".join(parts)
+    lead = r"\b" if re.match(r"\w", term.strip()) else ""
+    tail = r"\b" if re.search(r"\w$", term.strip()) else ""
+    return f"{lead}{body}{tail}"
+
+
+def section_bounds(text: str) -> List[Tuple[int, str]]:
+    """(start offset, title) of every heading-delimited section, in order."""
+    bounds = [(0, "")]
+    for m in HEADING_RE.finditer(text):
+        if m.start() == 0:
+            bounds[0] = (0, m.group(1))
+        else:
+            bounds.append((m.start(), m.group(1)))
+    return bounds
+
+
+@dataclass
+class ScanResult:
+    include_hits: Dict[str, int] = field(default_factory=dict)
+    exclude_hits: Dict[str, int] = field(default_factory=dict)
+    # one entry per section: {"title", "start", "end", "hits"}
+    sections: List[Dict] = field(default_factory=list)
+
+    @property
+    def total_hits(self) -> int:
+        return sum(self.include_hits.values())
+
+    @property
+    def distinct_terms(self) -> int:
+        return len(self.include_hits)
+
+    @property
+    def total_excludes(self) -> int:
+        return sum(self.exclude_hits.values())
+
+
+class TermMatcher:
+    """
+    All include/exclude terms compiled into one alternation of named groups,
+    so a document is scanned once regardless of how many terms there are.
+    Each match is attributed to its term (via m.lastgroup) and to its section
+    (by bisecting the heading offsets).
+    """
+
+    def __init__(self, include: Sequence[Tuple[str, str]], exclude: Sequence[Tuple[str, str]] = ()):
+        self._labels: Dict[str, Tuple[str, bool]] = {}
+        alts = []
+        for prefix, terms, is_exclude in (("e", exclude, True), ("i", include, False)):
+            # excludes first: "personnel only" must win over any shorter include
+            for n, (label, pattern) in enumerate(terms):
+                group = f"{prefix}{n}"
+                self._labels[group] = (label, is_exclude)
+                alts.append(f"(?P<{group}>{_non_capturing(pattern)})")
+        self.pattern = re.compile("|".join(alts) or r"(?!x)x", re.IGNORECASE)
+
+    def scan(self, text: str) -> ScanResult:
+        bounds = section_bounds(text)
+        starts = [b[0] for b in bounds]
+        res = ScanResult(sections=[
+            {"title": title, "start": start, "end": starts[i + 1] if i + 1 < len(starts) else len(text), "hits": 0}
+            for i, (start, title) in enumerate(bounds)
+        ])
+        for m in self.pattern.finditer(text):
+            label, is_exclude = self._labels[m.lastgroup]
+            target = res.exclude_hits if is_exclude else res.include_hits
+            target[label] = target.get(label, 0) + 1
+            if not is_exclude:
+                res.sections[bisect.bisect_right(starts, m.start()) - 1]["hits"] += 1
+        return res
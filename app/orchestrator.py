@@ -1,86 +1,324 @@
 # app/orchestrator.py
-import os
+import os, re
 from datetime import datetime
 from pathlib import Path
-from typing import Dict
+from typing import Any, Callable, Dict, List, Optional
 
-from discovery import discover_sources
+from discovery import discover_sources, merge_sources
 from extraction import extract_all
-from relevance import filter_relevant
-from mapping import map_controls
+from incremental import filter_relevant_incremental, map_controls_incremental
 from summarization import build_summary
-from publishing import publish_as_pr_via_mcp
-from utils import ensure_dir, write_text, run_id_str
+from utils import ensure_dir, run_id_str, stats_delta, ARTIFACTS_DIR
+from artifacts import FileManifest, get_store
+from search import get_search_index
+from doc_cache import get_doc_cache
+from llm_scheduler import get_scheduler
+from state import get_state, item_hash
+from checkpoints import RunCheckpoints, find_run
+from streaming import PIPELINE_MODE, STREAM_STAGES, run_stream, merge_stats
+from taskqueue import TaskQueue
+from workers import PIPELINE_WORKERS, run_queued
+from telemetry import metrics, span, trace_run
+from llm_cache import get_llm_cache, bypass as llm_cache_bypass, hit_rate as llm_cache_hit_rate
 from dotenv import load_dotenv
 load_dotenv()
 
-ARTIFACTS_DIR = Path(os.getenv("ARTIFACTS_DIR", "./artifacts")).resolve()
 
+# progress(stage, event) is called as stages start and finish
+ProgressFn = Callable[[str, Dict[str, Any]], None]
 
-def _read_text(path: Path) -> str:
-    return path.read_text(encoding="utf-8")
 
+def _noop_progress(stage: str, event: Dict[str, Any]):
+    pass
 
-def run_workflow(topic: str, limit: int = 10, dry_run: bool = False):
-    rid = run_id_str()
-    run_dir = ARTIFACTS_DIR / rid
+
+def _topic_slug(topic: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", topic.lower()).strip("-")[:60] or "topic"
+
+
+def run_workflow(topic: str = "NIST SP 800 updates", limit: int = 10, dry_run: bool = False,
+                 bypass_llm_cache: bool = False, full_refresh: bool = False, resume: Optional[str] = None,
+                 progress: Optional[ProgressFn] = None, stream_summary: bool = False,
+                 topics: Optional[List[str]] = None, workers: Optional[int] = None):
+    """
+    `resume` is the run_id of an earlier run: its finished stages are loaded
+    from their checkpoints and the run continues at the first unfinished one
+    (topic and limit are taken from that run).
+
+    With `stream_summary`, the brief is streamed from the LLM and its text is
+    passed to `progress` as it arrives: ("summary", {"status": "token",
+    "text": ...}), or {"status": "token_reset"} when a retry starts over.
+
+    `topics` makes this a batch run: every topic is discovered (up to `limit`
+    sources each), the results are merged, each unique document is
+    extracted, judged and mapped once, and then one brief is written per
+    topic from that topic's share of the documents. `topic` is ignored.
+
+    `workers` > 0 (default PIPELINE_WORKERS) runs extraction, relevance and
+    mapping as per-document tasks in the durable task queue, worked by that
+    many processes; resuming such a run only redoes unfinished tasks.
+    """
+    if topics is not None:
+        topics = list(dict.fromkeys(t.strip() for t in topics if t.strip()))
+        if not topics:
+            raise ValueError("topics is empty")
+    with llm_cache_bypass(bypass_llm_cache), trace_run() as trace:
+        try:
+            result = _run_workflow(topics or [topic], limit, dry_run, full_refresh, resume,
+                                   progress or _noop_progress, stream_summary, batch=topics is not None,
+                                   workers=PIPELINE_WORKERS if workers is None else workers)
+        except Exception:
+            metrics.inc("runs_total", 1, "Pipeline runs by outcome", status="failed")
+            raise
+        metrics.inc("runs_total", 1, "Pipeline runs by outcome", status="succeeded")
+        # Wall time, time per stage and per span kind, bytes, tokens and estimated cost
+        result["telemetry"] = trace.summary()
+        return result
+
+
+def _run_workflow(topics: List[str], limit: int, dry_run: bool, full_refresh: bool, resume: Optional[str],
+                  progress: ProgressFn, stream_summary: bool = False, batch: bool = False, workers: int = 0):
+    if resume:
+        ckpt = find_run(resume)
+        if ckpt is None:
+            raise ValueError(f"Unknown run {resume!r}")
+        rid = resume
+        params = ckpt.load_params()
+        batch = "topics" in params
+        topics = params["topics"] if batch else [params["topic"]]
+        limit, date_iso = params["limit"], params["date"]
+    else:
+        rid = run_id_str()
+        ckpt = RunCheckpoints(ARTIFACTS_DIR / rid)
+        date_iso = datetime.utcnow().date().isoformat()
+        ckpt.save_params({"run_id": rid, **({"topics": topics} if batch else {"topic": topics[0]}),
+                          "limit": limit, "date": date_iso})
+    resumed = []
+    progress("run", {"status": "started", "run_id": rid, "resumed_from": ckpt.completed() if resume else []})
+    run_dir = ckpt.run_dir
     sources_dir = run_dir / "sources"
     ensure_dir(sources_dir)
+    doc_cache = get_doc_cache()
+    doc_cache_before = doc_cache.stats() if doc_cache else {}
+    llm_cache = get_llm_cache()
+    llm_cache_before = llm_cache.stats() if llm_cache else {}
+    scheduler_before = get_scheduler().stats()
+    store = get_store()
+    store_before = store.stats()
+
+    def checkpointed(stage: str, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        data = ckpt.load(stage) if ckpt.has(stage) else None
+        if data is not None:
+            resumed.append(stage)
+            progress(stage, {"status": "resumed"})
+            return data
+        with span("stage", stage):
+            data = compute()
+        ckpt.save(stage, data)
+        return data
 
     # 1) Discover
-    sources = discover_sources(topic=topic, limit=limit)
+    def discover():
+        progress("discover", {"status": "started"})
+        if not batch:
+            stats: Dict = {}
+            sources = discover_sources(topic=topics[0], limit=limit, stats=stats)
+            progress("discover", {"status": "done", "found": len(sources)})
+            return {"sources": sources, "stats": stats}
+        found, stats = [], {}
+        for t in topics:
+            part: Dict = {}
+            found.append(discover_sources(topic=t, limit=limit, stats=part))
+            merge_stats(stats, part)
+        # a document several topics found is processed once
+        sources, topic_sources = merge_sources(found)
+        stats["unique_sources"] = len(sources)
+        stats["shared_across_topics"] = sum(len(ids) for ids in topic_sources) - len(sources)
+        progress("discover", {"status": "done", "found": len(sources)})
+        return {"sources": sources, "stats": stats, "topic_sources": topic_sources}
+
+    stage = checkpointed("discover", discover)
+    sources, discovery_stats = stage["sources"], stage.get("stats", {})
+    topic_sources = stage.get("topic_sources") or [[s["id"] for s in sources]]
+
+    state = get_state()
+    streamed: Dict[str, Dict] = {}
+    if not any(ckpt.has(st) for st in STREAM_STAGES):
+        if workers > 0:
+            # 2-4) Per-document tasks in the durable queue, worked by a pool of processes
+            streamed = run_queued(rid, sources, sources_dir, workers, reuse=not full_refresh, progress=progress)
+        elif PIPELINE_MODE == "stream":
+            # 2-4) Extraction, relevance and mapping overlap; each document moves on when it is ready
+            streamed = run_stream(sources, sources_dir, state, reuse=not full_refresh, progress=progress)
+    if streamed:
+        state.record_sources(streamed["extract"]["extracted"], rid)
+        for st in STREAM_STAGES:
+            ckpt.save(st, streamed[st])
+        if workers > 0:
+            TaskQueue().purge(rid)  # the checkpoints hold the results now
 
     # 2) Extract
-    extracted = extract_all(sources, out_dir=sources_dir)
+
+    def extract():
+        progress("extract", {"status": "started", "sources": len(sources)})
+        stats: Dict = {}
+        extracted = extract_all(sources, out_dir=sources_dir, stats=stats)
+        progress("extract", {"status": "done", "extracted": len(extracted)})
+        # Only new or changed content goes through the LLM stages
+        return {"extracted": extracted, "changes": state.classify(extracted), "stats": stats}
+
+    stage = streamed.get("extract") or checkpointed("extract", extract)
+    extracted, changes, extraction_stats = stage["extracted"], stage["changes"], stage["stats"]
 
     # 3) Relevance filter
-    filtered = filter_relevant(extracted)
+    def relevance():
+        progress("relevance", {"status": "started", "documents": len(extracted)})
+        stats: Dict = {}
+        filtered = filter_relevant_incremental(extracted, state, reuse=not full_refresh, stats=stats)
+        progress("relevance", {"status": "done", "kept": len(filtered)})
+        return {"filtered": filtered, "stats": stats}
+
+    stage = streamed.get("relevance") or checkpointed("relevance", relevance)
+    filtered, relevance_stats = stage["filtered"], stage["stats"]
 
     # 4) Control mapping
-    mapped = map_controls(filtered)
+    def mapping():
+        progress("mapping", {"status": "started", "sections": sum(len(it["kept_sections"]) for it in filtered)})
+        stats: Dict = {}
+        mapped = map_controls_incremental(filtered, state, reuse=not full_refresh, stats=stats)
+        state.record_sources(extracted, rid)
+        progress("mapping", {"status": "done", "llm_calls": stats.get("llm_calls", 0)})
+        return {"mapped": mapped, "stats": stats}
+
+    stage = streamed.get("mapping") or checkpointed("mapping", mapping)
+    mapped, mapping_stats = stage["mapped"], stage["stats"]
+
+    # 5) Summarize (one page per topic)
+    memo: Dict[str, Dict] = {}  # per-source summaries, shared by the topics of a batch
+
+    def summarize(n: int, topic: str, items: List[Dict], slug: str) -> Dict[str, Any]:
+        label = {"topic": topic} if batch else {}
+
+        def summary_token(text: Optional[str]):
+            progress("summary", {"status": "token", "text": text, **label} if text is not None
+                     else {"status": "token_reset", **label})
 
-    # 5) Summarize (one page)
-    date_iso = datetime.utcnow().date().isoformat()
-    summary_md, summary_filename, meta = build_summary(mapped, date_iso)
+        def summary():
+            progress("summary", {"status": "started", **label})
+            summary_md, summary_filename, meta = build_summary(items, date_iso, state, reuse=not full_refresh,
+                                                               on_token=summary_token if stream_summary else None,
+                                                               memo=memo)
+            if batch:
+                summary_filename = f"{date_iso}-{slug}-summary.md"
+            progress("summary", {"status": "done", **label, "summary_file": f"docs/summaries/{summary_filename}"})
+            return {"markdown": summary_md, "filename": summary_filename, "meta": meta}
 
-    # Persist artifacts to local working tree (so you can inspect / CI capture)
-    summary_path = Path("docs/summaries") / summary_filename
-    write_text(summary_path, summary_md)
+        return checkpointed(f"summary-{n + 1}" if batch else "summary", summary)
+
+    briefs, slugs = [], []
+    for n, (t, ids) in enumerate(zip(topics, topic_sources)):
+        slug = _topic_slug(t)
+        slug = f"{slug}-{n + 1}" if slug in slugs else slug
+        slugs.append(slug)
+        # the topic's own documents, in its own ranking order
+        pos = {sid: i for i, sid in enumerate(ids)}
+        items = sorted((it for it in mapped if it["id"] in pos), key=lambda it: pos[it["id"]])
+        stage = summarize(n, t, items, slug)
+        briefs.append({"topic": t, "found": len(ids), "kept": len(items), **stage})
+
+    # Persist artifacts to local working tree (so you can inspect / CI capture).
+    # Copies of the artifact store's blobs (reflinked where possible), so editing them leaves the store alone.
+    # 6) The same files for the MCP PR (path -> content), read from the store only if the run publishes
+    files_for_pr = FileManifest(store)
+    summary_paths = []
+    for b in briefs:
+        sha = store.put(b["markdown"])
+        summary_path = store.export(sha, Path("docs/summaries") / b["filename"])
+        files_for_pr.entries[str(summary_path)] = sha
+        summary_paths.append(summary_path)
 
     # Also persist raw per-source markdown (organized by date)
     raw_dir = Path(f"sources/{date_iso}")
-    ensure_dir(raw_dir)
     for item in extracted:
-        fn = f"{item['id']}.md"
-        write_text(raw_dir / fn, item["markdown"])
+        sha = store.put(item["markdown"]) if "markdown" in item else item_hash(item)  # older checkpoints
+        files_for_pr.entries[str(store.export(sha, raw_dir / f"{item['id']}.md"))] = sha
 
-    # 6) Prepare files for MCP PR (path->content)
-    files_for_pr: Dict[str, str] = {
-        str(summary_path): _read_text(summary_path),
-    }
-    for p in raw_dir.glob("*.md"):
-        files_for_pr[str(p)] = _read_text(p)
+    if batch:
+        meta: Dict[str, Any] = {"topics": [], "summarization": {}}
+        for b, path in zip(briefs, summary_paths):
+            meta["topics"].append({"topic": b["topic"], "summary_file": str(path), **b["meta"]})
+            merge_stats(meta["summarization"], b["meta"]["summarization"])
+    else:
+        meta = briefs[0]["meta"]
+    if discovery_stats:
+        meta["discovery"] = discovery_stats
+    if extraction_stats:
+        meta["extraction"] = extraction_stats
+    meta["relevance"] = relevance_stats
+    meta["mapping"] = mapping_stats
+    if mapping_stats.get("sections"):
+        # of the sections mapped in this run, the share the rules handled without an LLM call
+        meta["mapping"]["deterministic_share"] = round(
+            mapping_stats.get("rule_only_sections", 0) / mapping_stats["sections"], 3)
+    if doc_cache:
+        meta["doc_cache"] = stats_delta(doc_cache.stats(), doc_cache_before)
+    meta["artifacts"] = stats_delta(store.stats(), store_before)
+    search_index = get_search_index()
+    if search_index:
+        # sources (with their mapped controls) and briefs become searchable across runs
+        meta["search_index"] = search_index.add_run(
+            rid, date_iso, extracted, mapped,
+            [(str(path), b["topic"], b["markdown"]) for b, path in zip(briefs, summary_paths)])
+    if llm_cache:
+        meta["llm_cache"] = stats_delta(llm_cache.stats(), llm_cache_before)
+        meta["llm_cache"]["hit_rate"] = llm_cache_hit_rate(meta["llm_cache"])
+    scheduler_now = get_scheduler().stats()
+    meta["llm_scheduler"] = {**stats_delta(scheduler_now, scheduler_before),
+                             "concurrency_limit": scheduler_now["concurrency_limit"]}
 
     pr_url = None
     if not dry_run:
-        branch_name = f"feat/nist-summary-{date_iso}-{rid}"
-        pr_body = f"Automated summary for {date_iso}\n\nRun: `{rid}`"
-        pr_url = publish_as_pr_via_mcp(
-            branch=branch_name,
-            title=f"NIST SP 800 Updates – {date_iso}",
-            body=pr_body,
-            files=files_for_pr,
-            commit_message=f"chore: ingest NIST summary for {date_iso}",
-            base=os.getenv("GITHUB_BASE", "main"),
-        )
+        def publish():
+            # fastmcp is only loaded by runs that actually publish
+            from publishing import publish_as_pr_via_mcp
+
+            progress("publish", {"status": "started", "files": len(files_for_pr)})
+            branch_name = f"feat/nist-summary-{date_iso}-{rid}"
+            pr_body = f"Automated summary for {date_iso}\n\nRun: `{rid}`"
+            if batch:
+                pr_body += "\n\nTopics:\n" + "\n".join(f"- {t}" for t in topics)
+            stats: Dict = {}
+            url = publish_as_pr_via_mcp(
+                branch=branch_name,
+                title=f"NIST SP 800 Updates – {date_iso}",
+                body=pr_body,
+                files=files_for_pr,
+                commit_message=f"chore: ingest NIST summary for {date_iso}",
+                base=os.getenv("GITHUB_BASE", "main"),
+                stats=stats,
+            )
+            progress("publish", {"status": "done", "pr_url": url})
+            return {"pr_url": url, "stats": stats}
+
+        stage = checkpointed("publish", publish)
+        pr_url, meta["publish"] = stage["pr_url"], stage["stats"]
 
+    if batch:
+        per_topic = {"topics": [{"topic": b["topic"], "found": b["found"], "kept": b["kept"], "summary_file": str(path)}
+                                for b, path in zip(briefs, summary_paths)]}
+    else:
+        per_topic = {"topic": topics[0], "summary_file": str(summary_paths[0])}
     return {
         "run_id": rid,
-        "topic": topic,
+        **per_topic,
         "found": len(sources),
         "extracted": len(extracted),
         "kept": len(mapped),
-        "summary_file": str(summary_path),
+        "changes": {
+            status: [it["url"] for it in extracted if changes[it["id"]] == status]
+            for status in ("new", "changed", "unchanged")
+        },
         "pr_url": pr_url,
+        "resumed_stages": resumed,
         "meta": meta,
     }
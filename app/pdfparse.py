@@ -0,0 +1,195 @@
+import os, re, sys, time, threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from telemetry import span
+load_dotenv()
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+# Below this many pages a process pool costs more than it saves
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+
+
+def _parse_range(spec: str) -> Optional[Tuple[int, int]]:
+    # "10-40", "10-", "-40" or "7"
+    m = re.fullmatch(r"\s*(\d*)\s*(?:-\s*(\d*))?\s*", spec or "")
+    if not m or not (m.group(1) or m.group(2)):
+        return None
+    first = int(m.group(1)) if m.group(1) else 1
+    last = int(m.group(2)) if m.group(2) else (first if m.group(2) is None else 0)
+    return first, last  # last == 0 means "to the end"
+
+
+@dataclass(frozen=True)
+class PdfOptions:
+    """
+    Page selection and budgets for one PDF.
+
+    page_range: 1-based inclusive (first, last); last == 0 means the final page.
+    max_pages:  stop after this many pages (0 = no limit).
+    time_budget: seconds per document (0 = no limit); pages finished in time are kept.
+    """
+    page_range: Optional[Tuple[int, int]] = None
+    max_pages: int = 0
+    time_budget: float = 0.0
+    workers: int = PDF_WORKERS
+
+    @classmethod
+    def from_env(cls) -> "PdfOptions":
+        return cls(
+            page_range=_parse_range(os.getenv("PDF_PAGE_RANGE", "")),
+            max_pages=int(os.getenv("PDF_MAX_PAGES", "0")),
+            time_budget=float(os.getenv("PDF_TIME_BUDGET", "0")),
+            # read at call time: queue workers lower it to their share (workers.run_worker)
+            workers=PDF_WORKERS,
+        )
+
+    def cache_kind(self) -> str:
+        """Markdown cache key suffix; the defaults keep the plain 'pdf' kind."""
+        kind = "pdf"
+        if self.page_range:
+            kind += f"-p{self.page_range[0]}-{self.page_range[1]}"
+        if self.max_pages:
+            kind += f"-m{self.max_pages}"
+        return kind
+
+
+def _page_md(number: int, text: str) -> str:
+    return f"\n\n## [Page {number}]\n\n{text}\n"
+
+
+def _extract_pages(path: str, numbers: List[int], deadline: Optional[float] = None) -> Tuple[List[str], float]:
+    """
+    Render the given 1-based pages of the file at `path`.
+
+    Runs in pool workers as well as inline; returns the page markdown and
+    the peak RSS of the process that did the work. `deadline` is a
+    time.time() value, so it holds across processes: a batch stops at the
+    first page it reaches after the document's budget ran out.
+    """
+    import pdfplumber  # loaded by the first PDF, not at startup
+
+    out = []
+    with pdfplumber.open(path) as pdf:
+        for n in numbers:
+            if deadline and time.time() > deadline:
+                break
+            page = pdf.pages[n - 1]
+            out.append(_page_md(n, page.extract_text() or ""))
+            # drop pdfplumber's per-page layout cache so memory stays flat
+            page.close()
+    return out, _peak_rss_mb()
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    One pool per process, rebuilt when a caller asks for a different size;
+    forkserver keeps children clear of our threads' locks.
+    """
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is not None and _pool_size != workers:
+            # batches already submitted (another document's) still finish in the old pool
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            method = "forkserver" if sys.platform != "win32" else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context(method))
+            _pool_size = workers
+        return _pool
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """High-water mark of this process over its lifetime, not of one document."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def pdf_to_markdown(path: str, opts: Optional[PdfOptions] = None) -> Tuple[str, Dict]:
+    """
+    Render a PDF on disk as markdown with `## [Page N]` markers, in page order.
+
+    Large documents are split into page batches extracted across a process
+    pool; every worker opens the file by path, so nothing but text crosses
+    the process boundary. Returns (markdown, stats).
+    """
+    with span("pdf_parse") as sp:
+        sp.add(bytes=os.path.getsize(path))
+        return _pdf_to_markdown(path, opts or PdfOptions.from_env())
+
+
+def _pdf_to_markdown(path: str, opts: PdfOptions) -> Tuple[str, Dict]:
+    t0 = time.perf_counter()
+    deadline = time.time() + opts.time_budget if opts.time_budget else None
+
+    import pdfplumber
+    with pdfplumber.open(path) as pdf:
+        total = len(pdf.pages)
+
+    first, last = opts.page_range or (1, 0)
+    first = max(1, first)
+    last = total if not last else min(last, total)
+    numbers = list(range(first, last + 1))
+    if opts.max_pages:
+        numbers = numbers[:opts.max_pages]
+
+    parallel = opts.workers > 1 and len(numbers) >= PDF_PARALLEL_MIN_PAGES
+
+    parts: List[str] = []
+    worker_rss = 0.0
+    if parallel:
+        batches = [numbers[i:i + PDF_PAGES_PER_TASK] for i in range(0, len(numbers), PDF_PAGES_PER_TASK)]
+        pool = _get_pool(opts.workers)
+        futures = [pool.submit(_extract_pages, str(path), b, deadline) for b in batches]
+        for b, fut in zip(batches, futures):
+            try:
+                # a little past the deadline: workers check it between pages and return what they have
+                timeout = max(0.0, deadline - time.time()) + 5.0 if deadline else None
+                batch, rss = fut.result(timeout=timeout)
+            except FutureTimeout:
+                break
+            parts.extend(batch)
+            worker_rss = max(worker_rss, rss or 0.0)
+            if len(batch) < len(b):
+                # out of time; later batches would leave a gap in the page order
+                break
+        for fut in futures:
+            fut.cancel()
+    else:
+        parts, _ = _extract_pages(str(path), numbers, deadline)
+
+    done = len(parts)
+    timed_out = done < len(numbers)
+    md = "\n".join(parts).strip()
+    if timed_out:
+        md += f"\n\n_Extraction stopped after {done} of {len(numbers)} pages (time budget)._"
+
+    elapsed = time.perf_counter() - t0
+    stats = {
+        "pages_total": total,
+        "pages_extracted": done,
+        "truncated": timed_out or done < total,
+        "timed_out": timed_out,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(done / elapsed, 1) if elapsed > 0 else None,
+        "workers": opts.workers if parallel else 1,
+        # lifetime high-water marks of the processes involved, not this document's own use
+        "process_peak_rss_mb": _peak_rss_mb(),
+        "worker_process_peak_rss_mb": worker_rss or None,
+    }
+    return md, stats
@@ -1,11 +1,31 @@
 import os
 import json
+import time
+import hashlib
+import posixpath
 import asyncio
-from typing import Dict, Optional, Any, List
+from typing import Dict, Mapping, Optional, Any, List, Tuple
 
-from fastmcp import Client
+from fastmcp import Client, FastMCP
 from fastmcp.client.transports import StreamableHttpTransport
 
+import replay
+from telemetry import span
+
+# Parallel MCP calls for remote lookups and (without push_files) file writes
+MCP_PUBLISH_CONCURRENCY = int(os.getenv("MCP_PUBLISH_CONCURRENCY", "4"))
+# How long a server's list_tools answer is reused
+MCP_TOOLS_TTL = int(os.getenv("MCP_TOOLS_TTL", "3600"))
+
+# url -> (fetched_at, tools); shared by every publisher in the process
+_TOOLS_CACHE: Dict[str, Tuple[float, List[Any]]] = {}
+
+
+def git_blob_sha(content: str) -> str:
+    """The SHA GitHub reports for a file with this content."""
+    data = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
 
 class MCPGitHubPublisher:
     """
@@ -18,11 +38,16 @@ class MCPGitHubPublisher:
       - MCP_GITHUB_TOKEN=<PAT or GitHub App installation token with repo write>
 
     Notes:
-      * Remote-only (no local/stdio path).
+      * Remote-only (no local/stdio path); benchmarks may pass an in-process
+        server as `transport` instead.
       * The server must expose 'repos' and 'pull_requests' toolsets.
     """
 
-    def __init__(self):
+    def __init__(self, transport: Any = None):
+        # Optional pre-built transport (or in-process server) instead of MCP_GITHUB_URL
+        self._transport = transport
+        self.stats: Dict[str, Any] = {}
+
         # target repo
         self.repo_slug = os.getenv("GITHUB_REPO")
         if not self.repo_slug or "/" not in self.repo_slug:
@@ -50,6 +75,18 @@ class MCPGitHubPublisher:
             headers={"Authorization": f"Bearer {self.auth_token}"},
         )
 
+    async def _list_tools(self, client: Client) -> List[Any]:
+        # Reuse the tool list across publishes; the server's toolset rarely changes
+        key = self.url if self._transport is None else f"local:{id(self._transport)}"
+        cached = _TOOLS_CACHE.get(key)
+        if cached and time.time() - cached[0] < MCP_TOOLS_TTL:
+            return cached[1]
+        tools = await replay.acall("mcp", {"tool": "list_tools"}, client.list_tools,
+                                   encode=lambda ts: [{"name": self._tool_name(t)} for t in ts])
+        self.stats["tool_calls"] = self.stats.get("tool_calls", 0) + 1
+        _TOOLS_CACHE[key] = (time.time(), tools)
+        return tools
+
     @staticmethod
     def _tool_name(tool_obj: Any) -> Optional[str]:
         """
@@ -94,8 +131,17 @@ class MCPGitHubPublisher:
                 names.append(n)
         return ", ".join(sorted(names)) if names else "(no tools reported)"
 
+    @classmethod
+    async def _call(cls, client: Client, tool_name: str, args: dict) -> Any:
+        # Recorded/replayed by tool and path: branch names and PR bodies carry the run id
+        with span("mcp", tool_name) as sp:
+            value = await replay.acall("mcp", {"tool": tool_name, "path": args.get("path")},
+                                       lambda: cls._invoke(client, tool_name, args))
+            sp.add(bytes=len(json.dumps(args, default=str)) + len(json.dumps(value, default=str)))
+        return value
+
     @staticmethod
-    async def _call(client: Client, tool_name: str, args: dict) -> Any:
+    async def _invoke(client: Client, tool_name: str, args: dict) -> Any:
         result = await client.call_tool(tool_name, args)
         if not result or not result.content:
             return None
@@ -113,57 +159,148 @@ class MCPGitHubPublisher:
         # Some servers might return 'blob' or other types; just return repr
         return getattr(c, "text", None) or getattr(c, "data", None) or str(c)
 
+    @staticmethod
+    def _repo_path(path: str) -> str:
+        return str(path).replace("\\", "/").lstrip("./")
+
+    async def _remote_shas(self, client: Client, tool: Optional[str], paths: List[str], ref: str,
+                           sem: asyncio.Semaphore) -> Dict[str, Optional[str]]:
+        """
+        Blob SHAs of `paths` on `ref`, one directory listing per parent
+        directory rather than one lookup per file. Paths missing from the
+        listing (or a listing the server could not give) map to None.
+        """
+        shas: Dict[str, Optional[str]] = {p: None for p in paths}
+        if not tool:
+            return shas
+
+        async def listing(directory: str):
+            async with sem:
+                self.stats["tool_calls"] = self.stats.get("tool_calls", 0) + 1
+                try:
+                    entries = await self._call(client, tool, {
+                        "owner": self.owner,
+                        "repo": self.repo,
+                        "path": directory or "/",
+                        "ref": ref,
+                    })
+                except Exception:
+                    return  # directory does not exist yet: everything in it is new
+            if not isinstance(entries, list):
+                return
+            for e in entries:
+                if isinstance(e, dict) and isinstance(e.get("sha"), str):
+                    path = e.get("path") or posixpath.join(directory, e.get("name", ""))
+                    if path in shas:
+                        shas[path] = e["sha"]
+
+        await asyncio.gather(*(listing(d) for d in sorted({posixpath.dirname(p) for p in paths})))
+        return shas
+
     async def publish_as_pr(
         self,
         branch: str,
         title: str,
         body: str,
-        files: Dict[str, str],
+        files: Mapping[str, str],
         commit_message: Optional[str] = None,
         base: Optional[str] = None,
-    ) -> str:
+    ) -> Optional[str]:
+        """
+        Open a PR with `files` on a new branch.
+
+        Files byte-identical to the base branch are skipped; the rest go in one
+        commit through push_files when the server offers it, otherwise as
+        parallel create_or_update_file calls. Returns the PR URL, or None when
+        nothing differs from the base branch.
+        """
         base = base or self.base
         commit_message = commit_message or title
+        self.stats = {"files": len(files), "tool_calls": 0}
 
-        transport = self._make_transport()
+        if self._transport is not None:
+            transport = self._transport
+        elif replay.replaying():
+            transport = FastMCP("github-replay")  # in-process; every call is served from fixtures
+        else:
+            transport = self._make_transport()
         client = Client(transport)
+        sem = asyncio.Semaphore(max(1, MCP_PUBLISH_CONCURRENCY))
 
         async with client:
-            tools = await client.list_tools()
+            tools = await self._list_tools(client)
 
             create_branch_tool = self._find_tool(tools, "create_branch")
             upsert_file_tool  = self._find_tool(tools, "create_or_update_file")
             create_pr_tool    = self._find_tool(tools, "create_pull_request")
+            push_files_tool   = self._find_tool(tools, "push_files")
+            get_file_tool     = self._find_tool(tools, "get_file_contents")
 
-            if not (create_branch_tool and upsert_file_tool and create_pr_tool):
+            if not (create_branch_tool and (upsert_file_tool or push_files_tool) and create_pr_tool):
                 available = self._debug_tool_names(tools)
                 raise RuntimeError(
                     "Required GitHub MCP tools not found. "
-                    "Needed: create_branch, create_or_update_file, create_pull_request. "
+                    "Needed: create_branch, create_or_update_file (or push_files), create_pull_request. "
                     f"Available tools: {available}"
                 )
 
-            # 1) Create branch from base
+            # 1) Drop files whose content already matches the base branch
+            by_path = {self._repo_path(p): c for p, c in files.items()}
+            remote = await self._remote_shas(client, get_file_tool, list(by_path), base, sem)
+            changed = {p: c for p, c in by_path.items() if remote.get(p) != git_blob_sha(c)}
+            self.stats["unchanged"] = len(by_path) - len(changed)
+            self.stats["written"] = len(changed)
+            if not changed:
+                self.stats["mode"] = "noop"
+                return None
+
+            # 2) Create branch from base
             await self._call(client, create_branch_tool, {
                 "owner": self.owner,
                 "repo": self.repo,
                 "branch": branch,
                 "from_branch": base,
             })
+            self.stats["tool_calls"] += 1
 
-            # 2) Create/update files on the branch
-            for path, content in files.items():
-                repo_path = str(path).replace("\\", "/").lstrip("./")
-                await self._call(client, upsert_file_tool, {
+            # 3) Write the changed files
+            if push_files_tool:
+                # one commit for everything
+                self.stats["mode"] = "push_files"
+                await self._call(client, push_files_tool, {
                     "owner": self.owner,
                     "repo": self.repo,
                     "branch": branch,
-                    "path": repo_path,
-                    "content": content,
+                    "files": [{"path": p, "content": c} for p, c in changed.items()],
                     "message": commit_message,
                 })
+                self.stats["tool_calls"] += 1
+            else:
+                self.stats["mode"] = "parallel"
+
+                async def upsert(path: str, content: str):
+                    args = {
+                        "owner": self.owner,
+                        "repo": self.repo,
+                        "branch": branch,
+                        "path": path,
+                        "content": content,
+                        "message": commit_message,
+                    }
+                    if remote.get(path):
+                        args["sha"] = remote[path]  # required by GitHub to update an existing file
+                    async with sem:
+                        self.stats["tool_calls"] += 1
+                        await self._call(client, upsert_file_tool, args)
+
+                results = await asyncio.gather(*(upsert(p, c) for p, c in changed.items()),
+                                               return_exceptions=True)
+                # concurrent commits to one branch can race; retry those one by one
+                for (p, c), r in zip(changed.items(), results):
+                    if isinstance(r, Exception):
+                        await upsert(p, c)
 
-            # 3) Open PR
+            # 4) Open PR
             pr = await self._call(client, create_pr_tool, {
                 "owner": self.owner,
                 "repo": self.repo,
@@ -173,6 +310,7 @@ class MCPGitHubPublisher:
                 "head": branch,
                 "draft": False,
             })
+            self.stats["tool_calls"] += 1
 
             if isinstance(pr, dict):
                 return pr.get("html_url") or pr.get("url") or json.dumps(pr, ensure_ascii=False)
@@ -185,9 +323,14 @@ def publish_as_pr_via_mcp(
     branch: str,
     title: str,
     body: str,
-    files: Dict[str, str],
+    files: Mapping[str, str],
     commit_message: Optional[str] = None,
     base: Optional[str] = None,
-) -> str:
+    stats: Optional[Dict[str, Any]] = None,
+) -> Optional[str]:
     pub = MCPGitHubPublisher()
-    return asyncio.run(pub.publish_as_pr(branch, title, body, files, commit_message, base))
+    try:
+        return asyncio.run(pub.publish_as_pr(branch, title, body, files, commit_message, base))
+    finally:
+        if stats is not None:
+            stats.update(pub.stats)
@@ -1,6 +1,14 @@
-import os, re
-from typing import List, Dict, Tuple
-from utils import openai_chat
+import os, re, yaml
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional
+from utils import openai_chat, llm_map, OPENAI_MODEL
+from llm_scheduler import estimate_tokens
+from matcher import TermMatcher, ScanResult, literal_pattern
+from chunking import chunk_markdown, count_tokens, split_sections, split_text
+from artifacts import item_text
+
+CONFIG_DIR = Path(__file__).parent / "config"
 
 # Quick heuristic filters
 KEY_TERMS = [
@@ -13,6 +21,24 @@ KEY_TERMS = [
     r"\bFedRAMP\b", r"\bprovenance\b", r"\bsigning\b", r"\bartifact\b",
 ]
 
+# Pre-LLM gate: "on" drops/trims documents by term hits, "off" sends everything in full
+RELEVANCE_GATE = os.getenv("RELEVANCE_GATE", "on").lower()
+# Fewer distinct terms than this -> skip the document without an LLM call
+RELEVANCE_MIN_TERMS = int(os.getenv("RELEVANCE_MIN_TERMS", "1"))
+# At least this many distinct terms -> full LLM review; in between -> cheap check
+RELEVANCE_FULL_TERMS = int(os.getenv("RELEVANCE_FULL_TERMS", "3"))
+# Cheap check sends only the matching sections, up to this many characters
+RELEVANCE_CHEAP_CHARS = int(os.getenv("RELEVANCE_CHEAP_CHARS", "6000"))
+# Full review covers the whole document in chunks of this many tokens
+RELEVANCE_CHUNK_TOKENS = int(os.getenv("RELEVANCE_CHUNK_TOKENS", "4000"))
+# "on": full review sends only the locally top-ranked sections (scoring.py), "off": the whole document
+RELEVANCE_RANKING = os.getenv("RELEVANCE_RANKING", "on").lower()
+# At most this many ranked sections and this many tokens per document
+RELEVANCE_TOP_K = int(os.getenv("RELEVANCE_TOP_K", "8"))
+RELEVANCE_TOKEN_BUDGET = int(os.getenv("RELEVANCE_TOKEN_BUDGET", "6000"))
+# Sections longer than this are ranked paragraph-aligned piece by piece
+RELEVANCE_SECTION_TOKENS = int(os.getenv("RELEVANCE_SECTION_TOKENS", "800"))
+
 PROMPT = """You are filtering regulatory text for **software/IT engineering relevance**.
 Keep sections that affect software development orgs: SDLC/SSDF, CI/CD, SAST/DAST, SBOM, supply-chain, IaC, containers/Kubernetes, cloud-native, handling CUI/PII in software, and mappings to 800-53/800-171/SSDF.
 
@@ -21,27 +47,161 @@ Return JSON with:
 Discard general policy prose unless it clearly impacts software teams.
 """
 
-def _heuristic_hit(md: str) -> bool:
-    hay = md.lower()
-    for pat in KEY_TERMS:
-        if re.search(pat, md, flags=re.IGNORECASE):
-            return True
-    return False
+@lru_cache(maxsize=1)
+def get_matcher() -> TermMatcher:
+    """KEY_TERMS plus ontology.yaml include/exclude terms, compiled once."""
+    with open(CONFIG_DIR / "ontology.yaml", "r", encoding="utf-8") as f:
+        ontology = yaml.safe_load(f) or {}
+
+    include = [(pat, pat) for pat in KEY_TERMS]
+    for term in ontology.get("include_terms") or []:
+        # skip ontology terms a KEY_TERMS regex already covers
+        if any(re.fullmatch(pat, term, flags=re.IGNORECASE) for pat in KEY_TERMS):
+            continue
+        include.append((term, literal_pattern(term)))
+    exclude = [(term, literal_pattern(term)) for term in ontology.get("exclude_terms") or []]
+    return TermMatcher(include, exclude)
+
+def stage_version() -> str:
+    """Changes whenever something that shapes filter_relevant's output changes."""
+    from state import version_hash
+    return version_hash(OPENAI_MODEL, PROMPT, RELEVANCE_GATE, str(RELEVANCE_MIN_TERMS),
+                        str(RELEVANCE_FULL_TERMS), str(RELEVANCE_CHEAP_CHARS), str(RELEVANCE_CHUNK_TOKENS),
+                        RELEVANCE_RANKING, str(RELEVANCE_TOP_K), str(RELEVANCE_TOKEN_BUDGET),
+                        str(RELEVANCE_SECTION_TOKENS), get_matcher().pattern.pattern,
+                        (CONFIG_DIR / "mappings.yaml").read_text(encoding="utf-8") if RELEVANCE_RANKING == "on" else "")
+
+def _gate(scan: ScanResult) -> str:
+    """"skip", "cheap" or "full" for one document."""
+    if RELEVANCE_GATE == "off":
+        return "full"
+    if scan.distinct_terms < RELEVANCE_MIN_TERMS:
+        return "skip"
+    if scan.total_excludes and scan.total_excludes >= scan.total_hits:
+        return "skip"
+    if scan.distinct_terms >= RELEVANCE_FULL_TERMS:
+        return "full"
+    return "cheap"
+
+def _matching_sections(md: str, scan: ScanResult, budget: int) -> str:
+    parts, used = [], 0
+    for sec in scan.sections:
+        if not sec["hits"]:
+            continue
+        text = md[sec["start"]:sec["end"]].strip()[:budget - used]
+        parts.append(text)
+        used += len(text)
+        if used >= budget:
+            break
+    return "\n\n".join(parts)
+
+def _rank_units(md: str) -> List[str]:
+    return [piece for sec in split_sections(md) for piece in split_text(sec["text"], RELEVANCE_SECTION_TOKENS)]
+
+def _rank(docs: List[str]) -> List[Tuple[List[str], List[int]]]:
+    """(sections, indices picked for the LLM) per document, scored together in one batch."""
+    # numpy is only loaded once a document actually needs ranking
+    from scoring import get_ranker, select_top
+
+    units = [_rank_units(md) for md in docs]
+    out = []
+    for sections, scores in zip(units, get_ranker().score(units)):
+        sizes = [count_tokens(t) for t in sections]
+        out.append((sections, select_top(scores, sizes, RELEVANCE_TOP_K, RELEVANCE_TOKEN_BUDGET)))
+    return out
+
+def _ranked_input(sections: List[str], picked: List[int]) -> List[str]:
+    # picked sections go back in document order; a budget above the chunk size means several requests
+    pieces = split_text("\n\n".join(sections[i] for i in picked), RELEVANCE_CHUNK_TOKENS)
+    header = f"SOURCE ({len(picked)} highest-ranked of {len(sections)} sections)"
+    if len(pieces) == 1:
+        return [f"{header}:\n\n{pieces[0]}"]
+    return [f"{header}, part {n} of {len(pieces)}:\n\n{p}" for n, p in enumerate(pieces, start=1)]
+
+def _llm_inputs(md: str, decision: str, scan: ScanResult,
+                ranked: Optional[Tuple[List[str], List[int]]] = None) -> List[str]:
+    if decision == "skip":
+        return []
+    if decision == "cheap":
+        return [f"SOURCE (matching sections only):\n\n{_matching_sections(md, scan, RELEVANCE_CHEAP_CHARS)}"]
+    if ranked and ranked[1]:
+        return _ranked_input(*ranked)
+    # Heading/page-aligned chunks instead of cutting the document at a fixed length
+    chunks = chunk_markdown(md, RELEVANCE_CHUNK_TOKENS)
+    if len(chunks) == 1:
+        return [f"SOURCE:\n\n{chunks[0]['text']}"]
+    return [f"SOURCE (part {n} of {len(chunks)}):\n\n{c['text']}" for n, c in enumerate(chunks, start=1)]
+
+def _ask_llm(user: str) -> Dict:
+    return openai_chat(
+        system=PROMPT,
+        user=user,
+        json_mode=True,
+    )
+
+def filter_relevant(extracted: List[Dict], concurrency: Optional[int] = None,
+                    stats: Optional[Dict] = None) -> List[Dict]:
+    """
+    Keep the software-relevant sections of each document.
+
+    The term matcher scans every document once and gates it: no hits ->
+    dropped without an LLM call; a few -> only the matching sections are
+    sent; many -> full review. With RELEVANCE_RANKING on, full review sends
+    the document's top-ranked sections (local TF-IDF against the ontology
+    and mapping themes, up to RELEVANCE_TOP_K / RELEVANCE_TOKEN_BUDGET);
+    otherwise the whole document, one request per chunk. Gate decisions and
+    the estimated LLM calls/tokens saved are written to `stats`.
+    """
+    matcher = get_matcher()
+    # items carry a handle; the text is loaded here, for the duration of the stage
+    texts = [item_text(item) for item in extracted]
+    decisions = []
+    for md in texts:
+        scan = matcher.scan(md)
+        decisions.append((_gate(scan), scan))
+
+    ranked: Dict[int, Tuple[List[str], List[int]]] = {}
+    full = [i for i, (d, _) in enumerate(decisions) if d == "full"]
+    if RELEVANCE_RANKING == "on" and full:
+        ranked = dict(zip(full, _rank([texts[i] for i in full])))
+
+    todo = [(i, user)
+            for i, (md, (d, scan)) in enumerate(zip(texts, decisions))
+            for user in _llm_inputs(md, d, scan, ranked.get(i))]
+    # Requests fan out across documents and chunks; results come back in input order
+    answers: Dict[int, List[Dict]] = {}
+    for (i, _), res in zip(todo, llm_map(lambda t: _ask_llm(t[1]), todo, concurrency)):
+        answers.setdefault(i, []).extend(res.get("kept_sections", []) or [])
+
+    if stats is not None:
+        calls_saved, tokens_saved = 0, 0
+        for i, (md, (d, scan)) in enumerate(zip(texts, decisions)):
+            if d == "full" and i not in ranked:
+                continue
+            whole = _llm_inputs(md, "full", scan)
+            sent = _llm_inputs(md, d, scan, ranked.get(i))
+            calls_saved += max(0, len(whole) - len(sent))
+            tokens_saved += max(0, sum(estimate_tokens(PROMPT, u) for u in whole)
+                                - sum(estimate_tokens(PROMPT, u) for u in sent))
+        stats.update({
+            "gate": RELEVANCE_GATE,
+            "skip": sum(d == "skip" for d, _ in decisions),
+            "cheap": sum(d == "cheap" for d, _ in decisions),
+            "full": sum(d == "full" for d, _ in decisions),
+            "llm_calls": len(todo),
+            "llm_calls_saved": calls_saved,
+            "prompt_tokens_saved_est": tokens_saved,
+            "ranking": RELEVANCE_RANKING,
+            "documents": [
+                {"id": item["id"], "decision": d, "distinct_terms": scan.distinct_terms, "hits": scan.total_hits,
+                 **({"sections_ranked": len(ranked[i][0]), "sections_sent": len(ranked[i][1])} if i in ranked else {})}
+                for i, (item, (d, scan)) in enumerate(zip(extracted, decisions))
+            ],
+        })
 
-def filter_relevant(extracted: List[Dict]) -> List[Dict]:
     kept = []
-    for item in extracted:
-        md = item["markdown"]
-        if not _heuristic_hit(md):
-            # still ask LLM briefly to avoid misses
-            pass
-
-        res = openai_chat(
-            system=PROMPT,
-            user=f"SOURCE:\n\n{md[:16000]}",  # truncate for safety
-            json_mode=True,
-        )
-        sections = res.get("kept_sections", [])
+    for i, item in enumerate(extracted):
+        sections = answers.get(i, [])
         if not sections:
             continue
 
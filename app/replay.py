@@ -0,0 +1,189 @@
+import os, io, re, json, time, asyncio, hashlib, threading
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+
+# off | record | replay
+REPLAY_MODE = os.getenv("REPLAY_MODE", "off").lower()
+REPLAY_DIR = Path(os.getenv("REPLAY_DIR", str(Path(os.getenv("ARTIFACTS_DIR", "./artifacts")) / "fixtures"))).resolve()
+# Seconds added to every replayed call: "0.05", or per kind: "http=0.1,llm=0.8,mcp=0.2"
+REPLAY_LATENCY = os.getenv("REPLAY_LATENCY", "0")
+
+# Never written to fixtures (SerpAPI takes its key as a query parameter)
+_SECRET_PARAMS = {"api_key", "key", "token", "access_token"}
+# The stored body is already decoded, so these no longer describe it
+_DROP_HEADERS = {"content-encoding", "transfer-encoding", "content-length", "connection", "set-cookie"}
+# Fixtures recorded on one day must still match requests made on another
+_DATE_RE = re.compile(r"\b\d{4}-\d{2}-\d{2}\b")
+
+T = TypeVar("T")
+
+
+class ReplayMiss(LookupError):
+    pass
+
+
+def _parse_latency(spec: str) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        kind, _, value = part.rpartition("=")
+        out[kind or "*"] = float(value)
+    return out
+
+
+def redact_url(url: str) -> str:
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() not in _SECRET_PARAMS]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+class Fixtures:
+    """
+    Recorded responses on disk, one JSON file per distinct request:
+
+      <root>/<kind>/<request hash>.json   {"request": ..., "response": ...}
+      <root>/bodies/<sha256>              HTTP bodies, stored once by content
+
+    kind is http (SerpAPI and source fetches), llm or mcp.
+    """
+
+    def __init__(self, root: Path = REPLAY_DIR, latency: str = REPLAY_LATENCY):
+        self.root = Path(root)
+        self.latency = _parse_latency(latency)
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {}
+
+    @staticmethod
+    def key(kind: str, request: Dict[str, Any]) -> str:
+        text = _DATE_RE.sub("<date>", json.dumps(request, sort_keys=True, ensure_ascii=False, default=str))
+        return hashlib.sha256(f"{kind}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, kind: str, request: Dict[str, Any]) -> Path:
+        return self.root / kind / f"{self.key(kind, request)}.json"
+
+    def _bump(self, name: str):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    @staticmethod
+    def _write(path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def save(self, kind: str, request: Dict[str, Any], response: Any):
+        doc = {"kind": kind, "request": request, "response": response, "recorded_at": time.time()}
+        self._write(self._path(kind, request), json.dumps(doc, ensure_ascii=False, default=str).encode("utf-8"))
+        self._bump(f"{kind}_recorded")
+
+    def load(self, kind: str, request: Dict[str, Any]) -> Any:
+        path = self._path(kind, request)
+        if not path.exists():
+            self._bump(f"{kind}_missed")
+            raise ReplayMiss(f"no {kind} fixture for {json.dumps(request, default=str)[:200]}")
+        self._bump(f"{kind}_replayed")
+        return json.loads(path.read_text(encoding="utf-8"))["response"]
+
+    def put_body(self, body: bytes) -> str:
+        sha = hashlib.sha256(body).hexdigest()
+        path = self.root / "bodies" / sha
+        if not path.exists():
+            self._write(path, body)
+        return sha
+
+    def get_body(self, sha: str) -> bytes:
+        return (self.root / "bodies" / sha).read_bytes()
+
+    def delay(self, kind: str) -> float:
+        return self.latency.get(kind, self.latency.get("*", 0.0))
+
+
+fixtures = Fixtures()
+
+
+def recording() -> bool:
+    return REPLAY_MODE == "record"
+
+
+def replaying() -> bool:
+    return REPLAY_MODE == "replay"
+
+
+def stats() -> Dict[str, int]:
+    return dict(fixtures.counters)
+
+
+def call(kind: str, request: Dict[str, Any], fn: Callable[[], T],
+         encode: Callable[[T], Any] = lambda x: x, decode: Callable[[Any], T] = lambda x: x) -> T:
+    """
+    Run `fn` as usual, record its result as a fixture, or serve the recorded
+    one, depending on REPLAY_MODE. `request` identifies the call; `encode`
+    and `decode` convert the result to and from JSON.
+    """
+    if replaying():
+        response = fixtures.load(kind, request)
+        time.sleep(fixtures.delay(kind))
+        return decode(response)
+    result = fn()
+    if recording():
+        fixtures.save(kind, request, encode(result))
+    return result
+
+
+async def acall(kind: str, request: Dict[str, Any], fn: Callable[[], Awaitable[T]],
+                encode: Callable[[T], Any] = lambda x: x, decode: Callable[[Any], T] = lambda x: x) -> T:
+    """`call` for coroutines."""
+    if replaying():
+        response = fixtures.load(kind, request)
+        await asyncio.sleep(fixtures.delay(kind))
+        return decode(response)
+    result = await fn()
+    if recording():
+        fixtures.save(kind, request, encode(result))
+    return result
+
+
+class ReplayAdapter(HTTPAdapter):
+    """Transport adapter that records or replays whole HTTP responses for a requests.Session."""
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        desc = {"method": request.method, "url": redact_url(request.url)}
+        if replaying():
+            try:
+                fx = fixtures.load("http", desc)
+            except ReplayMiss as e:
+                raise requests.ConnectionError(str(e), request=request)
+            time.sleep(fixtures.delay("http"))
+            raw = HTTPResponse(
+                body=io.BytesIO(fixtures.get_body(fx["body"])),
+                headers=fx["headers"],
+                status=fx["status"],
+                reason=fx.get("reason"),
+                preload_content=False,
+                decode_content=False,
+            )
+            return self.build_response(request, raw)
+
+        resp = super().send(request, **kwargs)
+        if recording():
+            body = resp.content  # reads a streamed body; iter_content then serves it from memory
+            fixtures.save("http", desc, {
+                "status": resp.status_code,
+                "reason": resp.reason,
+                "headers": {k: v for k, v in resp.headers.items() if k.lower() not in _DROP_HEADERS},
+                "body": fixtures.put_body(body),
+            })
+        return resp
+
+
+def install(session: requests.Session, **adapter_kwargs):
+    """Route a session's HTTP(S) traffic through the recorder when REPLAY_MODE is set."""
+    if REPLAY_MODE in ("record", "replay"):
+        adapter = ReplayAdapter(**adapter_kwargs)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
@@ -0,0 +1,128 @@
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import yaml
+
+CONFIG_DIR = Path(__file__).parent / "config"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:/[a-z0-9]+)*")
+# A mappings.yaml alternative is used as a phrase only if it is plain words once \b is dropped
+_PLAIN_ALT = re.compile(r"^[\w\s/.-]+$")
+
+
+def _features(text: str) -> List[str]:
+    """Lowercased word unigrams plus adjacent bigrams ("supply chain")."""
+    toks = _TOKEN_RE.findall(text.lower())
+    return toks + [f"{a} {b}" for a, b in zip(toks, toks[1:])]
+
+
+def _regex_phrases(pattern: str) -> List[str]:
+    phrases = []
+    for alt in pattern.split("|"):
+        alt = alt.replace("\\b", "").replace("\\", "").strip()
+        if alt and _PLAIN_ALT.match(alt):
+            phrases.append(alt)
+    return phrases
+
+
+def load_concepts() -> List[Tuple[str, List[str]]]:
+    """
+    (label, phrases) per concept: every ontology.yaml include term on its
+    own, plus one theme per mappings.yaml pattern made of its plain-word
+    alternatives.
+    """
+    with open(CONFIG_DIR / "ontology.yaml", "r", encoding="utf-8") as f:
+        ontology = yaml.safe_load(f) or {}
+    with open(CONFIG_DIR / "mappings.yaml", "r", encoding="utf-8") as f:
+        mappings = yaml.safe_load(f) or {}
+    concepts = [(term, [term]) for term in ontology.get("include_terms") or []]
+    for p in mappings.get("patterns") or []:
+        phrases = _regex_phrases(p["regex"])
+        if phrases:
+            concepts.append((p["regex"], phrases))
+    return concepts
+
+
+class SectionRanker:
+    """
+    TF-IDF over a fixed vocabulary: the words and bigrams of the concepts.
+
+    Sections of any number of documents are counted into one
+    (sections x vocabulary) matrix; IDF is taken per document, so a
+    document's ranking does not depend on what it is batched with. Scores
+    are the sum of cosine-style similarities to every concept, one matrix
+    product for the whole batch.
+    """
+
+    def __init__(self, concepts: Sequence[Tuple[str, Sequence[str]]]):
+        self.labels = [label for label, _ in concepts]
+        self.vocab: Dict[str, int] = {}
+        rows = []
+        for _, phrases in concepts:
+            feats = {f for ph in phrases for f in _features(ph)}
+            rows.append([self.vocab.setdefault(f, len(self.vocab)) for f in sorted(feats)])
+        self.queries = np.zeros((len(rows), len(self.vocab)), dtype=np.float32)
+        for c, cols in enumerate(rows):
+            self.queries[c, cols] = 1.0
+        norms = np.linalg.norm(self.queries, axis=1, keepdims=True)
+        self.queries /= np.where(norms == 0, 1, norms)
+
+    def score(self, docs: Sequence[Sequence[str]]) -> List["np.ndarray"]:
+        """One score per section for every document (a list of section texts)."""
+        n_sections = sum(len(d) for d in docs)
+        n_vocab = len(self.vocab)
+        if not n_sections or not n_vocab:
+            return [np.zeros(len(d), dtype=np.float32) for d in docs]
+
+        flat, lengths, doc_starts = [], np.ones(n_sections, dtype=np.float32), []
+        row = 0
+        for sections in docs:
+            doc_starts.append(row)
+            for text in sections:
+                feats = _features(text)
+                lengths[row] = max(1, len(feats))
+                flat.extend(row * n_vocab + self.vocab[f] for f in feats if f in self.vocab)
+                row += 1
+        counts = np.bincount(np.asarray(flat, dtype=np.int64),
+                             minlength=n_sections * n_vocab).reshape(n_sections, n_vocab).astype(np.float32)
+
+        # document frequency within each document, broadcast back to its sections
+        starts = np.asarray([s for s, d in zip(doc_starts, docs) if len(d)], dtype=np.int64)
+        sizes = np.asarray([len(d) for d in docs if len(d)], dtype=np.float32)
+        df = np.add.reduceat((counts > 0).astype(np.float32), starts, axis=0)
+        idf = np.log((1 + sizes[:, None]) / (1 + df)) + 1
+        idf = np.repeat(idf, sizes.astype(np.int64), axis=0)
+
+        weights = np.log1p(counts) * idf / np.sqrt(lengths)[:, None]
+        scores = (weights @ self.queries.T).sum(axis=1)
+
+        out, row = [], 0
+        for sections in docs:
+            out.append(scores[row:row + len(sections)])
+            row += len(sections)
+        return out
+
+
+@lru_cache(maxsize=1)
+def get_ranker() -> SectionRanker:
+    return SectionRanker(load_concepts())
+
+
+def select_top(scores: "np.ndarray", sizes: Sequence[int], top_k: int, token_budget: int) -> List[int]:
+    """
+    Indices of the best-scoring sections (score > 0), at most `top_k` and
+    `token_budget` tokens in total, returned in document order. The best
+    section is always kept, cut to size by the caller if it is too large.
+    """
+    picked, used = [], 0
+    for i in np.argsort(-scores, kind="stable"):
+        if scores[i] <= 0 or len(picked) >= top_k:
+            break
+        if picked and used + sizes[i] > token_budget:
+            continue
+        picked.append(int(i))
+        used += sizes[i]
+    return sorted(picked)
@@ -0,0 +1,343 @@
+import os, re, json, gzip, threading, time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from artifacts import item_text
+from chunking import split_sections
+from state import content_hash, item_hash, version_hash
+from utils import ensure_dir, open_sqlite, ARTIFACTS_DIR
+
+SEARCH_INDEX_PATH = Path(os.getenv("SEARCH_INDEX_PATH", str(ARTIFACTS_DIR / "search.sqlite3"))).resolve()
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX", "1").lower() not in ("0", "false", "no", "off")
+# Words of context around the matches in a snippet
+SEARCH_SNIPPET_TOKENS = int(os.getenv("SEARCH_SNIPPET_TOKENS", "16"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    content_hash TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    controls_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sections (
+    id INTEGER PRIMARY KEY,
+    doc_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    page INTEGER,
+    section TEXT NOT NULL,
+    controls TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sections_doc ON sections(doc_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS sections_fts USING fts5(
+    section, controls, text, content='sections', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS sections_ai AFTER INSERT ON sections BEGIN
+    INSERT INTO sections_fts(rowid, section, controls, text) VALUES (new.id, new.section, new.controls, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS sections_ad AFTER DELETE ON sections BEGIN
+    INSERT INTO sections_fts(sections_fts, rowid, section, controls, text)
+    VALUES ('delete', old.id, old.section, old.controls, old.text);
+END;
+CREATE TABLE IF NOT EXISTS occurrences (
+    doc_id INTEGER NOT NULL,
+    run_id TEXT NOT NULL,
+    run_date TEXT NOT NULL,
+    source_id TEXT NOT NULL,
+    url TEXT,
+    title TEXT,
+    PRIMARY KEY (doc_id, run_id, source_id)
+);
+CREATE INDEX IF NOT EXISTS occurrences_date ON occurrences(run_date);
+"""
+
+_PAGE_TITLE = re.compile(r"^\[Page (\d+)\]$")
+_QUERY_TERM = re.compile(r'"([^"]*)"|(\S+)')
+_NON_WORD = re.compile(r"\W+")
+# Characters of a mapped section's text used to find it in the document
+_PROBE_CHARS = 80
+
+MappedSection = Tuple[str, str, List[str], str]  # title, text probe, controls, text
+
+
+def _norm(text: str) -> str:
+    return _NON_WORD.sub(" ", text or "").strip().lower()
+
+
+def _mapped_sections(mapped_item: Optional[Dict]) -> List[MappedSection]:
+    """The kept sections of a mapped item that got controls ("800-53 RA-5")."""
+    out = []
+    for sec in (mapped_item or {}).get("kept_sections", []):
+        controls = list(dict.fromkeys(
+            f"{m.get('framework', '')} {m.get('control', '')}".strip() for m in sec.get("mappings", [])))
+        controls = [c for c in controls if c]
+        if controls:
+            out.append((sec.get("title", ""), _norm(sec.get("text", ""))[:_PROBE_CHARS], controls, sec.get("text", "")))
+    return out
+
+
+def _sections(md: str, mapped: List[MappedSection]) -> List[Tuple[Optional[int], str, str, str]]:
+    """
+    (page, title, controls, text) per section; `## [Page N]` markers set the
+    page of what follows. A mapped section's controls go to the section with
+    the same heading, else to the one containing the start of its text; one
+    that matches neither (the LLM reworded it) is indexed as it was mapped.
+    """
+    rows, page = [], None
+    for sec in split_sections(md):
+        m = _PAGE_TITLE.match(sec["title"])
+        if m:
+            page = int(m.group(1))
+        rows.append([page, sec["title"], [], sec["text"]])
+    by_title: Dict[str, list] = {}
+    for row in rows:
+        by_title.setdefault(_norm(row[1]), row)
+    normalized = [_norm(row[3]) for row in rows]
+    for title, probe, controls, text in mapped:
+        row = by_title.get(_norm(title)) if _norm(title) else None
+        if row is None and probe:
+            row = next((r for r, t in zip(rows, normalized) if probe in t), None)
+        if row is None:
+            row = [None, title, [], text]
+            rows.append(row)
+        row[2].extend(c for c in controls if c not in row[2])
+    return [(p, title, "; ".join(controls), text) for p, title, controls, text in rows]
+
+
+def fts_query(query: str) -> str:
+    """
+    Plain search text as an FTS5 query: every word or "quoted phrase" must
+    match, `word*` is a prefix search and an upper-case OR between two terms
+    is kept. Anything else FTS5 would read as syntax is quoted.
+    """
+    terms = []
+    for phrase, word in _QUERY_TERM.findall(query):
+        if word == "OR" and terms and terms[-1] != "OR":
+            terms.append("OR")
+            continue
+        text = phrase if phrase else word
+        prefix = not phrase and text.endswith("*") and len(text) > 1
+        text = text.rstrip("*") if prefix else text
+        if text.strip():
+            terms.append('"' + text.replace('"', '""') + '"' + ("*" if prefix else ""))
+    while terms and terms[-1] == "OR":
+        terms.pop()
+    return " ".join(terms)
+
+
+class SearchIndex:
+    """
+    SQLite FTS5 index over the sections of every extracted source and
+    summary, across runs.
+
+      documents    one row per distinct text (by content hash)
+      sections     its sections: page, heading, mapped controls, text
+      sections_fts the full-text index over heading, controls and text
+      occurrences  which runs saw the text: run id and date, source id, URL
+
+    A text is split and indexed once; later runs that see it again only add
+    occurrence rows, and its sections are only rewritten when their mapped
+    controls change.
+    """
+
+    def __init__(self, path: Path = SEARCH_INDEX_PATH):
+        self.path = Path(path)
+        ensure_dir(self.path.parent)
+        self._lock = threading.Lock()
+        self._db = open_sqlite(self.path)
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    # ---------- indexing ----------
+
+    def _add(self, kind: str, chash: str, load: Callable[[], str], mapped: List[MappedSection],
+             run_id: str, run_date: str, source_id: str, url: Optional[str], title: Optional[str],
+             counts: Dict[str, int]):
+        controls_hash = version_hash(json.dumps([m[:3] for m in mapped]))
+        row = self._db.execute("SELECT id, controls_hash FROM documents WHERE content_hash = ?", (chash,)).fetchone()
+        if row is not None and row[1] == controls_hash:
+            # seen before with the same controls: only this run's occurrence is new, the text is not even read
+            doc_id = row[0]
+            counts["documents_reused"] += 1
+        else:
+            if row is None:
+                doc_id = self._db.execute(
+                    "INSERT INTO documents (content_hash, kind, controls_hash) VALUES (?, ?, ?)",
+                    (chash, kind, controls_hash),
+                ).lastrowid
+            else:
+                doc_id = row[0]
+                self._db.execute("DELETE FROM sections WHERE doc_id = ?", (doc_id,))
+                self._db.execute("UPDATE documents SET controls_hash = ? WHERE id = ?", (controls_hash, doc_id))
+            rows = _sections(load(), mapped)
+            self._db.executemany(
+                "INSERT INTO sections (doc_id, position, page, section, controls, text) VALUES (?, ?, ?, ?, ?, ?)",
+                [(doc_id, n, page, sec, ctl, text) for n, (page, sec, ctl, text) in enumerate(rows)],
+            )
+            counts["documents_indexed"] += 1
+            counts["sections_indexed"] += len(rows)
+        self._db.execute(
+            "INSERT OR REPLACE INTO occurrences (doc_id, run_id, run_date, source_id, url, title) "
+            "VALUES (?, ?, ?, ?, ?, ?)", (doc_id, run_id, run_date, source_id, url, title),
+        )
+
+    def add_run(self, run_id: str, run_date: str, extracted: List[Dict], mapped: List[Dict],
+                summaries: Iterable[Tuple[str, str, str]] = ()) -> Dict[str, float]:
+        """
+        Index one run: every extracted source (with the controls its mapped
+        sections got) and every summary, given as (path, title, markdown).
+        """
+        counts = {"documents_indexed": 0, "documents_reused": 0, "sections_indexed": 0}
+        by_id = {it["id"]: it for it in mapped}
+        t0 = time.perf_counter()
+        with self._lock:
+            for it in extracted:
+                self._add("source", item_hash(it), lambda: item_text(it), _mapped_sections(by_id.get(it["id"])),
+                          run_id, run_date, it["id"], it.get("url"), it.get("title"), counts)
+            for path, title, md in summaries:
+                self._add("summary", content_hash(md), lambda: md, [], run_id, run_date, Path(path).name, path,
+                          title, counts)
+            self._db.commit()
+        return {**counts, "seconds": round(time.perf_counter() - t0, 3)}
+
+    # ---------- queries ----------
+
+    def search(self, query: str, limit: int = 20, kind: Optional[str] = None, control: Optional[str] = None,
+               since: Optional[str] = None) -> List[Dict]:
+        """
+        Sections matching `query`, best first (BM25 with headings weighted
+        over controls over body text), each with a snippet and the runs that
+        saw it, newest first. `control` narrows to sections mapped to that
+        control, `since` to texts seen in a run on or after that date.
+        """
+        match = fts_query(query)
+        control_match = fts_query(control or "")
+        if control_match:
+            # the column filter takes the whole group; without the parentheses it would cover the first term only
+            control_match = f"controls : ({control_match})"
+            match = f"({match}) AND {control_match}" if match else control_match
+        if not match:
+            return []
+        sql = [
+            "SELECT s.doc_id, s.page, s.section, s.controls, d.kind, d.content_hash,",
+            "  snippet(sections_fts, 2, '**', '**', '…', ?), bm25(sections_fts, 4.0, 2.0, 1.0) AS score",
+            "FROM sections_fts JOIN sections s ON s.id = sections_fts.rowid JOIN documents d ON d.id = s.doc_id",
+            "WHERE sections_fts MATCH ?",
+        ]
+        params: List = [SEARCH_SNIPPET_TOKENS, match]
+        if kind:
+            sql.append("AND d.kind = ?")
+            params.append(kind)
+        if since:
+            sql.append("AND EXISTS (SELECT 1 FROM occurrences o WHERE o.doc_id = s.doc_id AND o.run_date >= ?)")
+            params.append(since)
+        sql.append("ORDER BY score LIMIT ?")
+        params.append(max(1, limit))
+        with self._lock:
+            hits = self._db.execute("\n".join(sql), params).fetchall()
+            doc_ids = sorted({h[0] for h in hits})
+            seen: Dict[int, List[Dict]] = {}
+            if doc_ids:
+                for doc_id, run_id, run_date, source_id, url, title in self._db.execute(
+                    "SELECT doc_id, run_id, run_date, source_id, url, title FROM occurrences "
+                    f"WHERE doc_id IN ({','.join('?' * len(doc_ids))}) ORDER BY run_date DESC, run_id",
+                    doc_ids,
+                ):
+                    seen.setdefault(doc_id, []).append(
+                        {"run_id": run_id, "run_date": run_date, "source_id": source_id, "url": url, "title": title})
+        return [
+            {
+                "score": round(-score, 3),
+                "kind": kind_,
+                "section": section,
+                "page": page,
+                "controls": [c for c in controls.split("; ") if c],
+                "snippet": snippet,
+                "content_hash": chash,
+                "runs": seen.get(doc_id, []),
+            }
+            for doc_id, page, section, controls, kind_, chash, snippet, score in hits
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "documents": self._db.execute("SELECT COUNT(*) FROM documents").fetchone()[0],
+                "sections": self._db.execute("SELECT COUNT(*) FROM sections").fetchone()[0],
+                "runs": self._db.execute("SELECT COUNT(DISTINCT run_id) FROM occurrences").fetchone()[0],
+            }
+
+
+def _load_stage(run_dir: Path, stage: str) -> Optional[Dict]:
+    try:
+        with gzip.open(run_dir / "stages" / f"{stage}.json.gz", "rt", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, EOFError, ValueError):
+        return None
+
+
+def backfill(index: "SearchIndex", artifacts_dir: Path = ARTIFACTS_DIR) -> Dict[str, int]:
+    """
+    Index every run found under `artifacts_dir`. Runs with stage
+    checkpoints contribute their sources, mapped controls and summaries;
+    older runs only their `sources/*.md` files (source id from the file
+    name, date from the folder's mtime). Runs already indexed are cheap,
+    since unchanged texts are not split again.
+    """
+    totals = {"runs": 0, "documents_indexed": 0, "documents_reused": 0, "sections_indexed": 0}
+    for run_dir in sorted(p for p in Path(artifacts_dir).iterdir() if p.is_dir()):
+        params_path = run_dir / "run.json"
+        params = json.loads(params_path.read_text(encoding="utf-8")) if params_path.exists() else {}
+        run_date = params.get("date") or time.strftime("%Y-%m-%d", time.gmtime(run_dir.stat().st_mtime))
+        extract = _load_stage(run_dir, "extract")
+        if extract is not None:
+            mapping = _load_stage(run_dir, "mapping") or {}
+            summaries = []
+            for path in sorted((run_dir / "stages").glob("summary*.json.gz")):
+                brief = _load_stage(run_dir, path.name[:-len(".json.gz")])
+                if brief:
+                    summaries.append((f"docs/summaries/{brief['filename']}", brief["filename"], brief["markdown"]))
+            extracted, mapped = extract.get("extracted", []), mapping.get("mapped", [])
+        elif (run_dir / "sources").is_dir():
+            extracted, mapped, summaries = [], [], []
+            for path in sorted((run_dir / "sources").glob("*.md")):
+                extracted.append({"id": path.name.split("-", 1)[0], "title": path.stem,
+                                  "markdown": path.read_text(encoding="utf-8")})
+        else:
+            continue
+        counts = index.add_run(run_dir.name, run_date, extracted, mapped, summaries)
+        totals["runs"] += 1
+        for k in ("documents_indexed", "documents_reused", "sections_indexed"):
+            totals[k] += counts[k]
+    return totals
+
+
+def format_results(results: List[Dict]) -> str:
+    """Search results as plain text for the terminal."""
+    lines = []
+    for n, r in enumerate(results, 1):
+        where = f"p. {r['page']}, " if r["page"] else ""
+        lines.append(f"{n:>2}. {r['section'] or '(untitled)'}  [{where}{r['kind']}, score {r['score']}]")
+        if r["controls"]:
+            lines.append(f"    controls: {', '.join(r['controls'])}")
+        lines.append("    " + " ".join(r["snippet"].split()))
+        if r["runs"]:
+            last = r["runs"][0]
+            more = f" (+{len(r['runs']) - 1} more runs)" if len(r["runs"]) > 1 else ""
+            lines.append(f"    {last['source_id']} {last['url'] or ''} — run {last['run_id']}, {last['run_date']}{more}")
+    return "\n".join(lines) if lines else "No matches."
+
+
+_index: Optional[SearchIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_search_index() -> Optional[SearchIndex]:
+    """Process-wide index, or None when disabled with SEARCH_INDEX=0."""
+    global _index
+    if not SEARCH_INDEX_ENABLED:
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = SearchIndex()
+        return _index
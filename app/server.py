@@ -0,0 +1,92 @@
+import time
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from jobs import JobManager
+from checkpoints import find_run
+from telemetry import metrics
+
+def run_workflow(**params):
+    # The pipeline and its dependencies load with the first job, not at server start
+    from orchestrator import run_workflow as run
+    return run(**params)
+
+class RunRequest(BaseModel):
+    topic: str = "NIST SP 800 updates"
+    # Several topics in one batch run (one brief each); `topic` is then ignored
+    topics: Optional[List[str]] = None
+    limit: int = 10
+    dry_run: bool = False
+    bypass_llm_cache: bool = False
+    full_refresh: bool = False
+    # run_id of an earlier run to continue from its last finished stage
+    resume: Optional[str] = None
+    # Forward the summary's text on the job's event stream as it is generated
+    stream_summary: bool = False
+    # Block until the job finishes and return its result (the pre-job behaviour)
+    wait: bool = False
+
+app = FastAPI(title="NIST SP 800 Agent")
+jobs = JobManager(run_workflow)
+
+@app.get("/healthz")
+def health():
+    return {"status": "ok"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/run", status_code=202)
+def run(req: RunRequest, response: Response):
+    if req.resume and find_run(req.resume) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown run {req.resume}")
+    if req.topics is not None and not any(t.strip() for t in req.topics):
+        raise HTTPException(status_code=422, detail="topics is empty")
+    params = req.model_dump(exclude={"wait"})
+    job, deduplicated = jobs.submit(params)
+    if req.wait:
+        job.wait()
+        # finished, not merely accepted
+        response.status_code = 200
+        return job.to_dict()
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "deduplicated": deduplicated,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+    }
+
+@app.get("/search")
+def search_sections(q: str, limit: int = 20, kind: Optional[str] = None, control: Optional[str] = None,
+                    since: Optional[str] = None):
+    """Ranked sections of earlier runs' sources and summaries; `kind` is "source" or "summary"."""
+    from search import get_search_index
+    index = get_search_index()
+    if index is None:
+        raise HTTPException(status_code=503, detail="Search index is disabled (SEARCH_INDEX=0)")
+    t0 = time.perf_counter()
+    results = index.search(q, limit=min(max(1, limit), 100), kind=kind, control=control, since=since)
+    return {"query": q, "took_ms": round((time.perf_counter() - t0) * 1000, 2), "results": results}
+
+def _get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    return _get_job(job_id).to_dict()
+
+@app.get("/jobs/{job_id}/events")
+def job_events(job_id: str):
+    job = _get_job(job_id)
+    return StreamingResponse(
+        job.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,64 @@
+import os, re, sys, json, time, subprocess
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+APP_DIR = Path(__file__).resolve().parent
+
+# Slow to import and only needed by some code paths (LLM calls, HTML, PDFs, section ranking, publishing, serving)
+HEAVY_MODULES = ("openai", "trafilatura", "pdfplumber", "numpy", "fastmcp", "mcp", "uvicorn")
+# What `main.py --dry-run` and `main.py --serve` import before doing any work
+ENTRY_POINTS = {"cli": "orchestrator", "server": "server"}
+
+_IMPORTTIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)")
+
+
+def import_profile(module: str) -> Dict:
+    """
+    Import `module` in a fresh interpreter under `-X importtime`.
+
+    Returns the module's cumulative import time, the whole process's wall
+    time, self time per top-level package (sorted, slowest first) and which
+    of HEAVY_MODULES ended up loaded.
+    """
+    code = f"import sys, json; import {module}; print(json.dumps(sorted(sys.modules)))"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(APP_DIR), os.getenv("PYTHONPATH")]))}
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=APP_DIR, env=env, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - t0) * 1000
+    if proc.returncode:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    total_ms = 0.0
+    by_package: Dict[str, float] = defaultdict(float)
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME.match(line)
+        if not m:
+            continue
+        self_us, cumulative_us, name = int(m.group(1)), int(m.group(2)), m.group(3)
+        by_package[name.split(".")[0]] += self_us / 1000
+        if name == module:
+            total_ms = cumulative_us / 1000
+
+    loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {
+        "module": module,
+        "import_ms": round(total_ms, 1),
+        "process_ms": round(wall_ms, 1),
+        "packages": sorted(((k, round(v, 1)) for k, v in by_package.items()), key=lambda kv: -kv[1]),
+        "heavy_loaded": sorted({m.split(".")[0] for m in loaded} & set(HEAVY_MODULES)),
+    }
+
+
+def print_import_profile(top: int = 12) -> int:
+    """The `main.py --import-profile` report. Returns a process exit code."""
+    for label, module in ENTRY_POINTS.items():
+        p = import_profile(module)
+        heavy = ", ".join(p["heavy_loaded"]) or "none"
+        print(f"{label} (import {module}): {p['import_ms']:.0f} ms in imports, "
+              f"{p['process_ms']:.0f} ms process start; heavy modules loaded: {heavy}")
+        rows: List[Tuple[str, float]] = p["packages"][:top]
+        for name, ms in rows:
+            print(f"  {name:<24} {ms:8.1f} ms")
+    return 0
@@ -0,0 +1,166 @@
+import os, json, hashlib, threading, time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils import ensure_dir, canonical_url, open_sqlite, ARTIFACTS_DIR
+
+STATE_DB_PATH = Path(os.getenv("STATE_DB_PATH", str(ARTIFACTS_DIR / "state.sqlite3"))).resolve()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    url TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    title TEXT,
+    extracted_at REAL NOT NULL,
+    last_run TEXT
+);
+CREATE TABLE IF NOT EXISTS relevance (
+    content_hash TEXT NOT NULL,
+    version TEXT NOT NULL,
+    kept_sections TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (content_hash, version)
+);
+CREATE TABLE IF NOT EXISTS mappings (
+    section_hash TEXT NOT NULL,
+    version TEXT NOT NULL,
+    mappings TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (section_hash, version)
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    content_hash TEXT NOT NULL,
+    version TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (content_hash, version)
+);
+"""
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def item_hash(item: Dict) -> str:
+    """content_hash of an extracted item's markdown, which items carry instead of the text."""
+    return item["content_hash"] if "content_hash" in item else content_hash(item["markdown"])
+
+
+def section_hash(sec: Dict) -> str:
+    return content_hash(json.dumps([sec.get("title", ""), sec.get("text", "")], ensure_ascii=False))
+
+
+def version_hash(*parts: str) -> str:
+    """Fingerprint of whatever produced a stored result (prompt, model, config)."""
+    return content_hash("\x00".join(parts))[:16]
+
+
+class StateIndex:
+    """
+    What previous runs saw and decided, so a new run only sends new or
+    changed content through the LLM stages.
+
+      sources    canonical URL -> content hash of its extracted markdown
+      relevance  (content hash, stage version) -> kept sections
+      mappings   (section hash, stage version) -> mappings
+      summaries  (summary input hash, stage version) -> per-source summary
+
+    The stage version is a hash of the prompt/model that produced a result,
+    so editing a prompt invalidates stored results instead of reusing them.
+    """
+
+    def __init__(self, path: Path = STATE_DB_PATH):
+        self.path = Path(path)
+        ensure_dir(self.path.parent)
+        self._lock = threading.Lock()
+        self._db = open_sqlite(self.path)
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    # ---------- sources ----------
+
+    def classify(self, items: List[Dict]) -> Dict[str, str]:
+        """Map item id -> "new" | "changed" | "unchanged" against the stored hashes."""
+        out = {}
+        with self._lock:
+            for it in items:
+                row = self._db.execute(
+                    "SELECT content_hash FROM sources WHERE url = ?", (canonical_url(it["url"]),)
+                ).fetchone()
+                h = item_hash(it)
+                out[it["id"]] = "new" if not row else ("unchanged" if row[0] == h else "changed")
+        return out
+
+    def record_sources(self, items: List[Dict], run_id: str):
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO sources (url, content_hash, title, extracted_at, last_run) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(canonical_url(it["url"]), item_hash(it), it.get("title"), now, run_id)
+                 for it in items],
+            )
+            self._db.commit()
+
+    # ---------- stage results ----------
+
+    def get_relevance(self, chash: str, version: str) -> Optional[List[Dict]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT kept_sections FROM relevance WHERE content_hash = ? AND version = ?", (chash, version)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_relevance(self, chash: str, version: str, kept_sections: List[Dict]):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO relevance (content_hash, version, kept_sections, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (chash, version, json.dumps(kept_sections, ensure_ascii=False), time.time()),
+            )
+            self._db.commit()
+
+    def get_mappings(self, shash: str, version: str) -> Optional[List[Dict]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT mappings FROM mappings WHERE section_hash = ? AND version = ?", (shash, version)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_mappings(self, shash: str, version: str, mappings: List[Dict]):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO mappings (section_hash, version, mappings, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (shash, version, json.dumps(mappings, ensure_ascii=False), time.time()),
+            )
+            self._db.commit()
+
+    def get_summary(self, chash: str, version: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT summary FROM summaries WHERE content_hash = ? AND version = ?", (chash, version)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_summary(self, chash: str, version: str, summary: Dict):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO summaries (content_hash, version, summary, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (chash, version, json.dumps(summary, ensure_ascii=False), time.time()),
+            )
+            self._db.commit()
+
+
+_state: Optional[StateIndex] = None
+_state_lock = threading.Lock()
+
+
+def get_state() -> StateIndex:
+    global _state
+    with _state_lock:
+        if _state is None:
+            _state = StateIndex()
+        return _state
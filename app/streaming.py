@@ -0,0 +1,180 @@
+import os, queue, threading, contextvars
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from extraction import iter_extracted
+from incremental import filter_relevant_incremental, map_controls_incremental
+from state import StateIndex
+from telemetry import span
+from utils import LLM_CONCURRENCY
+
+# stream: extraction, relevance and mapping overlap per document; batch: one stage after another
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "stream").lower()
+# Documents waiting between two stages before the upstream stage blocks
+STREAM_BUFFER = int(os.getenv("STREAM_BUFFER", "4"))
+
+STREAM_STAGES = ("extract", "relevance", "mapping")
+
+_DONE = object()
+
+Progress = Callable[[str, Dict[str, Any]], None]
+
+
+def merge_stats(total: Dict, part: Dict):
+    """Fold one document's stage stats into the run totals: numbers add up, lists extend."""
+    for k, v in part.items():
+        if isinstance(v, bool) or not isinstance(v, (int, float, list, dict)):
+            total[k] = v
+        elif isinstance(v, (int, float)):
+            total[k] = total.get(k, 0) + v
+        elif isinstance(v, list):
+            total.setdefault(k, []).extend(v)
+        else:
+            merge_stats(total.setdefault(k, {}), v)
+
+
+class _Stage:
+    """
+    `workers` threads applying `fn` to (index, item) messages from `inbox`;
+    non-None results go to `outbox`. After a failure the stage keeps
+    draining its inbox, so the stages upstream never block on a full queue.
+    """
+
+    def __init__(self, name: str, fn: Callable[[Tuple[int, Dict]], Optional[Tuple[int, Dict]]],
+                 inbox: "queue.Queue", outbox: "queue.Queue", workers: int, errors: List[BaseException]):
+        self.name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.workers = max(1, workers)
+        self.errors = errors
+        self.done = 0
+
+    def _work(self):
+        while True:
+            msg = self.inbox.get()
+            if msg is _DONE:
+                self.inbox.put(_DONE)  # let the other workers see it too
+                return
+            if self.errors:
+                continue
+            try:
+                out = self.fn(msg)
+            except BaseException as e:
+                self.errors.append(e)
+                continue
+            self.done += 1
+            if out is not None:
+                self.outbox.put(out)
+
+    def run(self, progress: Progress):
+        ctx = contextvars.copy_context()
+        with span("stage", self.name):
+            progress(self.name, {"status": "started"})
+            threads = [threading.Thread(target=ctx.copy().run, args=(self._work,), daemon=True,
+                                        name=f"{self.name}-{n}") for n in range(self.workers)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            progress(self.name, {"status": "done", "documents": self.done})
+        self.outbox.put(_DONE)
+
+
+def run_stream(sources: List[Dict], out_dir: Path, state: StateIndex, reuse: bool = True,
+               progress: Optional[Progress] = None) -> Dict[str, Dict]:
+    """
+    Extraction, relevance and mapping as concurrent stages joined by bounded
+    queues: a document goes to relevance as soon as it is extracted and to
+    mapping as soon as it is judged, so network and LLM work overlap.
+
+    Each document is judged and mapped on its own, exactly as the batch
+    stages treat it, and the outputs are put back in source order. The
+    result has the same shape as the batch checkpoints:
+    {"extract": {extracted, changes, stats}, "relevance": {filtered, stats},
+    "mapping": {mapped, stats}}.
+    """
+    progress = progress or (lambda stage, event: None)
+    q_extracted: "queue.Queue" = queue.Queue(maxsize=max(1, STREAM_BUFFER))
+    q_filtered: "queue.Queue" = queue.Queue(maxsize=max(1, STREAM_BUFFER))
+    q_mapped: "queue.Queue" = queue.Queue()
+    errors: List[BaseException] = []
+    lock = threading.Lock()
+
+    extracted: Dict[int, Dict] = {}
+    changes: Dict[str, str] = {}
+    filtered: Dict[int, Dict] = {}
+    pdf_stats: Dict[int, Dict] = {}
+    relevance_stats: Dict = {}
+    mapping_stats: Dict = {}
+
+    def extract():
+        with span("stage", "extract"):
+            progress("extract", {"status": "started", "sources": len(sources)})
+            try:
+                for i, item, doc_stats in iter_extracted(sources, out_dir):
+                    if doc_stats:
+                        pdf_stats[i] = {"id": sources[i]["id"], **doc_stats}
+                    if errors:
+                        break
+                    if item is None:
+                        continue
+                    # classify before anything is recorded, as the batch path does
+                    changes.update(state.classify([item]))
+                    extracted[i] = item
+                    q_extracted.put((i, item))
+            except BaseException as e:
+                errors.append(e)
+            progress("extract", {"status": "done", "extracted": len(extracted)})
+        q_extracted.put(_DONE)
+
+    def judge(msg: Tuple[int, Dict]) -> Optional[Tuple[int, Dict]]:
+        i, item = msg
+        part: Dict = {}
+        kept = filter_relevant_incremental([item], state, reuse=reuse, stats=part)
+        with lock:
+            merge_stats(relevance_stats, part)
+            if kept:
+                filtered[i] = kept[0]
+        return (i, kept[0]) if kept else None
+
+    def map_one(msg: Tuple[int, Dict]) -> Tuple[int, Dict]:
+        i, item = msg
+        part: Dict = {}
+        mapped = map_controls_incremental([item], state, reuse=reuse, stats=part)
+        with lock:
+            merge_stats(mapping_stats, part)
+        return i, mapped[0]
+
+    relevance = _Stage("relevance", judge, q_extracted, q_filtered, LLM_CONCURRENCY, errors)
+    mapping = _Stage("mapping", map_one, q_filtered, q_mapped, LLM_CONCURRENCY, errors)
+
+    ctx = contextvars.copy_context()
+    drivers = [threading.Thread(target=ctx.copy().run, args=(fn,), daemon=True, name=f"stream-{name}")
+               for name, fn in (("extract", extract), ("relevance", lambda: relevance.run(progress)),
+                                ("mapping", lambda: mapping.run(progress)))]
+    for t in drivers:
+        t.start()
+    for t in drivers:
+        t.join()
+    if errors:
+        raise errors[0]
+
+    mapped: Dict[int, Dict] = {}
+    while True:
+        msg = q_mapped.get()
+        if msg is _DONE:
+            break
+        mapped[msg[0]] = msg[1]
+
+    order = {s["id"]: n for n, s in enumerate(sources)}
+    if "documents" in relevance_stats:
+        relevance_stats["documents"].sort(key=lambda d: order.get(d["id"], 0))
+    extraction_stats = {"pdf": [pdf_stats[i] for i in sorted(pdf_stats)]} if pdf_stats else {}
+
+    return {
+        "extract": {"extracted": [extracted[i] for i in sorted(extracted)], "changes": changes,
+                    "stats": extraction_stats},
+        "relevance": {"filtered": [filtered[i] for i in sorted(filtered)], "stats": relevance_stats},
+        "mapping": {"mapped": [mapped[i] for i in sorted(mapped)], "stats": mapping_stats},
+    }
@@ -1,8 +1,12 @@
-from typing import List, Dict, Tuple
-from datetime import datetime
-from utils import openai_chat
+import os, json
+from typing import List, Dict, Optional, Tuple
+from utils import openai_chat, llm_map, OPENAI_MODEL, TokenFn
+from chunking import fair_share
+from llm_scheduler import PRIORITY_INTERACTIVE
+from state import StateIndex, content_hash, version_hash
 
 PROMPT = """Create a one-page Markdown brief for software/IT orgs about NIST SP 800 updates.
+You receive a source table and one summary per source (JSON lines).
 Include:
 - Latest updates (with dates/versions) as bullets.
 - Plain-language takeaways for software teams.
@@ -12,41 +16,103 @@ Include:
 
 Return only Markdown."""
 
-def build_summary(mapped: List[Dict], date_iso: str) -> Tuple[str, str, Dict]:
-    # Build simple source table for grounding
-    source_notes = []
-    for it in mapped:
-        source_notes.append({
-            "id": it["id"],
-            "title": it["title"],
-            "url": it["url"],
-            "published": it.get("published",""),
-        })
-
-    # Flatten for the LLM
-    digest = []
-    for it in mapped:
-        for s in it["kept_sections"]:
-            digest.append({
-                "source_id": it["id"],
-                "title": it["title"],
-                "url": it["url"],
-                "section_title": s.get("title",""),
-                "text": s.get("text","")[:3000],
-                "mappings": s.get("mappings", []),
-                "published": it.get("published","")
-            })
-
-    user_text = f"""DATE: {date_iso}
-
-SOURCES:
-{source_notes}
-
-FILTERED CONTENT:
-{digest}
-"""
-
-    md = openai_chat(system=PROMPT, user=user_text, json_mode=False)
+SOURCE_PROMPT = """Summarize one source about NIST SP 800 updates for software/IT orgs.
+The first line describes the source; each further line is one relevant section with its mapped controls (JSON lines).
+Return JSON:
+{ updates: ["what changed, with dates/versions"],
+  takeaways: ["plain-language point for software teams"],
+  actions: [ {theme: "Build/CI | Dependencies/SBOM | IaC/Cloud | Data/CUI-PII | Testing/Assurance", action: "...", controls: ["800-53 RA-5"]} ] }
+At most 5 entries per list; use only controls listed in the sections."""
+
+# Characters of section text each per-source summary request may carry
+SUMMARY_SOURCE_CHARS = int(os.getenv("SUMMARY_SOURCE_CHARS", "24000"))
+
+def _compact(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+def _source_meta(it: Dict) -> Dict:
+    return {"title": it["title"], "url": it["url"], "published": it.get("published", "")}
+
+def _source_note(it: Dict) -> Dict:
+    return {"id": it["id"], **_source_meta(it)}
+
+def _source_input(it: Dict) -> str:
+    """
+    One source as JSON lines: its metadata, then each kept section with its
+    controls. The run's source id is left out (it is added in the reduce
+    input), so a source keeps its summary when the ranking renumbers it.
+    """
+    sections = it["kept_sections"]
+    # short sections stay whole, long ones are cut to an even share of the budget
+    caps = fair_share([len(s.get("text", "")) for s in sections], SUMMARY_SOURCE_CHARS)
+    lines = [_compact(_source_meta(it))]
+    for s, cap in zip(sections, caps):
+        controls = sorted({f"{m.get('framework', '')} {m.get('control', '')}".strip() for m in s.get("mappings", [])})
+        lines.append(_compact({"section": s.get("title", ""), "controls": controls, "text": s.get("text", "")[:cap]}))
+    return "\n".join(lines)
+
+def stage_version() -> str:
+    """Changes whenever something that shapes a per-source summary changes."""
+    return version_hash(OPENAI_MODEL, SOURCE_PROMPT, str(SUMMARY_SOURCE_CHARS))
+
+def _summarize_source(user: str) -> Dict:
+    res = openai_chat(system=SOURCE_PROMPT, user=user, json_mode=True, priority=PRIORITY_INTERACTIVE)
+    return {k: res.get(k) or [] for k in ("updates", "takeaways", "actions")}
+
+def _has_content(summary: Optional[Dict]) -> bool:
+    return bool(summary) and any(summary.get(k) for k in ("updates", "takeaways", "actions"))
+
+def build_summary(mapped: List[Dict], date_iso: str, state: Optional[StateIndex] = None,
+                  reuse: bool = True, on_token: Optional[TokenFn] = None,
+                  memo: Optional[Dict[str, Dict]] = None) -> Tuple[str, str, Dict]:
+    """
+    Map-reduce: each source is summarized on its own (in parallel), then one
+    request combines the per-source summaries into the brief. Per-source
+    summaries are stored in the state index by a hash of their input, so
+    only new or changed sources cost a summary call on the next run.
+    `on_token` receives the brief's text as the reduce request streams it.
+    `memo` holds the per-source summaries already made by this run (by input
+    hash); the topics of a batch run share it, so a source common to several
+    topics is summarized once even when the state index is not reused.
+    """
+    source_notes = [_source_note(it) for it in mapped]
+    version = stage_version()
+
+    inputs = [_source_input(it) for it in mapped]
+    hashes = [content_hash(u) for u in inputs]
+    summaries: Dict[int, Dict] = {}
+    for i, h in enumerate(hashes):
+        prev = memo.get(h) if memo is not None else None
+        if prev is None and state is not None and reuse:
+            prev = state.get_summary(h, version)
+        if _has_content(prev):
+            summaries[i] = prev
+    todo = [i for i in range(len(mapped)) if i not in summaries]
+    # the brief waits on these, so they jump ahead of any bulk mapping work still queued
+    for i, summary in zip(todo, llm_map(lambda i: _summarize_source(inputs[i]), todo)):
+        summaries[i] = summary
+        if not _has_content(summary):
+            continue  # invalid or empty JSON from the LLM: used this time, asked again next run
+        if memo is not None:
+            memo[hashes[i]] = summary
+        if state is not None:
+            state.put_summary(hashes[i], version, summary)
+
+    user_text = "\n".join([
+        f"DATE: {date_iso}",
+        "",
+        "SOURCES:",
+        *(_compact(n) for n in source_notes),
+        "",
+        "SOURCE SUMMARIES:",
+        *(_compact({"id": it["id"], **summaries[i]}) for i, it in enumerate(mapped)),
+    ])
+
+    md = openai_chat(system=PROMPT, user=user_text, json_mode=False, priority=PRIORITY_INTERACTIVE,
+                     on_token=on_token)
     filename = f"{date_iso}-nist-sp800-summary.md"
-    meta = {"sources": source_notes}
+    meta = {
+        "sources": source_notes,
+        "summarization": {"sources": len(mapped), "source_calls": len(todo), "reused_summaries": len(mapped) - len(todo)},
+    }
     return md, filename, meta
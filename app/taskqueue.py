@@ -0,0 +1,244 @@
+import os, json, socket, threading, time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from utils import ensure_dir, open_sqlite, ARTIFACTS_DIR
+
+TASK_QUEUE_PATH = Path(os.getenv("TASK_QUEUE_PATH", str(ARTIFACTS_DIR / "tasks.sqlite3"))).resolve()
+# A claimed task goes back to the queue if its worker has not renewed the lease for this long
+TASK_LEASE_SECONDS = float(os.getenv("TASK_LEASE_SECONDS", "60"))
+# Attempts per task, counting the first; a task that fails them all fails the run
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", "3"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_until REAL,
+    result TEXT,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    UNIQUE (run_id, kind, key)
+);
+CREATE INDEX IF NOT EXISTS tasks_claim ON tasks(run_id, status, priority, id);
+"""
+
+OPEN = ("pending", "leased")
+
+
+@dataclass
+class Task:
+    id: int
+    run_id: str
+    kind: str
+    key: str
+    payload: Dict[str, Any]
+    attempts: int
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class TaskQueue:
+    """
+    Durable per-run task queue in SQLite, shared by the worker processes.
+
+    A worker claims a task with a lease and renews it while it works. A task
+    whose lease runs out (its worker died) is claimed again by someone else;
+    a task that raises goes back to the queue with a backoff until it has
+    used `max_attempts`, then it is marked failed. Tasks are unique per
+    (run, kind, key), so enqueueing a run again after an interruption keeps
+    whatever is already done.
+    """
+
+    def __init__(self, path: Path = TASK_QUEUE_PATH, lease_seconds: float = TASK_LEASE_SECONDS,
+                 max_attempts: int = TASK_MAX_ATTEMPTS):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        ensure_dir(self.path.parent)
+        self._lock = threading.Lock()
+        # autocommit; writes that read first take the write lock up front (see _tx)
+        self._db = open_sqlite(self.path, isolation_level=None)
+        self._db.executescript(_SCHEMA)
+
+    @contextmanager
+    def _tx(self) -> Iterator[Any]:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    # ---------- producers ----------
+
+    def enqueue(self, run_id: str, tasks: List[Tuple[str, str, int, Dict[str, Any]]]):
+        """Add (kind, key, priority, payload) tasks; ones the run already has are left as they are."""
+        now = time.time()
+        with self._tx() as db:
+            db.executemany(
+                "INSERT OR IGNORE INTO tasks (run_id, kind, key, priority, payload, available_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, kind, key, prio, json.dumps(payload, ensure_ascii=False), now, now)
+                 for kind, key, prio, payload in tasks],
+            )
+
+    def retry_failed(self, run_id: str) -> int:
+        """Give the run's failed tasks a fresh set of attempts (before the run is started again)."""
+        now = time.time()
+        with self._tx() as db:
+            return db.execute(
+                "UPDATE tasks SET status = 'pending', attempts = 0, available_at = ?, updated_at = ? "
+                "WHERE run_id = ? AND status = 'failed'", (now, now, run_id)
+            ).rowcount
+
+    def release_dead(self, run_id: str) -> int:
+        """
+        Put tasks leased by processes on this host that no longer exist back
+        in the queue now, rather than when their lease runs out.
+        """
+        host = socket.gethostname()
+        now = time.time()
+        n = 0
+        with self._tx() as db:
+            for task_id, owner in db.execute(
+                "SELECT id, lease_owner FROM tasks WHERE run_id = ? AND status = 'leased'", (run_id,)
+            ).fetchall():
+                owner_host, _, pid = (owner or "").rpartition(":")
+                if owner_host == host and pid.isdigit() and not _pid_alive(int(pid)):
+                    db.execute("UPDATE tasks SET status = 'pending', lease_owner = NULL, lease_until = NULL, "
+                               "updated_at = ? WHERE id = ?", (now, task_id))
+                    n += 1
+        return n
+
+    # ---------- workers ----------
+
+    def claim(self, run_id: str, owner: str) -> Optional[Task]:
+        """The next runnable task of the run (deepest stage first), leased to `owner`."""
+        now = time.time()
+        with self._tx() as db:
+            while True:
+                row = db.execute(
+                    "SELECT id, kind, key, payload, attempts, status FROM tasks WHERE run_id = ? AND "
+                    "((status = 'pending' AND available_at <= ?) OR (status = 'leased' AND lease_until < ?)) "
+                    "ORDER BY priority DESC, id LIMIT 1", (run_id, now, now)
+                ).fetchone()
+                if row is None:
+                    return None
+                task_id, kind, key, payload, attempts, status = row
+                if status == "leased" and attempts >= self.max_attempts:
+                    # its workers keep dying on it
+                    db.execute("UPDATE tasks SET status = 'failed', lease_owner = NULL, error = ?, updated_at = ? "
+                               "WHERE id = ?", ("lease expired: worker lost", now, task_id))
+                    continue
+                db.execute(
+                    "UPDATE tasks SET status = 'leased', attempts = attempts + 1, lease_owner = ?, lease_until = ?, "
+                    "updated_at = ? WHERE id = ?", (owner, now + self.lease_seconds, now, task_id)
+                )
+                return Task(task_id, run_id, kind, key, json.loads(payload), attempts + 1)
+
+    def renew(self, task: Task, owner: str) -> bool:
+        now = time.time()
+        with self._tx() as db:
+            return db.execute(
+                "UPDATE tasks SET lease_until = ?, updated_at = ? WHERE id = ? AND status = 'leased' "
+                "AND lease_owner = ?", (now + self.lease_seconds, now, task.id, owner)
+            ).rowcount == 1
+
+    def complete(self, task: Task, owner: str, result: Any,
+                 follow_up: Optional[List[Tuple[str, str, int, Dict[str, Any]]]] = None) -> bool:
+        """
+        Store the result and enqueue the tasks that depend on it, atomically.
+        False if the lease was lost meanwhile (another worker owns the task).
+        """
+        now = time.time()
+        with self._tx() as db:
+            done = db.execute(
+                "UPDATE tasks SET status = 'done', result = ?, lease_owner = NULL, lease_until = NULL, error = NULL, "
+                "updated_at = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (json.dumps(result, ensure_ascii=False), now, task.id, owner),
+            ).rowcount == 1
+            if done and follow_up:
+                db.executemany(
+                    "INSERT OR IGNORE INTO tasks (run_id, kind, key, priority, payload, available_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(task.run_id, kind, key, prio, json.dumps(payload, ensure_ascii=False), now, now)
+                     for kind, key, prio, payload in follow_up],
+                )
+            return done
+
+    def fail(self, task: Task, owner: str, error: str):
+        """Back to the queue after a backoff, or failed for good once its attempts are used up."""
+        now = time.time()
+        final = task.attempts >= self.max_attempts
+        with self._tx() as db:
+            db.execute(
+                "UPDATE tasks SET status = ?, available_at = ?, lease_owner = NULL, lease_until = NULL, error = ?, "
+                "updated_at = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                ("failed" if final else "pending", now + min(30.0, 2.0 ** task.attempts), error[:2000], now,
+                 task.id, owner),
+            )
+
+    # ---------- results ----------
+
+    def counts(self, run_id: str) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT status, COUNT(*) FROM tasks WHERE run_id = ? GROUP BY status", (run_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def open_tasks(self, run_id: str) -> int:
+        counts = self.counts(run_id)
+        return sum(counts.get(s, 0) for s in OPEN)
+
+    def results(self, run_id: str) -> Dict[Tuple[str, str], Any]:
+        """(kind, key) -> result of every finished task of the run."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT kind, key, result FROM tasks WHERE run_id = ? AND status = 'done'", (run_id,)
+            ).fetchall()
+        return {(kind, key): json.loads(result) for kind, key, result in rows}
+
+    def result(self, run_id: str, kind: str, key: str) -> Any:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result FROM tasks WHERE run_id = ? AND kind = ? AND key = ? AND status = 'done'",
+                (run_id, kind, key),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def failures(self, run_id: str) -> List[Tuple[str, str, str]]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT kind, key, error FROM tasks WHERE run_id = ? AND status = 'failed' ORDER BY id", (run_id,)
+            ).fetchall()
+
+    def purge(self, run_id: str):
+        """Drop a run's tasks once their results are checkpointed."""
+        with self._tx() as db:
+            db.execute("DELETE FROM tasks WHERE run_id = ?", (run_id,))
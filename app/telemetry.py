@@ -0,0 +1,234 @@
+import os, math, time, threading, contextvars
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# USD per 1K tokens, for the per-run cost estimate (defaults: gpt-4-turbo list price)
+LLM_PRICE_PROMPT = float(os.getenv("LLM_PRICE_PROMPT", "0.01"))
+LLM_PRICE_COMPLETION = float(os.getenv("LLM_PRICE_COMPLETION", "0.03"))
+
+PREFIX = "nist_agent"
+# Seconds; wide enough for a single fetch as well as a whole mapping stage
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def llm_cost(prompt_tokens: int, completion_tokens: int) -> float:
+    return prompt_tokens / 1000 * LLM_PRICE_PROMPT + completion_tokens / 1000 * LLM_PRICE_COMPLETION
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile; 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _fmt_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics:
+    """
+    Process-wide counters and histograms, rendered in the Prometheus text
+    exposition format for GET /metrics. Label values must stay low
+    cardinality (stage, span kind, tool name), never URLs.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        # name -> labels -> [count per bucket..., sum, count]
+        self._hists: Dict[str, Dict[Labels, List[float]]] = {}
+        self._help: Dict[str, str] = {}
+
+    def inc(self, metric: str, value: float = 1.0, help: str = "", **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(metric, help)
+            series = self._counters.setdefault(metric, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, metric: str, value: float, help: str = "", **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(metric, help)
+            h = self._hists.setdefault(metric, {}).get(key)
+            if h is None:
+                h = self._hists[metric][key] = [0.0] * (len(self.buckets) + 2)
+            for i, le in enumerate(self.buckets):
+                if value <= le:
+                    h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full = f"{PREFIX}_{name}"
+                lines += [f"# HELP {full} {self._help.get(name, '')}", f"# TYPE {full} counter"]
+                for labels, v in sorted(series.items()):
+                    lines.append(f"{full}{_fmt_labels(labels)} {v:g}")
+            for name, series in sorted(self._hists.items()):
+                full = f"{PREFIX}_{name}"
+                lines += [f"# HELP {full} {self._help.get(name, '')}", f"# TYPE {full} histogram"]
+                for labels, h in sorted(series.items()):
+                    for le, n in zip(self.buckets, h):
+                        le_label = 'le="%g"' % le
+                        lines.append(f"{full}_bucket{_fmt_labels(labels, le_label)} {n:g}")
+                    inf_label = 'le="+Inf"'
+                    lines.append(f"{full}_bucket{_fmt_labels(labels, inf_label)} {h[-1]:g}")
+                    lines.append(f"{full}_sum{_fmt_labels(labels)} {h[-2]:.6f}")
+                    lines.append(f"{full}_count{_fmt_labels(labels)} {h[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class Span:
+    __slots__ = ("kind", "name", "bytes", "prompt_tokens", "completion_tokens", "error")
+
+    def __init__(self, kind: str, name: str):
+        self.kind = kind
+        self.name = name
+        self.bytes = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.error = False
+
+    def add(self, bytes: int = 0, prompt_tokens: int = 0, completion_tokens: int = 0):
+        self.bytes += bytes
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+
+class RunTrace:
+    """
+    Per-run totals of every span finished while the run's context is
+    active. Span seconds are summed, so concurrent fetches or LLM calls
+    can add up to more than the stage's wall time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.kinds: Dict[str, Dict[str, float]] = {}
+        self._seconds: Dict[str, List[float]] = {}
+
+    def record(self, span: Span, seconds: float):
+        with self._lock:
+            if span.kind == "stage":
+                self.stages[span.name] = self.stages.get(span.name, 0.0) + seconds
+                return
+            k = self.kinds.setdefault(span.kind, {"count": 0, "errors": 0, "seconds": 0.0, "bytes": 0,
+                                                  "prompt_tokens": 0, "completion_tokens": 0})
+            k["count"] += 1
+            k["errors"] += span.error
+            k["seconds"] += seconds
+            k["bytes"] += span.bytes
+            k["prompt_tokens"] += span.prompt_tokens
+            k["completion_tokens"] += span.completion_tokens
+            self._seconds.setdefault(span.kind, []).append(seconds)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            kinds = {kind: {k: (round(v, 3) if isinstance(v, float) else v) for k, v in agg.items()
+                            if k not in ("prompt_tokens", "completion_tokens") or kind == "llm"}
+                     for kind, agg in self.kinds.items()}
+            for kind, seconds in self._seconds.items():
+                kinds[kind].update({f"p{q}": round(percentile(seconds, q), 3) for q in (50, 95, 99)})
+            llm = self.kinds.get("llm", {})
+            prompt, completion = int(llm.get("prompt_tokens", 0)), int(llm.get("completion_tokens", 0))
+            return {
+                "wall_seconds": round(time.perf_counter() - self._t0, 3),
+                "stages": {k: round(v, 3) for k, v in self.stages.items()},
+                "spans": kinds,
+                "tokens": {"prompt": prompt, "completion": completion},
+                "cost_usd": round(llm_cost(prompt, completion), 4),
+            }
+
+
+_trace: contextvars.ContextVar[Optional[RunTrace]] = contextvars.ContextVar("run_trace", default=None)
+_captured: contextvars.ContextVar[Optional[List[List]]] = contextvars.ContextVar("captured_spans", default=None)
+
+
+@contextmanager
+def trace_run() -> Iterator[RunTrace]:
+    """Collect spans from this context (and threads/tasks that copy it) into a RunTrace."""
+    trace = RunTrace()
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+@contextmanager
+def capture_spans() -> Iterator[List[List]]:
+    """
+    Also keep every span finished in this context as a plain list, so a
+    queue worker can send them to the process that owns the run (replay()).
+    """
+    spans: List[List] = []
+    token = _captured.set(spans)
+    try:
+        yield spans
+    finally:
+        _captured.reset(token)
+
+
+def replay(spans: List[List]):
+    """Record spans captured in another process in this one's metrics and the current run's trace."""
+    for kind, name, seconds, nbytes, prompt, completion, error in spans:
+        s = Span(kind, name)
+        s.add(nbytes, prompt, completion)
+        s.error = bool(error)
+        _finish(s, seconds)
+
+
+@contextmanager
+def span(kind: str, name: str = "") -> Iterator[Span]:
+    """
+    Time a unit of work. kind is one of stage, discovery, fetch, pdf_parse,
+    llm, mcp; name is a low-cardinality label (stage or tool name).
+    """
+    s = Span(kind, name)
+    t0 = time.perf_counter()
+    try:
+        yield s
+    except BaseException:
+        s.error = True
+        raise
+    finally:
+        _finish(s, time.perf_counter() - t0)
+
+
+def _finish(s: Span, seconds: float):
+    metrics.observe("span_seconds", seconds, "Wall time of instrumented work", kind=s.kind, name=s.name)
+    metrics.inc("spans_total", 1, "Instrumented operations by outcome",
+                kind=s.kind, name=s.name, status="error" if s.error else "ok")
+    if s.bytes:
+        metrics.inc("bytes_total", s.bytes, "Bytes downloaded, sent or parsed", kind=s.kind)
+    if s.prompt_tokens or s.completion_tokens:
+        metrics.inc("llm_tokens_total", s.prompt_tokens, "OpenAI tokens used", type="prompt")
+        metrics.inc("llm_tokens_total", s.completion_tokens, "OpenAI tokens used", type="completion")
+        metrics.inc("llm_cost_usd_total", llm_cost(s.prompt_tokens, s.completion_tokens),
+                    "Estimated OpenAI spend")
+    trace = _trace.get()
+    if trace is not None:
+        trace.record(s, seconds)
+    captured = _captured.get()
+    if captured is not None:
+        captured.append([s.kind, s.name, seconds, s.bytes, s.prompt_tokens, s.completion_tokens, s.error])
@@ -1,46 +1,208 @@
-import os, re, json, time, random, string
+import os, re, json, time, random, string, sqlite3, threading, contextvars
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Any, Dict
-from openai import OpenAI
+from typing import TYPE_CHECKING, Optional, Any, Dict, Callable, Iterable, List, TypeVar
+from urllib.parse import urlsplit, urlunsplit
 from dotenv import load_dotenv
 
+from llm_scheduler import get_scheduler, estimate_tokens, PRIORITY_BULK, LLM_COMPLETION_TOKENS
+import replay
+from telemetry import span
+
+if TYPE_CHECKING:  # the openai package takes ~0.7s to import; load it on the first LLM call
+    from openai import OpenAI
+    from openai.types.chat import ChatCompletion
+
 load_dotenv()
 
+ARTIFACTS_DIR = Path(os.getenv("ARTIFACTS_DIR", "./artifacts")).resolve()
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4-turbo")
+# Max LLM requests in flight per stage
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+
+T = TypeVar("T")
+R = TypeVar("R")
+
 def ensure_dir(p: Path):
     p.mkdir(parents=True, exist_ok=True)
 
-def write_text(path: Path, text: str, encoding="utf-8"):
-    ensure_dir(path.parent)
-    path.write_text(text, encoding=encoding)
+def open_sqlite(path: Path, **kwargs) -> sqlite3.Connection:
+    """A connection worker processes can share: WAL journal, up to 30s wait for the write lock."""
+    db = sqlite3.connect(str(path), timeout=30, check_same_thread=False, **kwargs)
+    db.execute("PRAGMA journal_mode=WAL")
+    return db
 
 def safe_filename(name: str) -> str:
     name = re.sub(r"[^a-zA-Z0-9._-]+", "_", name)
     return name.strip("_") or "file"
 
+def canonical_url(url: str) -> str:
+    """Lowercase scheme/host, drop default ports and #fragments."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+def stats_delta(after: Dict[str, Any], before: Dict[str, Any]) -> Dict[str, Any]:
+    """Difference of two counter snapshots (non-numeric values taken from `after`)."""
+    out = {}
+    for k, v in after.items():
+        b = before.get(k, 0)
+        out[k] = v - b if isinstance(v, (int, float)) and isinstance(b, (int, float)) else v
+    return out
+
 def run_id_str() -> str:
     return "".join(random.choices(string.ascii_lowercase + string.digits, k=8))
 
-def openai_chat(system: str, user: str, json_mode: bool = False) -> Any:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY not set")
-    client = OpenAI(api_key=api_key)
-
-    print("Awaiting GPT's response...")
-    resp = client.chat.completions.create(
-        model="gpt-4-turbo",
-        messages=[
-            {"role":"system","content":system},
-            {"role":"user","content":user}
-        ],
-        response_format={"type": "json_object"} if json_mode else None,
-        temperature=1,
+_client: Optional["OpenAI"] = None
+_client_lock = threading.Lock()
+
+def get_openai_client() -> "OpenAI":
+    """One client (and HTTP connection pool) per process, shared by all threads."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise RuntimeError("OPENAI_API_KEY not set")
+            # OPENAI_BASE_URL is honoured by the client itself (used by the benchmarks)
+            # retries are owned by the scheduler, which also adapts concurrency on 429s
+            from openai import OpenAI
+            _client = OpenAI(api_key=api_key, max_retries=0)
+        return _client
+
+def ordered_map(fn: Callable[[T], R], items: Iterable[T], workers: int) -> List[R]:
+    """
+    Apply `fn` to every item on up to `workers` threads. Results keep input
+    order; each call sees the caller's contextvars (the run's trace, the
+    LLM cache bypass).
+    """
+    items = list(items)
+    workers = max(1, workers)
+    if workers == 1 or len(items) <= 1:
+        return [fn(x) for x in items]
+    ctx = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as ex:
+        futures = [ex.submit(ctx.copy().run, fn, x) for x in items]
+        return [f.result() for f in futures]
+
+def llm_map(fn: Callable[[T], R], items: Iterable[T], concurrency: Optional[int] = None) -> List[R]:
+    """Run `fn` (typically wrapping openai_chat) over `items`, LLM_CONCURRENCY at a time by default."""
+    return ordered_map(fn, items, concurrency or LLM_CONCURRENCY)
+
+# on_token(delta) receives completion text as it arrives; on_token(None) means "discard what
+# you got so far", sent when a failed streamed attempt is retried from the start
+TokenFn = Callable[[Optional[str]], None]
+
+def _collect_stream(chunks, on_token: TokenFn) -> "ChatCompletion":
+    """Forward a streamed completion's deltas and reassemble it into one ChatCompletion."""
+    from openai.types.chat import ChatCompletion
+    parts, usage, finish, first = [], None, None, None
+    for chunk in chunks:
+        first = first or chunk
+        if chunk.usage is not None:
+            usage = chunk.usage.model_dump(mode="json")
+        for choice in chunk.choices:
+            finish = choice.finish_reason or finish
+            if choice.delta.content:
+                parts.append(choice.delta.content)
+                on_token(choice.delta.content)
+    return ChatCompletion.model_validate({
+        "id": first.id if first else "",
+        "object": "chat.completion",
+        "created": first.created if first else int(time.time()),
+        "model": first.model if first else OPENAI_MODEL,
+        "choices": [{"index": 0, "finish_reason": finish or "stop",
+                     "message": {"role": "assistant", "content": "".join(parts)}}],
+        "usage": usage,
+    })
+
+def _chat_completion(system: str, user: str, json_mode: bool, on_token: Optional[TokenFn] = None) -> "ChatCompletion":
+    from openai.types.chat import ChatCompletion
+    sent = []
+
+    def create() -> "ChatCompletion":
+        kwargs = dict(
+            model=OPENAI_MODEL,
+            messages=[
+                {"role":"system","content":system},
+                {"role":"user","content":user}
+            ],
+            response_format={"type": "json_object"} if json_mode else None,
+            temperature=1,
+        )
+        if on_token is None:
+            return get_openai_client().chat.completions.create(**kwargs)
+        if sent:
+            on_token(None)  # the scheduler is retrying after a partial stream
+
+        def forward(delta: str):
+            sent.append(True)
+            on_token(delta)
+
+        stream = get_openai_client().chat.completions.create(
+            **kwargs, stream=True, stream_options={"include_usage": True})
+        return _collect_stream(stream, forward)
+
+    # a streamed completion is recorded like any other, so fixtures serve both kinds of call
+    return replay.call(
+        "llm",
+        {"model": OPENAI_MODEL, "system": system, "user": user, "json_mode": json_mode},
+        create,
+        encode=lambda r: r.model_dump(mode="json"),
+        decode=ChatCompletion.model_validate,
     )
-    print("Received")
-    content = resp.choices[0].message.content
+
+def _json_or_none(content: Optional[str]) -> Any:
+    try:
+        return json.loads(content)
+    except (TypeError, ValueError):
+        return None
+
+def openai_chat(system: str, user: str, json_mode: bool = False, use_cache: bool = True,
+                priority: int = PRIORITY_BULK, on_token: Optional[TokenFn] = None) -> Any:
+    """
+    One chat completion through the cache and the scheduler. With `on_token`
+    the completion is streamed and its text forwarded as it arrives; a
+    cached or replayed response is forwarded in one piece.
+    """
+    # local import: llm_cache depends on this module for ARTIFACTS_DIR
+    from llm_cache import cache_key, get_llm_cache
+
+    cache = get_llm_cache() if use_cache else None
+    key = cache_key(OPENAI_MODEL, system, user, json_mode) if cache else None
+    content = cache.get(key) if cache else None
+    if json_mode and content is not None and _json_or_none(content) is None:
+        content = None  # cached before malformed completions were kept out; ask again
+
+    streamed = False
+
+    def forward(delta: Optional[str]):
+        nonlocal streamed
+        streamed = True
+        on_token(delta)
+
+    if content is None:
+        with span("llm", "chat") as sp:
+            resp = get_scheduler().run(
+                lambda: _chat_completion(system, user, json_mode, forward if on_token else None),
+                est_tokens=estimate_tokens(system, user) + LLM_COMPLETION_TOKENS,
+                priority=priority,
+            )
+            usage = getattr(resp, "usage", None)
+            if usage is not None:
+                sp.add(prompt_tokens=usage.prompt_tokens or 0, completion_tokens=usage.completion_tokens or 0)
+        content = resp.choices[0].message.content
+        # a malformed JSON completion is not cached, or it would be replayed as {} for the whole TTL
+        if cache and content and (not json_mode or _json_or_none(content) is not None):
+            cache.put(key, OPENAI_MODEL, content)
+    if on_token is not None and not streamed and content:
+        on_token(content)
+
     if json_mode:
-        try:
-            return json.loads(content)
-        except Exception:
-            return {}
+        parsed = _json_or_none(content)
+        return {} if parsed is None else parsed
     return content
@@ -0,0 +1,235 @@
+import os, time, threading, traceback
+import multiprocessing as mp
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import fetching, pdfparse
+from extraction import iter_extracted
+from incremental import filter_relevant_incremental, map_controls_incremental
+from llm_cache import bypass as llm_cache_bypass, bypassed as llm_cache_bypassed
+from state import get_state
+from streaming import STREAM_STAGES, merge_stats
+from taskqueue import Task, TaskQueue, worker_name
+from telemetry import capture_spans, replay, span
+
+# Worker processes per run (0: everything runs in this process); main.py --worker N sets it per run
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "0"))
+# Seconds between queue polls, for idle workers and for the run waiting on them
+TASK_POLL_SECONDS = float(os.getenv("TASK_POLL_SECONDS", "0.2"))
+
+# deeper stages are claimed first, so documents finish instead of piling up between stages
+_PRIORITY = {"extract": 0, "relevance": 1, "mapping": 2}
+
+# run options every task of a run carries
+_OPTIONS = ("out_dir", "reuse", "bypass_llm_cache")
+
+FollowUp = List[Tuple[str, str, int, Dict[str, Any]]]
+Progress = Callable[[str, Dict[str, Any]], None]
+
+
+def _next(kind: str, task: Task) -> FollowUp:
+    return [(kind, task.key, _PRIORITY[kind], {k: task.payload[k] for k in _OPTIONS})]
+
+
+# ---------- per-document tasks ----------
+# Each handler returns (result, follow-up tasks). Inputs come from the result
+# of the document's previous task, so payloads stay small.
+
+def _extract(q: TaskQueue, task: Task) -> Tuple[Dict, FollowUp]:
+    source = task.payload["source"]
+    item, doc_stats = None, {}
+    for _, item, doc_stats in iter_extracted([source], Path(task.payload["out_dir"])):
+        pass
+    if item is None:
+        return {"item": None, "pdf": doc_stats}, []
+    # classified before anything is recorded, as in the other pipeline modes
+    change = get_state().classify([item])[item["id"]]
+    return {"item": item, "change": change, "pdf": doc_stats}, _next("relevance", task)
+
+
+def _relevance(q: TaskQueue, task: Task) -> Tuple[Dict, FollowUp]:
+    item = q.result(task.run_id, "extract", task.key)["item"]
+    stats: Dict = {}
+    kept = filter_relevant_incremental([item], get_state(), reuse=task.payload["reuse"], stats=stats)
+    return {"kept": kept[0] if kept else None, "stats": stats}, (_next("mapping", task) if kept else [])
+
+
+def _mapping(q: TaskQueue, task: Task) -> Tuple[Dict, FollowUp]:
+    item = q.result(task.run_id, "relevance", task.key)["kept"]
+    stats: Dict = {}
+    mapped = map_controls_incremental([item], get_state(), reuse=task.payload["reuse"], stats=stats)
+    return {"mapped": mapped[0], "stats": stats}, []
+
+
+_HANDLERS = {"extract": _extract, "relevance": _relevance, "mapping": _mapping}
+
+
+@contextmanager
+def _lease(q: TaskQueue, task: Task, owner: str) -> Iterator[None]:
+    """Renew the task's lease in the background while it is being worked on."""
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(q.lease_seconds / 3):
+            if not q.renew(task, owner):
+                return
+
+    t = threading.Thread(target=renew, daemon=True, name=f"lease-{task.id}")
+    t.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        t.join()
+
+
+def _limit_shares(workers: int) -> Dict[str, int]:
+    """Each worker's part of the per-host download and PDF process limits, which are meant per run."""
+    n = max(1, workers)
+    return {"per_host": max(1, fetching.FETCH_PER_HOST // n), "pdf_workers": max(1, pdfparse.PDF_WORKERS // n)}
+
+
+def run_worker(run_id: str, limits: Optional[Dict[str, int]] = None):
+    """
+    Work the run's tasks until none are pending or leased (the entry point
+    of a worker process). Each result carries the task's spans and its
+    wall-clock window, which run_queued records for the run.
+    """
+    if limits:
+        # before this process's fetch engine and PDF pool exist
+        fetching.FETCH_PER_HOST = limits["per_host"]
+        pdfparse.PDF_WORKERS = limits["pdf_workers"]
+    q = TaskQueue()
+    owner = worker_name()
+    while True:
+        task = q.claim(run_id, owner)
+        if task is None:
+            if not q.open_tasks(run_id):
+                return
+            time.sleep(TASK_POLL_SECONDS)
+            continue
+        started = time.time()
+        try:
+            with _lease(q, task, owner), llm_cache_bypass(task.payload["bypass_llm_cache"]), \
+                    capture_spans() as spans:
+                result, follow_up = _HANDLERS[task.kind](q, task)
+        except Exception as e:
+            q.fail(task, owner, f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}")
+            continue
+        result["telemetry"] = {"spans": spans, "window": [started, time.time()]}
+        q.complete(task, owner, result, follow_up)
+
+
+# ---------- the run's side ----------
+
+def _spawn(run_id: str, n: int, limits: Dict[str, int]) -> "mp.process.BaseProcess":
+    # spawn, not fork: the parent has scheduler, HTTP and SQLite threads that must not be copied mid-flight.
+    # Not daemonic, since large PDFs are parsed in a process pool of their own.
+    p = mp.get_context("spawn").Process(target=run_worker, args=(run_id, limits), name=f"worker-{n}")
+    p.start()
+    return p
+
+
+def _record_telemetry(results: Iterable[Tuple[Tuple[str, str], Dict]]):
+    """
+    Spans from the worker processes go into this process's metrics and the
+    run's trace; each stage is timed from its first task's start to its
+    last task's end, as a stage span of the other modes would be.
+    """
+    windows: Dict[str, List[float]] = {}
+    for (kind, _), res in results:
+        tel = res.get("telemetry") or {}
+        replay(tel.get("spans") or [])
+        if tel.get("window"):
+            start, end = tel["window"]
+            w = windows.setdefault(kind, [start, end])
+            w[0], w[1] = min(w[0], start), max(w[1], end)
+    for kind in STREAM_STAGES:
+        if kind in windows:
+            start, end = windows[kind]
+            replay([["stage", kind, end - start, 0, 0, 0, False]])
+
+
+def run_queued(run_id: str, sources: List[Dict], out_dir: Path, workers: int, reuse: bool = True,
+               progress: Optional[Progress] = None) -> Dict[str, Dict]:
+    """
+    Extraction, relevance and mapping as per-document tasks in the durable
+    task queue, worked by `workers` processes; returns the same stage
+    outputs as run_stream. The tasks are keyed by source id, so running
+    this again for an interrupted run only does the tasks that were not
+    finished. A worker that dies is replaced and its task released.
+    """
+    progress = progress or (lambda stage, event: None)
+    q = TaskQueue()
+    q.retry_failed(run_id)
+    q.release_dead(run_id)
+    common = {"out_dir": str(out_dir), "reuse": reuse, "bypass_llm_cache": llm_cache_bypassed()}
+    q.enqueue(run_id, [("extract", s["id"], _PRIORITY["extract"], {**common, "source": s}) for s in sources])
+
+    with span("stage", "queue"):
+        for st in STREAM_STAGES:
+            progress(st, {"status": "started", "workers": workers})
+        limits = _limit_shares(workers)
+        procs = [_spawn(run_id, n, limits) for n in range(max(1, workers))]
+        restarts, last = 0, None
+        try:
+            while True:
+                counts = q.counts(run_id)
+                if counts != last:
+                    progress("queue", {"status": "running", **counts})
+                    last = counts
+                if not any(counts.get(s, 0) for s in ("pending", "leased")):
+                    break
+                for n, p in enumerate(procs):
+                    if p.exitcode not in (None, 0):
+                        if restarts >= max(1, workers) * q.max_attempts:
+                            raise RuntimeError(f"Worker processes keep exiting (last exit code {p.exitcode})")
+                        restarts += 1
+                        q.release_dead(run_id)
+                        procs[n] = _spawn(run_id, n, limits)
+                time.sleep(TASK_POLL_SECONDS)
+        finally:
+            for p in procs:
+                p.join(timeout=5)
+                if p.is_alive():
+                    p.terminate()
+
+    failed = q.failures(run_id)
+    if failed:
+        kind, key, error = failed[0]
+        raise RuntimeError(f"{len(failed)} task(s) failed; first: {kind} {key}: {error.splitlines()[0]}")
+
+    results = q.results(run_id)
+    _record_telemetry(results.items())
+    extracted, changes, pdf_stats = [], {}, []
+    filtered, mapped = [], []
+    relevance_stats: Dict = {}
+    mapping_stats: Dict = {}
+    for s in sources:
+        done = results.get(("extract", s["id"]))
+        if done is None:
+            continue
+        if done["pdf"]:
+            pdf_stats.append({"id": s["id"], **done["pdf"]})
+        if done["item"] is None:
+            continue
+        extracted.append(done["item"])
+        changes[s["id"]] = done["change"]
+        judged = results[("relevance", s["id"])]
+        merge_stats(relevance_stats, judged["stats"])
+        if judged["kept"] is None:
+            continue
+        filtered.append(judged["kept"])
+        done = results[("mapping", s["id"])]
+        merge_stats(mapping_stats, done["stats"])
+        mapped.append(done["mapped"])
+
+    progress("extract", {"status": "done", "extracted": len(extracted)})
+    progress("relevance", {"status": "done", "kept": len(filtered)})
+    progress("mapping", {"status": "done", "llm_calls": mapping_stats.get("llm_calls", 0)})
+    return {
+        "extract": {"extracted": extracted, "changes": changes, "stats": {"pdf": pdf_stats} if pdf_stats else {}},
+        "relevance": {"filtered": filtered, "stats": relevance_stats},
+        "mapping": {"mapped": mapped, "stats": mapping_stats},
+    }
@@ -0,0 +1,97 @@
+"""
+Serial vs concurrent extraction against a local HTTP stand-in for csrc.nist.gov.
+
+    python bench/bench_fetch.py --docs 10 --latency 0.3 --concurrency 8
+
+Every page is served after `--latency` seconds, so the numbers show how much
+of a run is spent waiting on the network rather than on parsing.
+"""
+import argparse, os, sys, tempfile, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+# Measure the network path, not the document cache
+os.environ["DOC_CACHE"] = "0"
+
+from extraction import extract_all  # noqa: E402
+from fetching import FetchEngine  # noqa: E402
+
+PAGE = """<html><head><title>SP 800-{n}</title></head><body><article>
+<h1>NIST SP 800-{n}</h1>
+<p>This publication describes secure software development practices (SSDF),
+software bill of materials (SBOM) handling and CI/CD pipeline hardening.</p>
+{body}
+</article></body></html>"""
+
+
+def make_handler(latency: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            n = self.path.strip("/").split("/")[-1] or "0"
+            body = "\n".join(f"<p>Paragraph {i} of document {n} on supply chain risk.</p>" for i in range(50))
+            data = PAGE.format(n=n, body=body).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(latency: float):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_once(sources, concurrency: int, per_host: int):
+    engine = FetchEngine(concurrency=concurrency, per_host=per_host)
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        items = extract_all(sources, out_dir=Path(tmp), engine=engine)
+        elapsed = time.perf_counter() - t0
+    engine.close()
+    return items, elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--docs", type=int, default=10)
+    ap.add_argument("--latency", type=float, default=0.3)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--per-host", type=int, default=8)
+    args = ap.parse_args()
+
+    server = serve(args.latency)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    sources = [
+        {"id": f"src{i+1:02d}", "title": f"SP 800-{i}", "url": f"{base}/pubs/{i}", "source": "bench", "published": ""}
+        for i in range(args.docs)
+    ]
+
+    serial_items, serial_t = run_once(sources, 1, 1)
+    conc_items, conc_t = run_once(sources, args.concurrency, args.per_host)
+    server.shutdown()
+
+    same = [x["id"] for x in serial_items] == [x["id"] for x in conc_items] and \
+        [x["content_hash"] for x in serial_items] == [x["content_hash"] for x in conc_items]
+
+    print(f"docs={args.docs} latency={args.latency}s")
+    print(f"serial      : {serial_t:6.2f}s")
+    print(f"concurrent  : {conc_t:6.2f}s  (concurrency={args.concurrency}, per_host={args.per_host})")
+    print(f"speedup     : {serial_t / conc_t:5.1f}x")
+    print(f"same output : {same}")
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Serial vs fanned-out relevance + mapping calls against a local mock of the
+chat completions endpoint.
+
+    python bench/bench_llm.py --docs 5 --latency 0.2 --concurrency 8
+"""
+import argparse, os, sys, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from mock_openai import MockOpenAI  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--docs", type=int, default=5)
+    ap.add_argument("--latency", type=float, default=0.2)
+    ap.add_argument("--concurrency", type=int, default=8)
+    args = ap.parse_args()
+
+    mock = MockOpenAI(latency=args.latency).start()
+    os.environ["OPENAI_BASE_URL"] = mock.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    # every call must reach the mock
+    os.environ["LLM_CACHE"] = "0"
+
+    from relevance import filter_relevant
+    from mapping import map_controls
+
+    extracted = [
+        {"id": f"src{i+1:02d}", "title": f"SP 800-{i}", "url": f"https://csrc.nist.gov/pubs/{i}",
+         "markdown": f"NIST SP 800-{i}: SSDF practices for CI/CD pipelines and SBOM."}
+        for i in range(args.docs)
+    ]
+
+    timings, outputs = {}, {}
+    for label, conc in (("serial", 1), ("concurrent", args.concurrency)):
+        calls_before = mock.calls
+        t0 = time.perf_counter()
+        mapped = map_controls(filter_relevant(extracted, concurrency=conc), concurrency=conc)
+        timings[label] = (time.perf_counter() - t0, mock.calls - calls_before)
+        outputs[label] = mapped
+    mock.stop()
+
+    for label, (t, calls) in timings.items():
+        print(f"{label:<11}: {t:6.2f}s  ({calls} LLM calls)")
+    print(f"speedup    : {timings['serial'][0] / timings['concurrent'][0]:5.1f}x  (max in flight {mock.max_in_flight})")
+    same = outputs["serial"] == outputs["concurrent"]
+    print(f"same output: {same}")
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
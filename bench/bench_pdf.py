@@ -0,0 +1,102 @@
+"""
+PDF extraction throughput and peak memory across document sizes.
+
+    python bench/bench_pdf.py --pages 50 200 500 --workers 4
+
+For each size a synthetic text PDF is generated and parsed in a fresh
+subprocess twice: once the old way (whole body in a BytesIO, pages walked on
+one core) and once through pdfparse.pdf_to_markdown. Peak RSS should stay
+roughly flat for the streaming path as the page count grows.
+"""
+import argparse, io, json, os, resource, subprocess, sys, tempfile, time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parents[1] / "app"
+
+
+def make_pdf(pages: int, lines: int = 40) -> bytes:
+    """Minimal uncompressed PDF with `lines` lines of Helvetica text per page."""
+    objs = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(pages))
+    objs.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    font_id = 3 + 2 * pages
+    for i in range(pages):
+        objs.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>".encode()
+        )
+        stream = "".join(
+            f"BT /F1 10 Tf 50 {760 - 18 * j} Td (SA-{j % 23 + 1} supply chain risk, SBOM and CI/CD pipeline "
+            f"controls, page {i + 1} line {j}) Tj ET\n"
+            for j in range(lines)
+        ).encode()
+        objs.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"endstream")
+    objs.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for n, o in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += f"{n} 0 obj\n".encode() + o + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{off:010d} 00000 n \n".encode() for off in offsets)
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+def _child(mode: str, path: str, workers: int):
+    sys.path.insert(0, str(APP_DIR))
+    t0 = time.perf_counter()
+    if mode == "legacy":
+        import pdfplumber
+        data = Path(path).read_bytes()
+        with pdfplumber.open(io.BytesIO(data)) as pdf:
+            parts = [f"\n\n## [Page {i}]\n\n{p.extract_text() or ''}\n" for i, p in enumerate(pdf.pages, start=1)]
+        md = "\n".join(parts).strip()
+        pages = len(parts)
+    else:
+        from pdfparse import PdfOptions, pdf_to_markdown
+        md, st = pdf_to_markdown(path, PdfOptions(workers=workers))
+        pages = st["pages_extracted"]
+    elapsed = time.perf_counter() - t0
+    print(json.dumps({
+        "pages": pages,
+        "seconds": round(elapsed, 2),
+        "pages_per_sec": round(pages / elapsed, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "md_chars": len(md),
+    }))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--pages", type=int, nargs="+", default=[50, 200, 500])
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        _child(args.child[0], args.child[1], args.workers)
+        return
+
+    print(f"{'pages':>6} {'size MB':>8} {'mode':>10} {'sec':>7} {'pages/s':>8} {'peak RSS MB':>12}")
+    for n in args.pages:
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+            f.write(make_pdf(n))
+            path = f.name
+        size_mb = os.path.getsize(path) / 1e6
+        try:
+            for mode in ("legacy", "streaming"):
+                out = subprocess.run(
+                    [sys.executable, __file__, "--workers", str(args.workers), "--child", mode, path],
+                    check=True, capture_output=True, text=True,
+                ).stdout.strip().splitlines()[-1]
+                r = json.loads(out)
+                print(f"{n:>6} {size_mb:>8.1f} {mode:>10} {r['seconds']:>7} {r['pages_per_sec']:>8} {r['peak_rss_mb']:>12}")
+        finally:
+            os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
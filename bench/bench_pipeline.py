@@ -0,0 +1,249 @@
+"""
+End-to-end run_workflow benchmark over recorded SerpAPI, source, OpenAI and MCP traffic.
+
+    # 1) capture real responses (needs the usual API keys; --publish also opens a real PR)
+    python bench/bench_pipeline.py record --fixtures bench/fixtures --limits 5 10
+    # 2) replay them offline with simulated latency; writes a report for the current commit
+    python bench/bench_pipeline.py replay --fixtures bench/fixtures --limits 5 10 \\
+        --latency "http=0.2,llm=1.0,mcp=0.3" --repeat 3 --out before.json
+    # 3) compare reports taken on two commits
+    python bench/bench_pipeline.py compare before.json after.json
+
+Every run is a fresh subprocess with an empty ARTIFACTS_DIR and working
+directory, so the document cache, LLM cache and state index start cold and
+peak RSS belongs to that run alone. Replay needs no credentials.
+"""
+import argparse, json, os, statistics, subprocess, sys, tempfile, time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+APP = ROOT / "app"
+STAGES = ("discover", "extract", "relevance", "mapping", "summary", "publish")
+KINDS = ("discovery", "fetch", "pdf_parse", "llm", "mcp")
+MARKER = "BENCH_RESULT "
+
+# Placeholders so the pipeline's own credential checks pass; replayed calls never leave the process
+REPLAY_ENV = {
+    "OPENAI_API_KEY": "sk-replay",
+    "SERPAPI_KEY": "replay",
+    "GITHUB_REPO": "replay/replay",
+    "MCP_GITHUB_URL": "http://replay.invalid/mcp/",
+    "MCP_GITHUB_AUTH": "bearer",
+    "MCP_GITHUB_TOKEN": "replay",
+}
+
+
+# ---------- child: one run_workflow call ----------
+
+def run_child(args):
+    sys.path.insert(0, str(APP))
+    import resource
+    import replay
+    from orchestrator import run_workflow
+
+    t0 = time.perf_counter()
+    error, res = None, {}
+    try:
+        res = run_workflow(topic=args.topic, limit=args.limit, dry_run=not args.publish, workers=args.workers)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    wall = time.perf_counter() - t0
+
+    meta = res.get("meta", {})
+    out = {
+        "limit": args.limit,
+        "error": error,
+        "wall_seconds": round(wall, 3),
+        # ru_maxrss is KiB on Linux; children are the PDF worker processes
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_rss_children_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "items": {
+            "found": res.get("found", 0),
+            "extracted": res.get("extracted", 0),
+            "kept": res.get("kept", 0),
+            "sections": meta.get("mapping", {}).get("sections", 0),
+        },
+        "telemetry": res.get("telemetry", {}),
+        "replay": replay.stats(),
+    }
+    print(MARKER + json.dumps(out), flush=True)
+
+
+def spawn(mode: str, limit: int, args) -> dict:
+    with tempfile.TemporaryDirectory(prefix="bench-pipeline-") as work:
+        env = {**os.environ, "REPLAY_MODE": mode, "REPLAY_DIR": str(Path(args.fixtures).resolve()),
+               "ARTIFACTS_DIR": str(Path(work) / "artifacts")}
+        if mode == "replay":
+            env["REPLAY_LATENCY"] = args.latency
+            for k, v in REPLAY_ENV.items():
+                env.setdefault(k, v)
+        cmd = [sys.executable, str(Path(__file__).resolve()), "_run", "--limit", str(limit), "--topic", args.topic]
+        if args.publish:
+            cmd.append("--publish")
+        cmd += ["--workers", str(args.workers)]
+        proc = subprocess.run(cmd, cwd=work, env=env, capture_output=True, text=True)
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(MARKER):
+            return json.loads(line[len(MARKER):])
+    return {"limit": limit, "error": f"exit {proc.returncode}: {proc.stderr.strip()[-500:]}"}
+
+
+# ---------- reporting ----------
+
+def _stage_items(run: dict) -> dict:
+    items = run.get("items", {})
+    return {"discover": items.get("found", 0), "extract": items.get("found", 0),
+            "relevance": items.get("extracted", 0), "mapping": items.get("sections", 0),
+            "summary": 1, "publish": 1}
+
+
+def summarize(runs: list) -> dict:
+    """Median over repeats of every number the report compares."""
+    ok = [r for r in runs if not r.get("error")]
+    if not ok:
+        return {"error": runs[0].get("error") if runs else "no runs"}
+
+    def med(values):
+        values = [v for v in values if v is not None]
+        return round(statistics.median(values), 3) if values else None
+
+    out = {
+        "runs": len(ok),
+        "wall_seconds": med([r["wall_seconds"] for r in ok]),
+        "peak_rss_mb": med([r["peak_rss_mb"] for r in ok]),
+        "peak_rss_children_mb": med([r["peak_rss_children_mb"] for r in ok]),
+        "cost_usd": med([r["telemetry"].get("cost_usd") for r in ok]),
+        "stages": {}, "calls": {},
+    }
+    for stage in STAGES:
+        secs = med([r["telemetry"].get("stages", {}).get(stage) for r in ok])
+        if secs is None:
+            continue
+        items = _stage_items(ok[0])[stage]
+        out["stages"][stage] = {"seconds": secs, "items": items,
+                                "items_per_sec": round(items / secs, 2) if secs else None}
+    for kind in KINDS:
+        spans = [r["telemetry"].get("spans", {}).get(kind) for r in ok]
+        spans = [s for s in spans if s]
+        if spans:
+            out["calls"][kind] = {k: med([s.get(k) for s in spans]) for k in ("count", "errors", "p50", "p95", "p99")}
+    misses = sum(v for r in ok for k, v in r.get("replay", {}).items() if k.endswith("_missed"))
+    if misses:
+        out["replay_misses"] = misses
+    return out
+
+
+def print_summary(limit: int, s: dict):
+    if "error" in s:
+        print(f"limit={limit}: FAILED {s['error']}")
+        return
+    print(f"limit={limit}: wall {s['wall_seconds']}s, peak RSS {s['peak_rss_mb']} MB "
+          f"(+{s['peak_rss_children_mb']} MB workers), est. cost ${s['cost_usd']}"
+          + (f", {s['replay_misses']} replay misses" if s.get("replay_misses") else ""))
+    for stage, st in s["stages"].items():
+        print(f"  {stage:<10} {st['seconds']:8.3f}s  {st['items']:4d} items  {st['items_per_sec'] or 0:8.2f}/s")
+    for kind, c in s["calls"].items():
+        print(f"  {kind:<10} {c['count']:5.0f} calls  p50 {c['p50']:.3f}s  p95 {c['p95']:.3f}s  "
+              f"p99 {c['p99']:.3f}s  errors {c['errors']:.0f}")
+
+
+def git_commit() -> str:
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                             text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return sha + ("-dirty" if dirty else "")
+    except Exception:
+        return "unknown"
+
+
+# ---------- commands ----------
+
+def cmd_record(args):
+    for limit in args.limits:
+        run = spawn("record", limit, args)
+        print(f"limit={limit}: " + (f"FAILED {run['error']}" if run.get("error") else
+                                    f"recorded {run.get('replay', {})} in {run['wall_seconds']}s"))
+
+
+def cmd_replay(args):
+    report = {"commit": git_commit(), "created_at": time.time(), "latency": args.latency,
+              "fixtures": str(args.fixtures), "publish": args.publish, "limits": {}}
+    failed = False
+    for limit in args.limits:
+        runs = [spawn("replay", limit, args) for _ in range(args.repeat)]
+        s = summarize(runs)
+        failed |= "error" in s
+        report["limits"][str(limit)] = {"summary": s, "runs": runs}
+        print_summary(limit, s)
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"report written to {args.out} (commit {report['commit']})")
+    if failed:
+        sys.exit(1)
+
+
+def _pct(a, b) -> str:
+    if a in (None, 0) or b is None:
+        return ""
+    return f"{(b - a) / a * 100:+.1f}%"
+
+
+def cmd_compare(args):
+    base = json.loads(Path(args.base).read_text(encoding="utf-8"))
+    head = json.loads(Path(args.head).read_text(encoding="utf-8"))
+    print(f"{base['commit']} -> {head['commit']}")
+    for limit, b in base["limits"].items():
+        h = head["limits"].get(limit)
+        if not h:
+            continue
+        b, h = b["summary"], h["summary"]
+        if "error" in b or "error" in h:
+            print(f"limit={limit}: cannot compare ({b.get('error') or h.get('error')})")
+            continue
+        print(f"limit={limit}")
+        rows = [("wall_seconds", b["wall_seconds"], h["wall_seconds"]),
+                ("peak_rss_mb", b["peak_rss_mb"], h["peak_rss_mb"]),
+                ("cost_usd", b["cost_usd"], h["cost_usd"])]
+        rows += [(f"{st}.seconds", b["stages"][st]["seconds"], h["stages"].get(st, {}).get("seconds"))
+                 for st in b["stages"]]
+        rows += [(f"{k}.{m}", b["calls"][k][m], h["calls"].get(k, {}).get(m))
+                 for k in b["calls"] for m in ("count", "p95")]
+        for name, x, y in rows:
+            print(f"  {name:<20} {x!s:>10} -> {y!s:>10}  {_pct(x, y)}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0],
+                                 formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for name in ("record", "replay"):
+        p = sub.add_parser(name)
+        p.add_argument("--fixtures", default=str(ROOT / "bench" / "fixtures"))
+        p.add_argument("--limits", type=int, nargs="+", default=[5, 10])
+        p.add_argument("--topic", default="NIST SP 800 updates")
+        p.add_argument("--publish", action="store_true", help="Include the MCP publish stage")
+        p.add_argument("--workers", type=int, default=0,
+                       help="Worker processes for the task queue (their spans are counted in the report; "
+                            "peak RSS is reported separately for child processes)")
+        if name == "replay":
+            p.add_argument("--latency", default="http=0.1,llm=0.8,mcp=0.2",
+                           help="Seconds per replayed call, overall or per kind (http, llm, mcp)")
+            p.add_argument("--repeat", type=int, default=1)
+            p.add_argument("--out", help="Write the JSON report here")
+    c = sub.add_parser("compare")
+    c.add_argument("base")
+    c.add_argument("head")
+    child = sub.add_parser("_run")
+    child.add_argument("--limit", type=int, required=True)
+    child.add_argument("--topic", required=True)
+    child.add_argument("--publish", action="store_true")
+    child.add_argument("--workers", type=int, default=0)
+
+    args = ap.parse_args()
+    {"record": cmd_record, "replay": cmd_replay, "compare": cmd_compare, "_run": run_child}[args.cmd](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Publishing round-trips against an in-process stand-in for the GitHub MCP server.
+
+    python bench/bench_publish.py --files 40 --unchanged 30 --latency 0.05
+
+The stand-in counts every tool call and sleeps `--latency` per call. It is
+run twice: with `push_files` available (one commit) and without it
+(parallel create_or_update_file). `--unchanged` files already exist on the
+base branch with identical content and must not be re-uploaded.
+"""
+import argparse, asyncio, os, sys, time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from fastmcp import FastMCP  # noqa: E402
+
+
+def make_server(base_files: dict, latency: float, with_push_files: bool):
+    mcp = FastMCP("github-standin")
+    calls = Counter()
+    commits = []
+
+    async def tick(name: str):
+        calls[name] += 1
+        await asyncio.sleep(latency)
+
+    @mcp.tool
+    async def create_branch(owner: str, repo: str, branch: str, from_branch: str) -> dict:
+        await tick("create_branch")
+        return {"ref": f"refs/heads/{branch}"}
+
+    @mcp.tool
+    async def get_file_contents(owner: str, repo: str, path: str, ref: str = "main"):
+        await tick("get_file_contents")
+        from publishing import git_blob_sha
+        if path in base_files:
+            return {"path": path, "sha": git_blob_sha(base_files[path])}
+        entries = [{"name": p.rsplit("/", 1)[-1], "path": p, "type": "file", "sha": git_blob_sha(c)}
+                   for p, c in base_files.items() if p.rsplit("/", 1)[0] == path.strip("/")]
+        return entries or {"status": "404", "message": "Not Found"}
+
+    @mcp.tool
+    async def create_or_update_file(owner: str, repo: str, branch: str, path: str, content: str,
+                                    message: str, sha: str = "") -> dict:
+        await tick("create_or_update_file")
+        commits.append([path])
+        return {"commit": {"sha": f"c{len(commits)}"}}
+
+    if with_push_files:
+        @mcp.tool
+        async def push_files(owner: str, repo: str, branch: str, files: list, message: str) -> dict:
+            await tick("push_files")
+            commits.append([f["path"] for f in files])
+            return {"commit": {"sha": f"c{len(commits)}"}}
+
+    @mcp.tool
+    async def create_pull_request(owner: str, repo: str, title: str, body: str, base: str, head: str,
+                                  draft: bool = False) -> dict:
+        await tick("create_pull_request")
+        return {"html_url": f"https://github.com/{owner}/{repo}/pull/1"}
+
+    return mcp, calls, commits
+
+
+def legacy_calls(n_files: int) -> int:
+    # list_tools + create_branch + one create_or_update_file per file + create_pull_request
+    return n_files + 3
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--files", type=int, default=40)
+    ap.add_argument("--unchanged", type=int, default=30)
+    ap.add_argument("--latency", type=float, default=0.05)
+    args = ap.parse_args()
+
+    os.environ.setdefault("GITHUB_REPO", "acme/nist-reports")
+    os.environ.setdefault("MCP_GITHUB_URL", "http://standin.invalid/mcp/")
+    os.environ.setdefault("MCP_GITHUB_TOKEN", "standin")
+    from publishing import MCPGitHubPublisher
+
+    files = {f"sources/2026-01-01/src{i:02d}.md": f"# Source {i}\n\nbody {i}\n" for i in range(args.files)}
+    files["docs/summaries/2026-01-01-nist-sp800-summary.md"] = "# Summary\n"
+    base_files = dict(list(files.items())[:args.unchanged])
+
+    print(f"files={args.files} unchanged={args.unchanged} latency={args.latency}s/call")
+    print(f"legacy (sequential upserts): ~{legacy_calls(len(files))} calls, "
+          f"~{legacy_calls(len(files)) * args.latency:.2f}s, {len(files)} commits")
+    for with_push in (True, False):
+        server, calls, commits = make_server(base_files, args.latency, with_push)
+        pub = MCPGitHubPublisher(transport=server)
+        for attempt in ("cold", "warm"):
+            calls.clear()
+            commits.clear()
+            t0 = time.perf_counter()
+            url = asyncio.run(pub.publish_as_pr("feat/x", "t", "b", files))
+            elapsed = time.perf_counter() - t0
+            uploaded = sum(len(c) for c in commits)
+            print(f"{pub.stats['mode']:<10} {attempt}: {sum(calls.values()):3d} tool calls "
+                  f"(+{1 if attempt == 'cold' else 0} list_tools), {elapsed:5.2f}s, "
+                  f"{len(commits)} commit(s), {uploaded} files uploaded, pr={url is not None}")
+            if uploaded != len(files) - args.unchanged:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+LLM scheduler under injected 429s.
+
+    python bench/bench_ratelimit.py --calls 40 --server-concurrency 3
+
+The mock rejects anything beyond `--server-concurrency` requests in flight
+(plus every `--every`-th request). The run passes when every call succeeds,
+the scheduler has backed its concurrency limit off, and a late high-priority
+call finishes before the queued bulk work.
+"""
+import argparse, os, sys, threading, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from mock_openai import MockOpenAI  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--calls", type=int, default=40)
+    ap.add_argument("--latency", type=float, default=0.1)
+    ap.add_argument("--server-concurrency", type=int, default=3)
+    ap.add_argument("--every", type=int, default=0)
+    ap.add_argument("--client-concurrency", type=int, default=12)
+    args = ap.parse_args()
+
+    mock = MockOpenAI(latency=args.latency, rate_limit_every=args.every,
+                      max_concurrent=args.server_concurrency, retry_after=0.2).start()
+    os.environ["OPENAI_BASE_URL"] = mock.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    os.environ["LLM_CACHE"] = "0"
+    os.environ["LLM_BACKOFF_BASE"] = "0.05"
+
+    import llm_scheduler
+    from utils import openai_chat, llm_map
+
+    sched = llm_scheduler.LLMScheduler(max_concurrency=args.client_concurrency)
+    llm_scheduler._scheduler = sched
+
+    errors = []
+
+    def bulk(i):
+        try:
+            return openai_chat("You map text to control frameworks.", f"bulk {i}", json_mode=True)
+        except Exception as e:  # counted, the run must not die
+            errors.append(e)
+
+    t0 = time.perf_counter()
+    worker = threading.Thread(target=lambda: llm_map(bulk, range(args.calls), args.client_concurrency))
+    worker.start()
+    time.sleep(args.latency * 3)
+    openai_chat("Create a one-page Markdown brief", "summary request",
+                priority=llm_scheduler.PRIORITY_INTERACTIVE)
+    worker.join()
+    elapsed = time.perf_counter() - t0
+    mock.stop()
+
+    st = sched.stats()
+    order = mock.completed
+    summary_pos = next(i for i, tag in enumerate(order) if tag.startswith("summary"))
+    print(f"calls ok         : {args.calls - len(errors)}/{args.calls} in {elapsed:.2f}s")
+    print(f"429s injected    : {mock.rate_limited}  (retries {st['retries']})")
+    print(f"concurrency limit: {args.client_concurrency} -> {st['concurrency_limit']}  "
+          f"(server max in flight {mock.max_in_flight})")
+    print(f"summary finished : #{summary_pos + 1} of {len(order)} completions")
+
+    if errors or summary_pos >= len(order) - 1:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Startup regression check for the CLI and API entry points.
+
+    python bench/bench_startup.py --repeat 5 --cli-budget-ms 600 --server-budget-ms 1500
+
+Each entry point is imported in a fresh interpreter under `-X importtime`
+(see app/startup.py), `--repeat` times. The check fails when the median
+process start exceeds its budget or when an entry point imports any of the
+heavy optional modules (openai, trafilatura, pdfplumber, fastmcp, ...),
+which only the code paths that use them should load.
+"""
+import argparse, statistics, sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from startup import ENTRY_POINTS, import_profile  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--cli-budget-ms", type=float, default=600)
+    ap.add_argument("--server-budget-ms", type=float, default=1500)
+    ap.add_argument("--top", type=int, default=5, help="Slowest packages to list per entry point")
+    args = ap.parse_args()
+    budgets = {"cli": args.cli_budget_ms, "server": args.server_budget_ms}
+
+    failed = False
+    for label, module in ENTRY_POINTS.items():
+        runs = [import_profile(module) for _ in range(max(1, args.repeat))]
+        process_ms = statistics.median(r["process_ms"] for r in runs)
+        import_ms = statistics.median(r["import_ms"] for r in runs)
+        heavy = sorted({m for r in runs for m in r["heavy_loaded"]})
+        over = process_ms > budgets[label]
+        failed |= over or bool(heavy)
+        print(f"{label:<7} process {process_ms:7.1f} ms (budget {budgets[label]:.0f})  "
+              f"imports {import_ms:7.1f} ms  heavy: {', '.join(heavy) or 'none'}"
+              + ("  OVER BUDGET" if over else ""))
+        for name, ms in runs[-1]["packages"][:args.top]:
+            print(f"  {name:<24} {ms:8.1f} ms")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Time to first summary token, buffered vs streamed, against a local mock of
+the chat completions endpoint.
+
+    python bench/bench_stream.py --latency 0.8 --token-delay 0.05
+
+The mock answers the brief request after `--latency` and then takes
+`--token-delay` per word. Buffered, nothing arrives until the last word;
+streamed, the first word arrives after `--latency`. Both must produce the
+same markdown.
+"""
+import argparse, os, sys, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from mock_openai import MockOpenAI  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--latency", type=float, default=0.8)
+    ap.add_argument("--token-delay", type=float, default=0.05)
+    args = ap.parse_args()
+
+    mock = MockOpenAI(latency=args.latency, token_delay=args.token_delay).start()
+    os.environ["OPENAI_BASE_URL"] = mock.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    # every call must reach the mock
+    os.environ["LLM_CACHE"] = "0"
+
+    from summarization import PROMPT
+    from utils import openai_chat
+
+    results = {}
+    for label, stream in (("buffered", False), ("streamed", True)):
+        first, pieces = [], []
+        t0 = time.perf_counter()
+
+        def on_token(text):
+            if text is None:
+                pieces.clear()
+                return
+            if not first:
+                first.append(time.perf_counter() - t0)
+            pieces.append(text)
+
+        md = openai_chat(system=PROMPT, user="DATE: 2025-01-01", on_token=on_token if stream else None)
+        total = time.perf_counter() - t0
+        results[label] = (first[0] if first else total, total, md, "".join(pieces) if stream else md)
+    mock.stop()
+
+    for label, (ttft, total, _, _) in results.items():
+        print(f"{label:<9}: first token {ttft:6.2f}s  complete {total:6.2f}s")
+    same = results["buffered"][2] == results["streamed"][2] == results["streamed"][3]
+    print(f"same markdown: {same}")
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
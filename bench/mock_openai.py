@@ -0,0 +1,148 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint.
+
+Answers POST /v1/chat/completions after a fixed latency with a canned body
+that fits whichever stage sent the request (relevance, mapping, summary).
+Point the client at it with OPENAI_BASE_URL=<url>/v1.
+
+With `token_delay`, a completion takes that long per word on top of
+`latency`; requests with "stream": true get the words as SSE chunks as
+they are "generated", so time to first token is just `latency`.
+
+Rate limiting can be injected: every `rate_limit_every`-th request, and any
+request beyond `max_concurrent` in flight, gets a 429 with `retry-after`.
+"""
+import json, re, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockOpenAI:
+    def __init__(self, latency: float = 0.2, rate_limit_every: int = 0, max_concurrent: int = 0,
+                 retry_after: float = 0.5, token_delay: float = 0.0):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.rate_limit_every = rate_limit_every
+        self.max_concurrent = max_concurrent
+        self.retry_after = retry_after
+        self.calls = 0
+        self.rate_limited = 0
+        self.completed = []  # request tags in completion order
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def start(self) -> "MockOpenAI":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def respond(self, body: dict) -> str:
+        """Message content for a request; override to script responses."""
+        system = body["messages"][0]["content"]
+        user = body["messages"][-1]["content"]
+        if "filtering regulatory text" in system:
+            return json.dumps({"kept_sections": [
+                {"title": f"Section {i}", "text": f"SBOM and CI/CD pipeline guidance part {i}. " + user[-200:]}
+                for i in range(3)
+            ]})
+        mapping = {"framework": "800-53", "control": "SA-15", "reason": "Development process"}
+        if "numbered sections" in system:
+            numbers = [int(n) for n in re.findall(r"=== SECTION (\d+) ===", user)]
+            return json.dumps({"results": [{"section": n, "mappings": [mapping]} for n in numbers]})
+        if "map text to control frameworks" in system:
+            return json.dumps({"mappings": [mapping]})
+        if "Summarize one source" in system:
+            return json.dumps({"updates": ["Mock update."], "takeaways": ["Mock takeaway."],
+                               "actions": [{"theme": "Build/CI", "action": "Mock action.", "controls": ["800-53 SA-15"]}]})
+        if body.get("response_format"):
+            return "{}"
+        return "# NIST SP 800 brief\n\n" + "".join(f"- Mock summary point {n}.\n" for n in range(1, 41))
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with mock._lock:
+                    mock.calls += 1
+                    limited = (mock.rate_limit_every and mock.calls % mock.rate_limit_every == 0) or \
+                        (mock.max_concurrent and mock._in_flight >= mock.max_concurrent)
+                    if limited:
+                        mock.rate_limited += 1
+                    else:
+                        mock._in_flight += 1
+                        mock.max_in_flight = max(mock.max_in_flight, mock._in_flight)
+                if limited:
+                    return self._send(429, json.dumps({"error": {
+                        "message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded",
+                    }}).encode("utf-8"), {"retry-after": str(mock.retry_after)})
+                try:
+                    time.sleep(mock.latency)
+                    content = mock.respond(body)
+                    words = re.findall(r"\S+\s*", content) or [content]
+                    if body.get("stream"):
+                        return self._stream(body, words)
+                    time.sleep(mock.token_delay * len(words))
+                finally:
+                    with mock._lock:
+                        mock._in_flight -= 1
+                        mock.completed.append(body["messages"][-1]["content"][:40])
+                payload = json.dumps({
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}],
+                    "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+                }).encode("utf-8")
+                self._send(200, payload)
+
+            def _stream(self, body: dict, words: list):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                base = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": body.get("model", "mock")}
+                chunks = [{**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": w},
+                                                "finish_reason": None}]} for w in words]
+                chunks.append({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                chunks.append({**base, "choices": [],
+                               "usage": {"prompt_tokens": 100, "completion_tokens": len(words),
+                                         "total_tokens": 100 + len(words)}})
+                for n, chunk in enumerate(chunks):
+                    if n and n < len(words):
+                        time.sleep(mock.token_delay)
+                    self._chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self._chunk(b"data: [DONE]\n\n")
+                self._chunk(b"")
+
+            def _chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _send(self, status: int, payload: bytes, headers: dict = None):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
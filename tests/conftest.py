@@ -0,0 +1,8 @@
+import os, sys, tempfile
+from pathlib import Path
+
+# The app's modules import each other by bare name, as when run from app/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+# Read at import time; keep every default path out of the working tree
+os.environ.setdefault("ARTIFACTS_DIR", tempfile.mkdtemp(prefix="nist-agent-tests-"))
@@ -0,0 +1,43 @@
+import os
+
+from artifacts import ArtifactStore
+
+
+def test_editing_an_exported_file_leaves_the_store_intact(tmp_path):
+    store = ArtifactStore(tmp_path / "store")
+    sha = store.put("# Brief\n\noriginal\n")
+    out = store.export(sha, tmp_path / "docs" / "summaries" / "brief.md")
+    assert out.stat().st_nlink == 1
+    assert os.access(out, os.W_OK)
+
+    # in place, as sed -i on some platforms or an editor's force-write does
+    with open(out, "r+", encoding="utf-8") as f:
+        f.write("# Edited")
+
+    assert store.read(sha) == "# Brief\n\noriginal\n"
+    assert store.put("# Brief\n\noriginal\n") == sha
+    assert store.stats()["blobs_reused"] == 1
+
+
+def test_export_skips_unchanged_files(tmp_path):
+    store = ArtifactStore(tmp_path / "store")
+    sha = store.put("same text")
+    dest = tmp_path / "sources" / "src01.md"
+    store.export(sha, dest)
+    mtime = dest.stat().st_mtime_ns
+    store.export(sha, dest)
+    assert dest.stat().st_mtime_ns == mtime
+    assert store.stats()["exports_unchanged"] == 1
+
+
+def test_put_rewrites_a_blob_changed_through_a_link(tmp_path):
+    store = ArtifactStore(tmp_path / "store")
+    sha = store.put("linked text")
+    linked = store.link(sha, tmp_path / "run" / "sources" / "src01.md")
+    os.chmod(linked, 0o644)
+    linked.write_text("tampered", encoding="utf-8")
+    assert store.read(sha) == "tampered"
+
+    assert store.put("linked text") == sha
+    assert store.read(sha) == "linked text"
+    assert store.stats()["blobs_repaired"] == 1
@@ -0,0 +1,32 @@
+import gzip
+
+from checkpoints import RunCheckpoints, find_run
+
+
+def test_stage_round_trip_and_completed(tmp_path):
+    cp = RunCheckpoints(tmp_path / "run1")
+    cp.save("discover", {"sources": [{"id": "src01"}]})
+    cp.save("extract", {"extracted": []})
+    assert cp.load("discover") == {"sources": [{"id": "src01"}]}
+    assert cp.completed() == ["discover", "extract"]
+    assert not cp.has("mapping")
+
+
+def test_torn_checkpoint_is_redone(tmp_path):
+    cp = RunCheckpoints(tmp_path / "run1")
+    cp.save("mapping", {"mapped": [1, 2, 3]})
+    path = cp.dir / "mapping.json.gz"
+    path.write_bytes(gzip.compress(b'{"mapped": [1, 2')[:-4])
+    assert cp.load("mapping") is None
+
+
+def test_params_round_trip(tmp_path):
+    cp = RunCheckpoints(tmp_path / "run1")
+    cp.save_params({"topic": "SSDF", "limit": 3})
+    params = cp.load_params()
+    assert (params["topic"], params["limit"]) == ("SSDF", 3)
+
+
+def test_find_run_rejects_unknown_and_unsafe_ids():
+    assert find_run("../etc") is None
+    assert find_run("nosuchrun") is None
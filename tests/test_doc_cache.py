@@ -0,0 +1,50 @@
+import functools, http.server, threading
+
+import pytest
+
+from doc_cache import DocumentCache
+from fetching import FetchEngine
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path):
+    site = tmp_path / "site"
+    site.mkdir()
+    (site / "small").write_bytes(b"s" * 300)
+    (site / "other").write_bytes(b"o" * 300)
+    (site / "big").write_bytes(b"b" * 5000)
+    srv = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_QuietHandler, directory=str(site)))
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+
+
+def test_second_fetch_is_served_from_cache(tmp_path, server):
+    cache = DocumentCache(tmp_path / "docs")
+    engine = FetchEngine()
+    with cache.open(server + "/small", engine) as doc:
+        assert doc.status == "miss"
+    with cache.open(server + "/small", engine) as doc:
+        assert doc.status == "fresh"
+        assert doc.read_bytes() == b"s" * 300
+
+
+def test_bodies_in_use_are_not_evicted(tmp_path, server):
+    cache = DocumentCache(tmp_path / "docs", max_bytes=1000)
+    engine = FetchEngine()
+    with cache.open(server + "/small", engine) as small:
+        # another thread's download pushes the cache over its cap
+        with cache.open(server + "/big", engine) as big:
+            assert small.path.exists() and big.path.exists()
+            assert cache.stats()["evicted"] == 0
+    assert not cache._pins
+
+    with cache.open(server + "/other", engine):
+        pass
+    assert not small.path.exists() and not big.path.exists()
+    assert cache.stats()["evicted"] == 2
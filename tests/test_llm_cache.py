@@ -0,0 +1,37 @@
+from types import SimpleNamespace
+
+import llm_cache
+import utils
+from llm_cache import LLMCache
+
+
+def _fake_completions(monkeypatch, replies):
+    calls = []
+
+    def complete(system, user, json_mode, on_token=None):
+        calls.append(user)
+        content = replies[min(len(calls), len(replies)) - 1]
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+    monkeypatch.setattr(utils, "_chat_completion", complete)
+    return calls
+
+
+def test_repeated_prompt_is_served_from_cache(tmp_path, monkeypatch):
+    cache = LLMCache(tmp_path / "llm.sqlite3")
+    monkeypatch.setattr(llm_cache, "get_llm_cache", lambda: cache)
+    calls = _fake_completions(monkeypatch, ['{"kept_sections": []}'])
+
+    assert utils.openai_chat("sys", "doc", json_mode=True) == {"kept_sections": []}
+    assert utils.openai_chat("sys", "doc", json_mode=True) == {"kept_sections": []}
+    assert len(calls) == 1
+
+
+def test_malformed_json_is_not_cached(tmp_path, monkeypatch):
+    cache = LLMCache(tmp_path / "llm.sqlite3")
+    monkeypatch.setattr(llm_cache, "get_llm_cache", lambda: cache)
+    calls = _fake_completions(monkeypatch, ['{"kept_sections": [', '{"kept_sections": []}'])
+
+    assert utils.openai_chat("sys", "doc", json_mode=True) == {}
+    assert utils.openai_chat("sys", "doc", json_mode=True) == {"kept_sections": []}
+    assert len(calls) == 2
@@ -0,0 +1,43 @@
+import relevance
+from matcher import TermMatcher, literal_pattern
+
+DOC = """# Intro
+
+General policy text.
+
+## Build pipeline
+
+Generate an SBOM for every release and sign the artifacts in CI/CD.
+
+## Staffing
+
+Personnel only.
+"""
+
+
+def test_matcher_attributes_hits_to_terms_and_sections():
+    m = TermMatcher([("SBOM", literal_pattern("SBOM")), ("CI/CD", literal_pattern("CI/CD"))],
+                    [("personnel only", literal_pattern("personnel only"))])
+    scan = m.scan(DOC)
+    assert scan.include_hits == {"SBOM": 1, "CI/CD": 1}
+    assert scan.exclude_hits == {"personnel only": 1}
+    assert [s["hits"] for s in scan.sections] == [0, 2, 0]
+
+
+def test_gate_decisions():
+    m = TermMatcher([(t, literal_pattern(t)) for t in ("SBOM", "CI/CD", "artifacts")])
+    assert relevance._gate(m.scan("nothing relevant")) == "skip"
+    assert relevance._gate(m.scan("an SBOM")) == "cheap"
+    assert relevance._gate(m.scan("SBOM, CI/CD and artifacts")) == "full"
+
+
+def test_documents_without_terms_cost_no_llm_call(monkeypatch):
+    asked = []
+    monkeypatch.setattr(relevance, "_ask_llm", lambda user: asked.append(user) or {"kept_sections": []})
+    docs = [{"id": "src01", "title": "Minutes", "url": "u1", "markdown": "# Minutes\n\nLunch was served."},
+            {"id": "src02", "title": "Guide", "url": "u2", "markdown": DOC}]
+    stats = {}
+    relevance.filter_relevant(docs, stats=stats)
+    assert stats["skip"] == 1
+    assert stats["llm_calls"] == len(asked) == 1
+    assert "Lunch" not in asked[0]
@@ -0,0 +1,47 @@
+from search import SearchIndex, fts_query
+
+SOURCE = """# Guidance
+
+## Vulnerability scanning
+
+RA-5 scanning of build images before release.
+
+## Account management
+
+Review of service accounts every quarter.
+"""
+
+
+def _index(tmp_path):
+    index = SearchIndex(tmp_path / "search.sqlite3")
+    item = {"id": "src01", "url": "https://example.org/a", "title": "A", "markdown": SOURCE}
+    mapped = {"id": "src01", "kept_sections": [
+        {"title": "Vulnerability scanning", "text": "RA-5 scanning of build images before release.",
+         "mappings": [{"framework": "800-53", "control": "AC-2"}]},
+    ]}
+    index.add_run("run1", "2025-01-01", [item], [mapped])
+    return index
+
+
+def test_fts_query_quotes_terms():
+    assert fts_query('sbom* "supply chain" OR x-y') == '"sbom"* "supply chain" OR "x-y"'
+
+
+def test_control_filter_covers_every_term(tmp_path):
+    index = _index(tmp_path)
+    # the body says RA-5, the section is mapped to 800-53 AC-2
+    assert index.search("scanning", control="800-53 RA-5") == []
+    hits = index.search("scanning", control="800-53 AC-2")
+    assert [h["section"] for h in hits] == ["Vulnerability scanning"]
+    assert hits[0]["controls"] == ["800-53 AC-2"]
+
+
+def test_unchanged_document_is_indexed_once(tmp_path):
+    index = _index(tmp_path)
+    item = {"id": "src07", "url": "https://example.org/a", "title": "A", "markdown": SOURCE}
+    counts = index.add_run("run2", "2025-02-01", [item], [])
+    assert counts["documents_indexed"] == 1  # controls changed (none mapped this time)
+    counts = index.add_run("run3", "2025-03-01", [item], [])
+    assert counts["documents_reused"] == 1
+    hits = index.search("quarter", since="2025-03-01")
+    assert [r["run_id"] for r in hits[0]["runs"]] == ["run3", "run2", "run1"]
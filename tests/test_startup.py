@@ -0,0 +1,20 @@
+import pytest
+
+from startup import ENTRY_POINTS, HEAVY_MODULES, import_profile
+
+# Far above a normal start (about 0.2 s for the CLI, 0.5 s for the server), so only a regression trips them
+CEILING_MS = {"main": 3000, "orchestrator": 3000, "workers": 3000, "server": 6000}
+
+
+@pytest.mark.parametrize("module", sorted({"main", "workers", *ENTRY_POINTS.values()}))
+def test_entry_point_imports_stay_light(module):
+    profile = import_profile(module)
+    assert profile["heavy_loaded"] == [], f"{module} imports {profile['heavy_loaded']} at startup"
+    assert profile["process_ms"] < CEILING_MS[module]
+
+
+def test_heavy_modules_are_detected():
+    # guards the test above against a profile that never reports anything
+    profile = import_profile("json, pdfplumber")
+    assert "pdfplumber" in profile["heavy_loaded"]
+    assert set(profile["heavy_loaded"]) <= set(HEAVY_MODULES)
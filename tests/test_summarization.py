@@ -0,0 +1,41 @@
+import summarization
+from state import StateIndex
+
+
+def _mapped(source_id):
+    return [{"id": source_id, "title": "SP 800-218", "url": "https://example.org/ssdf", "published": "2024-01-01",
+             "kept_sections": [{"title": "PW.4", "text": "Reuse well-secured software.",
+                                "mappings": [{"framework": "SSDF", "control": "PW.4"}]}]}]
+
+
+def _fake_llm(monkeypatch, source_replies):
+    calls = []
+
+    def summarize(user):
+        calls.append(user)
+        return source_replies[min(len(calls), len(source_replies)) - 1]
+
+    monkeypatch.setattr(summarization, "_summarize_source", summarize)
+    monkeypatch.setattr(summarization, "openai_chat", lambda **kw: "# Brief")
+    return calls
+
+
+def test_source_summary_survives_renumbering(tmp_path, monkeypatch):
+    state = StateIndex(tmp_path / "state.sqlite3")
+    calls = _fake_llm(monkeypatch, [{"updates": ["v1.1"], "takeaways": [], "actions": []}])
+
+    summarization.build_summary(_mapped("src01"), "2025-01-01", state)
+    _, _, meta = summarization.build_summary(_mapped("src04"), "2025-01-02", state)
+    assert meta["summarization"]["reused_summaries"] == 1
+    assert len(calls) == 1
+
+
+def test_empty_source_summary_is_not_stored(tmp_path, monkeypatch):
+    state = StateIndex(tmp_path / "state.sqlite3")
+    calls = _fake_llm(monkeypatch, [{"updates": [], "takeaways": [], "actions": []},
+                                    {"updates": ["v1.1"], "takeaways": [], "actions": []}])
+
+    summarization.build_summary(_mapped("src01"), "2025-01-01", state)
+    _, _, meta = summarization.build_summary(_mapped("src01"), "2025-01-02", state)
+    assert meta["summarization"]["source_calls"] == 1
+    assert len(calls) == 2
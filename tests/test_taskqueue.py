@@ -0,0 +1,48 @@
+import time
+
+from taskqueue import TaskQueue
+
+
+def _queue(tmp_path, **kw):
+    return TaskQueue(tmp_path / "tasks.sqlite3", **kw)
+
+
+def test_deeper_stages_are_claimed_first_and_enqueue_is_idempotent(tmp_path):
+    q = _queue(tmp_path)
+    q.enqueue("r1", [("extract", "src01", 0, {}), ("mapping", "src02", 2, {})])
+    q.enqueue("r1", [("extract", "src01", 0, {"ignored": True})])
+    assert q.counts("r1") == {"pending": 2}
+    assert q.claim("r1", "w1").kind == "mapping"
+    task = q.claim("r1", "w1")
+    assert (task.kind, task.payload) == ("extract", {})
+
+
+def test_complete_stores_result_and_follow_up_atomically(tmp_path):
+    q = _queue(tmp_path)
+    q.enqueue("r1", [("extract", "src01", 0, {})])
+    task = q.claim("r1", "w1")
+    assert not q.complete(task, "someone-else", {"item": 1})
+    assert q.complete(task, "w1", {"item": 1}, [("relevance", "src01", 1, {})])
+    assert q.result("r1", "extract", "src01") == {"item": 1}
+    assert q.claim("r1", "w1").kind == "relevance"
+
+
+def test_expired_lease_is_claimed_again_until_attempts_run_out(tmp_path):
+    q = _queue(tmp_path, lease_seconds=0.01, max_attempts=2)
+    q.enqueue("r1", [("extract", "src01", 0, {})])
+    assert q.claim("r1", "dead-1").attempts == 1
+    time.sleep(0.02)
+    assert q.claim("r1", "dead-2").attempts == 2
+    time.sleep(0.02)
+    assert q.claim("r1", "w3") is None
+    assert q.failures("r1")[0][2] == "lease expired: worker lost"
+    assert q.retry_failed("r1") == 1
+    assert q.claim("r1", "w3").attempts == 1
+
+
+def test_failed_task_backs_off_then_fails_the_run(tmp_path):
+    q = _queue(tmp_path, max_attempts=2)
+    q.enqueue("r1", [("extract", "src01", 0, {})])
+    q.fail(q.claim("r1", "w1"), "w1", "boom")
+    assert q.claim("r1", "w1") is None  # backing off
+    assert q.open_tasks("r1") == 1